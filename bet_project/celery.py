@@ -71,6 +71,26 @@ app.conf.beat_schedule = {
         'schedule': crontab(minute='30'),  # Cada hora en el minuto 30
     },
 
+    # ============================================================
+    # CHAT
+    # ============================================================
+
+    # Guardar en MySQL los mensajes del chat ya difundidos (write-behind)
+    'flush-chat-messages': {
+        'task': 'flush_chat_messages',
+        'schedule': 5.0,  # Cada 5 segundos (tambien se dispara al llenarse un lote)
+    },
+
+    # ============================================================
+    # NOTIFICACIONES
+    # ============================================================
+
+    # Recordatorios de partidos que empiezan en las próximas 12 horas
+    'generate-match-reminders': {
+        'task': 'generate_match_reminders',
+        'schedule': crontab(minute='*/15'),  # Cada 15 minutos
+    },
+
     # ============================================================
     # MANTENIMIENTO
     # ============================================================
@@ -90,4 +110,14 @@ app.conf.beat_schedule = {
         'task': 'send_daily_match_reminders',
         'schedule': crontab(hour='8', minute='30'),  # 08:30 AM Colombia (America/Bogota)
     },
+
+    # ============================================================
+    # MUNDIAL 2026
+    # ============================================================
+
+    # Proyecciones Monte Carlo del juego de predicciones (no hace nada si no hubo cambios)
+    'simulate-worldcup-projections': {
+        'task': 'simulate_worldcup_projections',
+        'schedule': crontab(minute='*/30'),  # Cada 30 minutos
+    },
 }
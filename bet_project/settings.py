@@ -65,7 +65,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'bets.authentication.CachedTokenAuthentication',
     ],
     # Basic API rate limiting: protects auth endpoints from abuse without
     # affecting normal app usage (rates are intentionally generous).
@@ -158,6 +158,10 @@ CACHES = {
     }
 }
 
+# Cliente Redis directo (bets/redis_client.py) para estructuras que la cache
+# de Django no expone: listas (historial del chat), contadores, sorted sets
+REDIS_URL = f'redis://{os.environ.get("REDIS_HOST", "localhost")}:6379/3'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -225,6 +229,13 @@ EMAIL_SSL_KEYFILE = None
 EMAIL_VERIFICATION_EXPIRATION_HOURS = 24
 PASSWORD_RESET_EXPIRATION_HOURS = 1
 
+# Envio masivo (tasks.dispatch_bulk_email): destinatarios por lote/conexion SMTP y reintentos
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', '50'))
+EMAIL_MAX_RETRIES = 3
+
+# Chat: mensajes pendientes de guardar en MySQL por lote (bets/chat_buffer.py)
+CHAT_FLUSH_BATCH_SIZE = int(os.environ.get('CHAT_FLUSH_BATCH_SIZE', '200'))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -265,3 +276,10 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'America/Bogota'  # UTC-5, Colombia (no DST)
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutos máximo por tarea
+
+# ============================================================
+# MUNDIAL 2026 - PROYECCIONES (bets/worldcup_simulation.py)
+# ============================================================
+WORLDCUP_SIMULATIONS = int(os.environ.get('WORLDCUP_SIMULATIONS', '10000'))
+# Fuerza relativa por nombre de equipo (ApiEquipo.nombre); los que no aparecen valen 1.0
+WORLDCUP_TEAM_STRENGTH = {}
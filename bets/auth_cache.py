@@ -0,0 +1,212 @@
+"""
+Cache de autenticacion compartida (HTTP y WebSockets).
+
+- `auth_token:{key}`: una sola entrada por token con los campos del User y
+  de su `perfil` Usuario que usa la autenticacion, y la hora de expiracion
+  (TOKEN_EXPIRATION_HOURS), o la marca de que no existe / ya expiro. La
+  expiracion se verifica en cada lectura, no depende del TTL. No se guardan
+  contraseñas: el resto de los campos quedan diferidos (se leen de la BD
+  solo si alguien los usa).
+- `auth_miembro:{usuario}:{sala}`: si el usuario pertenece a la sala.
+
+Delante de Redis hay una LRU por proceso con TTL corto (LOCAL_TTL): un
+request autenticado tipico (middleware + CachedTokenAuthentication) no hace
+queries y un solo GET a Redis, el de la generacion de revocacion. Cada
+lectura arma su propio User, asi los requests no comparten objetos.
+
+Invalidacion: logout y el borrado de tokens (signals.py) borran la entrada
+del token; guardar un User o su Usuario borra la de su token; crear o
+borrar un UsuarioSala (unirse, salir) borra la membresia. Ademas cambian
+`auth_revocacion`, una generacion global que cada proceso compara antes de
+usar su LRU: una entrada guardada con otra generacion no se usa, asi un
+logout o un usuario desactivado rigen en todos los workers al instante.
+Los TTL de Redis son solo un respaldo.
+
+La usan TokenExpirationMiddleware, bets.authentication y los consumers de
+WebSocket, para que una ola de reconexiones (ej. despues de un deploy) no
+llegue a MySQL.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authtoken.models import Token
+
+from .models import Usuario, UsuarioSala
+
+TOKEN_PREFIX = 'auth_token:'
+MIEMBRO_PREFIX = 'auth_miembro:'
+CACHE_TTL = 300
+INVALIDO_TTL = 60  # Tokens inexistentes: evita repetir la query en cada intento
+REVOCACION_KEY = 'auth_revocacion'
+LOCAL_TTL = 15
+LOCAL_MAX = 2048
+
+INVALIDO = 'invalid'
+EXPIRADO = 'expired'
+
+# Campos cacheados, en el orden de los campos del modelo (Model.from_db)
+USER_CAMPOS = tuple(
+    f.attname for f in User._meta.concrete_fields
+    if f.attname in ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+)
+PERFIL_CAMPOS = tuple(f.attname for f in Usuario._meta.concrete_fields if f.attname != 'contrasena')
+
+_local = OrderedDict()  # key -> (vence_en, generacion, pickle de la entrada)
+_local_lock = threading.Lock()
+
+
+def _token_key(key):
+    return f'{TOKEN_PREFIX}{key}'
+
+
+def _miembro_key(usuario_id, sala_id):
+    return f'{MIEMBRO_PREFIX}{usuario_id}:{sala_id}'
+
+
+def _expiracion():
+    return timedelta(hours=getattr(settings, 'TOKEN_EXPIRATION_HOURS', 24))
+
+
+def _generacion():
+    """Generacion de revocacion actual (basada en el reloj, como response_cache)"""
+    generacion = cache.get(REVOCACION_KEY)
+    if generacion is None:
+        cache.add(REVOCACION_KEY, time.time_ns(), None)
+        generacion = cache.get(REVOCACION_KEY)
+    return generacion
+
+
+def _revocar():
+    """Las LRU locales de todos los procesos dejan de valer"""
+    cache.set(REVOCACION_KEY, time.time_ns(), None)
+
+
+def _local_get(key, generacion):
+    with _local_lock:
+        item = _local.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic() or item[1] != generacion:
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return item[2]
+
+
+def _local_set(key, generacion, crudo):
+    with _local_lock:
+        _local[key] = (time.monotonic() + LOCAL_TTL, generacion, crudo)
+        _local.move_to_end(key)
+        if len(_local) > LOCAL_MAX:
+            _local.popitem(last=False)
+
+
+def _cargar(key):
+    """Entrada del token desde la BD: {'user', 'perfil', 'expira'} o INVALIDO"""
+    try:
+        token = Token.objects.select_related('user__perfil').get(key=key)
+    except Token.DoesNotExist:
+        return INVALIDO
+    perfil = getattr(token.user, 'perfil', None)
+    return {
+        'user': tuple(getattr(token.user, c) for c in USER_CAMPOS),
+        'perfil': tuple(getattr(perfil, c) for c in PERFIL_CAMPOS) if perfil else None,
+        'expira': (token.created + _expiracion()).timestamp(),
+    }
+
+
+def _armar_usuario(entrada):
+    """User (con `perfil` ya asignado) a partir de los campos cacheados"""
+    user = User.from_db(DEFAULT_DB_ALIAS, USER_CAMPOS, entrada['user'])
+    perfil = None
+    if entrada['perfil'] is not None:
+        perfil = Usuario.from_db(DEFAULT_DB_ALIAS, PERFIL_CAMPOS, entrada['perfil'])
+        Usuario.user.field.set_cached_value(perfil, user)
+    User.perfil.related.set_cached_value(user, perfil)
+    return user
+
+
+def _entrada(key):
+    # Antes que la entrada: una revocacion en el medio deja la generacion vieja
+    generacion = _generacion()
+    crudo = _local_get(key, generacion)
+    if crudo is None:
+        clave = _token_key(key)
+        crudo = cache.get(clave)
+        if crudo is None:
+            entrada = _cargar(key)
+            crudo = pickle.dumps(entrada, pickle.HIGHEST_PROTOCOL)
+            if entrada == INVALIDO:
+                ttl = INVALIDO_TTL
+            else:
+                ttl = max(1, min(CACHE_TTL, int(entrada['expira'] - time.time())))
+            cache.set(clave, crudo, ttl)
+        _local_set(key, generacion, crudo)
+    return pickle.loads(crudo)
+
+
+def estado_token(key):
+    """
+    {'user', 'expira'} si el token es valido (`user` armado desde la cache,
+    con user.perfil ya cargado); EXPIRADO si expiro (y se borra); INVALIDO
+    si no existe.
+    """
+    if not key:
+        return INVALIDO
+    entrada = _entrada(key)
+    if entrada in (INVALIDO, EXPIRADO):
+        return entrada
+    if time.time() >= entrada['expira']:
+        # Los otros procesos ven la misma hora de expiracion: no hace falta revocar
+        Token.objects.filter(key=key).delete()
+        cache.set(_token_key(key), pickle.dumps(EXPIRADO), INVALIDO_TTL)
+        with _local_lock:
+            _local.pop(key, None)
+        return EXPIRADO
+    return {'user': _armar_usuario(entrada), 'expira': entrada['expira']}
+
+
+def usuario_por_token(key):
+    """Perfil Usuario del token si es valido, si no None"""
+    estado = estado_token(key)
+    if estado in (INVALIDO, EXPIRADO):
+        return None
+    return getattr(estado['user'], 'perfil', None)
+
+
+def es_miembro(usuario_id, sala_id):
+    clave = _miembro_key(usuario_id, sala_id)
+    miembro = cache.get(clave)
+    if miembro is None:
+        miembro = UsuarioSala.objects.filter(id_usuario_id=usuario_id, id_sala_id=sala_id).exists()
+        cache.set(clave, miembro, CACHE_TTL)
+    return miembro
+
+
+def invalidar_token(key):
+    cache.delete(_token_key(key))
+    _revocar()
+    with _local_lock:
+        _local.pop(key, None)
+
+
+def invalidar_usuario(user_id):
+    """El User o su perfil cambiaron: se recarga la entrada de su token"""
+    keys = list(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+    if keys:
+        cache.delete_many([_token_key(key) for key in keys])
+        _revocar()
+        with _local_lock:
+            for key in keys:
+                _local.pop(key, None)
+
+
+def invalidar_membresia(usuario_id, sala_id):
+    cache.delete(_miembro_key(usuario_id, sala_id))
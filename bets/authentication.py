@@ -0,0 +1,25 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import auth_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication que resuelve el token desde auth_cache en lugar de
+    la BD: valida la expiracion y devuelve el User con su `perfil` ya
+    cargado, sin queries (request.user.perfil incluido).
+    """
+
+    def authenticate_credentials(self, key):
+        estado = auth_cache.estado_token(key)
+        if estado == auth_cache.INVALIDO:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if estado == auth_cache.EXPIRADO:
+            raise exceptions.AuthenticationFailed(_('Token expirado'), code='token_expired')
+
+        user = estado['user']
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (user, key)
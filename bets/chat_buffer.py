@@ -0,0 +1,239 @@
+"""
+Escritura diferida (write-behind) de los mensajes del chat.
+
+El mensaje se difunde apenas llega: `encolar()` le asigna un id con INCR en
+Redis (`chat:next_id`), lo agrega al historial (chat_history) y lo deja en
+la lista `chat:pendientes`. La tarea flush_chat_messages lo guarda en MySQL
+en lotes con `bulk_create`, cada pocos segundos o cuando la lista llega a
+CHAT_FLUSH_BATCH_SIZE.
+
+Ids: el contador arranca en el maximo id_mensaje de la BD y TODO mensaje
+nuevo (WebSocket o REST) debe tomar su id de `nuevo_id()`; si no, el
+AUTO_INCREMENT de MySQL podria repetir un id todavia pendiente.
+
+El flush usa un lock (cache.add) para que dos workers no tomen el mismo
+lote. Cada lote se mueve atomicamente (LMOVE) a `chat:procesando`, se
+inserta con ignore_conflicts y cada mensaje se quita de ahi (LREM por valor)
+solo despues de comprobar que su fila quedo en la BD; si un flush se corta,
+el siguiente retoma `chat:procesando` sin duplicar ni perder nada, aunque el
+lock haya expirado con el primero todavia corriendo. Si el id de un mensaje
+ya lo tomo otra fila (un INSERT que no paso por `nuevo_id()`, ej. el admin),
+se guarda con un id nuevo, se avisa en el log y se invalida el historial de
+la sala. Los mensajes cuya sala o usuario se borro mientras esperaban se
+descartan (log + `chat:descartados`) en lugar de hacer fallar el lote.
+
+Tambien vive aqui el limite de la notificacion de chat (una por sala cada
+15 minutos), como una clave con SET NX EX en lugar de una query.
+"""
+import json
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+
+from . import chat_history
+from .models import MensajeChat, Sala, Usuario
+from .redis_client import get_client
+
+logger = logging.getLogger(__name__)
+
+ID_KEY = 'chat:next_id'
+PENDIENTES_KEY = 'chat:pendientes'
+PROCESANDO_KEY = 'chat:procesando'
+DESCARTADOS_KEY = 'chat:descartados'
+DESCARTADOS_MAX = 1000
+DESCARTADOS_TTL = 60 * 60 * 24 * 7
+FLUSH_LOCK = 'chat:flush_lock'
+FLUSH_LOCK_TTL = 60
+NOTIF_PREFIX = 'chat:notificado:'
+NOTIF_INTERVALO = 15 * 60
+
+
+def nuevo_id():
+    """Id para un MensajeChat nuevo (unico aunque todavia no este en la BD)"""
+    client = get_client()
+    if not client.exists(ID_KEY):
+        maximo = MensajeChat.objects.aggregate(m=Max('id_mensaje'))['m'] or 0
+        client.set(ID_KEY, maximo, nx=True)
+    return client.incr(ID_KEY)
+
+
+def encolar(sala_id, usuario, contenido):
+    """
+    Registra un mensaje nuevo sin tocar MySQL. Devuelve el mensaje
+    serializado (formato de chat_history) y si hay que disparar un flush.
+    """
+    fecha = timezone.now()
+    data = {
+        'id_mensaje': nuevo_id(),
+        'contenido': contenido,
+        'fecha_envio': fecha.isoformat(),
+        'usuario': {
+            'id_usuario': usuario.id_usuario,
+            'nombre_usuario': usuario.nombre_usuario,
+            'foto_perfil': usuario.foto_perfil,
+        }
+    }
+    pendiente = json.dumps({
+        'id': data['id_mensaje'],
+        'sala': int(sala_id),
+        'usuario': usuario.id_usuario,
+        'contenido': contenido,
+        'fecha': data['fecha_envio'],
+    })
+    # Pendiente e historial en la misma transaccion: una reconstruccion del
+    # historial ve el mensaje en uno de los dos (ver chat_history)
+    pipe = get_client().pipeline(transaction=True)
+    pipe.rpush(PENDIENTES_KEY, pendiente)
+    chat_history.agregar(sala_id, data, pipe)
+    largo = pipe.execute()[0]
+    return data, largo >= settings.CHAT_FLUSH_BATCH_SIZE
+
+
+def pendientes(sala_id):
+    """Mensajes de la sala que todavia no estan en la BD (formato de chat_history)"""
+    sala_id = int(sala_id)
+    # Mismo orden que recorre un mensaje: pendientes -> procesando -> BD
+    pipe = get_client().pipeline(transaction=True)
+    pipe.lrange(PENDIENTES_KEY, 0, -1)
+    pipe.lrange(PROCESANDO_KEY, 0, -1)
+    en_cola, en_proceso = pipe.execute()
+    filas = [m for m in (json.loads(c) for c in en_cola + en_proceso) if m['sala'] == sala_id]
+    if not filas:
+        return []
+    usuarios = Usuario.objects.in_bulk({m['usuario'] for m in filas})
+    data = []
+    for m in filas:
+        usuario = usuarios.get(m['usuario'])
+        data.append({
+            'id_mensaje': m['id'],
+            'contenido': m['contenido'],
+            'fecha_envio': m['fecha'],
+            'usuario': {
+                'id_usuario': m['usuario'],
+                'nombre_usuario': usuario.nombre_usuario if usuario else None,
+                'foto_perfil': usuario.foto_perfil if usuario else None,
+            }
+        })
+    return data
+
+
+def _tomar_lote(client, batch_size):
+    """Lote a guardar: lo que quedo en chat:procesando o un lote nuevo movido ahi"""
+    crudos = client.lrange(PROCESANDO_KEY, 0, batch_size - 1)
+    if crudos:
+        return crudos
+    pipe = client.pipeline(transaction=False)
+    for _ in range(batch_size):
+        pipe.lmove(PENDIENTES_KEY, PROCESANDO_KEY, 'LEFT', 'RIGHT')
+    return [c for c in pipe.execute() if c is not None]
+
+
+def _descartar_huerfanos(mensajes):
+    """
+    Quita los mensajes cuya sala o usuario ya no existen (se borraron con el
+    mensaje pendiente): su INSERT fallaria por la foreign key y trabaria la
+    cola. Se guardan en DESCARTADOS_KEY para revisarlos.
+    """
+    salas = set(Sala.objects.filter(
+        id_sala__in={m.id_sala_id for m in mensajes}).values_list('id_sala', flat=True))
+    usuarios = set(Usuario.objects.filter(
+        id_usuario__in={m.id_usuario_id for m in mensajes}).values_list('id_usuario', flat=True))
+    validos, huerfanos = [], []
+    for m in mensajes:
+        (validos if m.id_sala_id in salas and m.id_usuario_id in usuarios else huerfanos).append(m)
+    if huerfanos:
+        logger.warning(
+            f'Chat flush: {len(huerfanos)} mensajes sin sala o usuario '
+            f'{[m.id_mensaje for m in huerfanos]}; se descartan'
+        )
+        pipe = get_client().pipeline(transaction=True)
+        pipe.rpush(DESCARTADOS_KEY, *(json.dumps({
+            'id': m.id_mensaje, 'sala': m.id_sala_id, 'usuario': m.id_usuario_id,
+            'contenido': m.contenido, 'fecha': m.fecha_envio.isoformat(),
+        }) for m in huerfanos))
+        pipe.ltrim(DESCARTADOS_KEY, -DESCARTADOS_MAX, -1)
+        pipe.expire(DESCARTADOS_KEY, DESCARTADOS_TTL)
+        pipe.execute()
+    return validos
+
+
+def _guardar(crudos):
+    """
+    Inserta el lote; los mensajes cuyo id ya estaba ocupado se guardan con
+    otro y los huerfanos se descartan.
+    """
+    mensajes = []
+    for crudo in crudos:
+        m = json.loads(crudo)
+        mensajes.append(MensajeChat(
+            id_mensaje=m['id'],
+            id_sala_id=m['sala'],
+            id_usuario_id=m['usuario'],
+            contenido=m['contenido'],
+            fecha_envio=datetime.fromisoformat(m['fecha']),
+        ))
+    mensajes = _descartar_huerfanos(mensajes)
+    if not mensajes:
+        return
+    MensajeChat.objects.bulk_create(mensajes, ignore_conflicts=True)
+
+    # ignore_conflicts no dice que filas se omitieron: se comprueba cada id
+    guardados = {
+        fila[0]: fila[1:] for fila in MensajeChat.objects.filter(
+            id_mensaje__in=[m.id_mensaje for m in mensajes]
+        ).values_list('id_mensaje', 'id_sala_id', 'id_usuario_id', 'fecha_envio')
+    }
+    perdidos = [m for m in mensajes
+                if guardados.get(m.id_mensaje) != (m.id_sala_id, m.id_usuario_id, m.fecha_envio)]
+    if perdidos:
+        # Un flush cortado pudo haberlos guardado ya con otro id
+        ya = set(MensajeChat.objects.filter(
+            fecha_envio__in=[m.fecha_envio for m in perdidos]
+        ).values_list('id_sala_id', 'id_usuario_id', 'fecha_envio'))
+        perdidos = [m for m in perdidos
+                    if (m.id_sala_id, m.id_usuario_id, m.fecha_envio) not in ya]
+        # INSERT IGNORE (MySQL) tambien omite las filas cuya sala o usuario
+        # se borro despues del primer filtro
+        perdidos = _descartar_huerfanos(perdidos) if perdidos else perdidos
+    if perdidos:
+        logger.warning(
+            f'Chat flush: {len(perdidos)} mensajes con id ya ocupado '
+            f'{[m.id_mensaje for m in perdidos]}; se guardan con un id nuevo'
+        )
+        for m in perdidos:
+            m.id_mensaje = nuevo_id()
+        MensajeChat.objects.bulk_create(perdidos)
+        for sala_id in {m.id_sala_id for m in perdidos}:
+            chat_history.invalidar(sala_id)
+
+
+def flush(batch_size=None):
+    """Guarda los mensajes pendientes en lotes. Devuelve cuantos se procesaron."""
+    if not cache.add(FLUSH_LOCK, 1, FLUSH_LOCK_TTL):
+        return 0  # Otro worker esta guardando
+    batch_size = batch_size or settings.CHAT_FLUSH_BATCH_SIZE
+    client = get_client()
+    total = 0
+    try:
+        while True:
+            crudos = _tomar_lote(client, batch_size)
+            if not crudos:
+                break
+            _guardar(crudos)
+            pipe = client.pipeline(transaction=False)
+            for crudo in crudos:
+                pipe.lrem(PROCESANDO_KEY, 1, crudo)
+            pipe.execute()
+            total += len(crudos)
+    finally:
+        cache.delete(FLUSH_LOCK)
+    return total
+
+
+def debe_notificar(sala_id):
+    """True una vez cada NOTIF_INTERVALO por sala (SET NX EX)"""
+    return cache.add(f'{NOTIF_PREFIX}{sala_id}', 1, NOTIF_INTERVALO)
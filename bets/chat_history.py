@@ -0,0 +1,252 @@
+"""
+Historial reciente del chat de cada sala en Redis (lista acotada).
+
+`chat_historial:{sala}` guarda los ultimos HISTORY_SIZE mensajes activos ya
+serializados (JSON), del mas viejo al mas nuevo. Cada mensaje nuevo se
+agrega con RPUSHX + LTRIM en una transaccion (MULTI), asi la lista nunca
+pasa de HISTORY_SIZE. Si la lista no existe (expiro, flush) se reconstruye
+desde la BD y los mensajes que aun esperan el flush (chat_buffer) en la
+siguiente lectura; mientras tanto los mensajes nuevos no la crean, para no
+dejar una lista incompleta.
+
+Editar o borrar un mensaje (signals.py) reemplaza o quita solo su entrada
+(`actualizar()`), sin tirar la lista.
+
+La reconstruccion es atomica respecto de los mensajes nuevos: cada
+`agregar()` incrementa `chat_historial_gen:{sala}` en la misma transaccion,
+y `_reconstruir()` vigila esa clave (WATCH) mientras lee los pendientes y
+la BD; si llego un mensaje en el medio, el EXEC falla y se vuelve a leer. Sin esto, un mensaje
+guardado despues de la lectura y agregado (RPUSHX sin efecto) antes de
+escribir la lista quedaria fuera de ella mientras la sala tenga actividad.
+
+La usan ChatConsumer (historial al conectarse) y MensajeChatViewSet.por_sala
+(`ultimos()`: mas de HISTORY_SIZE mensajes salen de la BD, con los mismos
+pendientes y el mismo formato).
+
+`pagina()` pagina el historial completo hacia atras con un cursor sobre
+(fecha_envio, id_mensaje), usando el indice (id_sala, fecha_envio,
+id_mensaje): cada pagina cuesta lo mismo a cualquier profundidad. La
+primera pagina sale de la lista en Redis; si la lista quedo mas corta que
+la pagina (mensajes borrados), se completa desde la BD.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Q
+from redis.exceptions import WatchError
+
+from .models import MensajeChat, MensajeStatus, Sala
+from .redis_client import get_client
+
+HISTORY_SIZE = 50
+HISTORY_TTL = 60 * 60 * 24  # Salas sin actividad liberan la memoria
+KEY_PREFIX = 'chat_historial:'
+GEN_PREFIX = 'chat_historial_gen:'
+SALA_PREFIX = 'chat_sala_nombre:'
+
+
+def _key(sala_id):
+    return f'{KEY_PREFIX}{sala_id}'
+
+
+def _gen_key(sala_id):
+    return f'{GEN_PREFIX}{sala_id}'
+
+
+def serializar(mensaje):
+    """Formato del mensaje en el WebSocket (mensaje con id_usuario cargado)"""
+    return {
+        'id_mensaje': mensaje.id_mensaje,
+        'contenido': mensaje.contenido,
+        'fecha_envio': mensaje.fecha_envio.isoformat(),
+        'usuario': {
+            'id_usuario': mensaje.id_usuario.id_usuario,
+            'nombre_usuario': mensaje.id_usuario.nombre_usuario,
+            'foto_perfil': mensaje.id_usuario.foto_perfil,
+        }
+    }
+
+
+def agregar(sala_id, mensaje_data, pipe=None):
+    """
+    Agrega un mensaje ya serializado al final de la lista de la sala. Con
+    `pipe` solo encola los comandos en esa transaccion (la ejecuta quien llama).
+    """
+    key, gen = _key(sala_id), _gen_key(sala_id)
+    propio = pipe is None
+    if propio:
+        pipe = get_client().pipeline(transaction=True)
+    pipe.rpushx(key, json.dumps(mensaje_data))
+    pipe.ltrim(key, -HISTORY_SIZE, -1)
+    pipe.expire(key, HISTORY_TTL)
+    pipe.incr(gen)
+    pipe.expire(gen, HISTORY_TTL)
+    if propio:
+        pipe.execute()
+
+
+def _leer_bd(sala_id):
+    mensajes = MensajeChat.objects.filter(
+        id_sala_id=sala_id,
+        estado=MensajeStatus.ACTIVO,
+    ).select_related('id_usuario').order_by('-fecha_envio', '-id_mensaje')[:HISTORY_SIZE]
+    return [serializar(m) for m in reversed(mensajes)]
+
+
+def _combinar(pendientes, guardados, limite=HISTORY_SIZE):
+    """Ultimos `limite` de ambas fuentes, sin repetidos, en orden"""
+    por_id = {m['id_mensaje']: m for m in guardados}
+    por_id.update((m['id_mensaje'], m) for m in pendientes)
+    data = sorted(por_id.values(),
+                  key=lambda m: (datetime.fromisoformat(m['fecha_envio']), m['id_mensaje']))
+    return data[-limite:]
+
+
+def _reconstruir(sala_id):
+    from .chat_buffer import pendientes
+
+    key = _key(sala_id)
+    with get_client().pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(_gen_key(sala_id))
+                # Primero los pendientes: un flush en el medio los deja en la BD
+                data = _combinar(pendientes(sala_id), _leer_bd(sala_id))
+                pipe.multi()
+                pipe.delete(key)
+                if data:
+                    pipe.rpush(key, *(json.dumps(m) for m in data))
+                    pipe.expire(key, HISTORY_TTL)
+                pipe.execute()
+                return data
+            except WatchError:  # Llego un mensaje durante la lectura
+                continue
+
+
+def recientes(sala_id, limite=HISTORY_SIZE):
+    """Ultimos `limite` (<= HISTORY_SIZE) mensajes activos, del mas viejo al mas nuevo"""
+    limite = max(1, min(limite, HISTORY_SIZE))
+    crudos = get_client().lrange(_key(sala_id), -limite, -1)
+    if not crudos:
+        return _reconstruir(sala_id)[-limite:]
+    return [json.loads(m) for m in crudos]
+
+
+def ultimos(sala_id, limite):
+    """
+    Ultimos `limite` mensajes activos, del mas viejo al mas nuevo, incluidos
+    los que esperan el flush. Hasta HISTORY_SIZE salen de la lista; mas alla,
+    de la BD.
+    """
+    if limite <= HISTORY_SIZE:
+        return recientes(sala_id, limite)
+    from .chat_buffer import pendientes
+
+    # Mismo orden que _reconstruir: un flush en el medio los deja en la BD
+    en_espera = pendientes(sala_id)
+    return _combinar(en_espera, _anteriores(sala_id, None, limite)[0], limite)
+
+
+def nombre_sala(sala_id):
+    """Nombre de la sala, cacheado (signals.py lo borra al guardar o borrar la Sala)"""
+    key = f'{SALA_PREFIX}{sala_id}'
+    nombre = cache.get(key)
+    if nombre is None:
+        nombre = Sala.objects.filter(id_sala=sala_id).values_list('nombre', flat=True).first()
+        if nombre is not None:
+            cache.set(key, nombre, HISTORY_TTL)
+    return nombre
+
+
+def invalidar_nombre_sala(sala_id):
+    cache.delete(f'{SALA_PREFIX}{sala_id}')
+
+
+def cursor(mensaje_data):
+    """Cursor opaco que apunta a los mensajes anteriores a `mensaje_data`"""
+    crudo = f"{mensaje_data['fecha_envio']}|{mensaje_data['id_mensaje']}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+
+def _leer_cursor(valor):
+    """(fecha, id_mensaje); ValueError si el cursor no es valido"""
+    try:
+        fecha, id_mensaje = base64.urlsafe_b64decode(valor.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(id_mensaje)
+    except (UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError('cursor invalido') from e
+
+
+def _anteriores(sala_id, antes, limite):
+    """(mensajes, hay_mas): hasta `limite` mensajes de la BD anteriores al cursor"""
+    qs = MensajeChat.objects.filter(id_sala_id=sala_id, estado=MensajeStatus.ACTIVO)
+    if antes is not None:
+        fecha, id_mensaje = _leer_cursor(antes)
+        qs = qs.filter(Q(fecha_envio__lt=fecha) | Q(fecha_envio=fecha, id_mensaje__lt=id_mensaje))
+    filas = list(
+        qs.select_related('id_usuario').order_by('-fecha_envio', '-id_mensaje')[:limite + 1]
+    )
+    return [serializar(m) for m in reversed(filas[:limite])], len(filas) > limite
+
+
+def pagina(sala_id, antes=None, limite=HISTORY_SIZE):
+    """
+    Mensajes activos anteriores al cursor `antes` (o los ultimos si es None),
+    del mas viejo al mas nuevo. Devuelve (mensajes, cursor_siguiente); el
+    cursor es None cuando no hay mas.
+    """
+    ultimos = []
+    if antes is None and limite <= HISTORY_SIZE:
+        ultimos = recientes(sala_id, limite)
+        if not ultimos:
+            return [], None
+        if len(ultimos) == limite:
+            return ultimos, cursor(ultimos[0])
+        # La lista puede quedar corta (mensajes borrados): se completa desde la BD
+        antes, limite = cursor(ultimos[0]), limite - len(ultimos)
+
+    mensajes, hay_mas = _anteriores(sala_id, antes, limite)
+    mensajes += ultimos
+    return mensajes, cursor(mensajes[0]) if hay_mas else None
+
+
+def actualizar(mensaje, borrado=False):
+    """
+    Mensaje editado, moderado o borrado: reemplaza su entrada en la lista
+    (LSET) o la quita (LREM). Si no esta pero puede corresponderle (ej. se
+    restauro un mensaje reciente) se invalida la lista.
+    """
+    key = _key(mensaje.id_sala_id)
+    activo = not borrado and mensaje.estado == MensajeStatus.ACTIVO
+    with get_client().pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                crudos = pipe.lrange(key, 0, -1)
+                if not crudos:
+                    return
+                actuales = [json.loads(c) for c in crudos]
+                indice = next((i for i, m in enumerate(actuales)
+                               if m['id_mensaje'] == mensaje.id_mensaje), None)
+                pipe.multi()
+                if indice is not None and activo:
+                    pipe.lset(key, indice, json.dumps(serializar(mensaje)))
+                elif indice is not None:
+                    pipe.lrem(key, 1, crudos[indice])
+                elif activo and (len(actuales) < HISTORY_SIZE
+                                 or mensaje.fecha_envio > datetime.fromisoformat(actuales[0]['fecha_envio'])):
+                    pipe.delete(key)
+                else:
+                    pipe.reset()
+                    return
+                pipe.incr(_gen_key(mensaje.id_sala_id))
+                pipe.execute()
+                return
+            except WatchError:
+                continue
+
+
+def invalidar(sala_id):
+    get_client().delete(_key(sala_id))
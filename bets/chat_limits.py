@@ -0,0 +1,94 @@
+"""
+Control de flujo del chat (ChatConsumer).
+
+- Tamaño: frames de mas de MAX_FRAME_BYTES se descartan sin parsear; los
+  mensajes de mas de MAX_MESSAGE_LENGTH caracteres se rechazan.
+- Token bucket por (usuario, sala): BURST mensajes seguidos y luego
+  RATE por segundo. El bucket vive en memoria del proceso (compartido por
+  todas las conexiones del usuario a esa sala en el proceso) y se respalda
+  en Redis (`chat_rl:{usuario}:{sala}`) al desconectarse o al rechazar un
+  mensaje, para que reconectar no lo reinicie.
+- Los envios muy seguidos (dentro de COALESCE_SECONDS del anterior) se
+  juntan en un solo mensaje en el consumer: una fila y un fan-out en lugar
+  de varios.
+"""
+import time
+from collections import OrderedDict
+
+from .redis_client import get_client
+
+MAX_FRAME_BYTES = 8 * 1024
+MAX_MESSAGE_LENGTH = 1000
+BURST = 5
+RATE = 1.0  # mensajes por segundo en regimen
+COALESCE_SECONDS = 0.5
+TYPING_INTERVAL = 2.0  # un indicador de 'escribiendo' cada 2 s como maximo
+BACKUP_TTL = 60 * 10
+MAX_BUCKETS = 10_000  # buckets en memoria por proceso (LRU)
+KEY_PREFIX = 'chat_rl:'
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'actualizado')
+
+    def __init__(self, tokens=BURST, actualizado=None):
+        self.tokens = tokens
+        self.actualizado = actualizado if actualizado is not None else time.monotonic()
+
+    def _recargar(self, ahora):
+        self.tokens = min(BURST, self.tokens + (ahora - self.actualizado) * RATE)
+        self.actualizado = ahora
+
+    def tomar(self):
+        """0 si se puede enviar; si no, segundos hasta el proximo token"""
+        self._recargar(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / RATE
+
+
+_buckets = OrderedDict()
+
+
+def _key(usuario_id, sala_id):
+    return f'{KEY_PREFIX}{usuario_id}:{sala_id}'
+
+
+def _restaurar(usuario_id, sala_id):
+    """Bucket respaldado en Redis (tokens y hora de pared), o uno lleno"""
+    guardado = get_client().hgetall(_key(usuario_id, sala_id))
+    if not guardado:
+        return TokenBucket()
+    tokens = float(guardado[b'tokens'])
+    transcurrido = max(0.0, time.time() - float(guardado[b'ts']))
+    return TokenBucket(tokens, time.monotonic() - transcurrido)
+
+
+def bucket(usuario_id, sala_id):
+    clave = (usuario_id, str(sala_id))
+    b = _buckets.get(clave)
+    if b is None:
+        b = _restaurar(usuario_id, sala_id)
+        _buckets[clave] = b
+        if len(_buckets) > MAX_BUCKETS:
+            _buckets.popitem(last=False)
+    else:
+        _buckets.move_to_end(clave)
+    return b
+
+
+def respaldar(usuario_id, sala_id):
+    """Guarda el estado del bucket en Redis"""
+    b = _buckets.get((usuario_id, str(sala_id)))
+    if b is None:
+        return
+    b._recargar(time.monotonic())
+    if b.tokens >= BURST:  # Lleno: equivale a no tener respaldo
+        get_client().delete(_key(usuario_id, sala_id))
+        return
+    key = _key(usuario_id, sala_id)
+    pipe = get_client().pipeline(transaction=True)
+    pipe.hset(key, mapping={'tokens': b.tokens, 'ts': time.time()})
+    pipe.expire(key, BACKUP_TTL)
+    pipe.execute()
@@ -1,11 +1,29 @@
+import asyncio
 import json
+import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
-from rest_framework.authtoken.models import Token
-from .models import MensajeChat, Sala, Usuario, SalaNotificacion
-from datetime import timedelta
-from django.utils import timezone
+from .models import SalaNotificacion
+from . import auth_cache, chat_buffer, chat_history, chat_limits, live_scores, presence, realtime
+
+logger = logging.getLogger(__name__)
+
+
+def token_de_query(scope):
+    """Token enviado como ?token=... en la URL del WebSocket"""
+    query_string = scope['query_string'].decode()
+    if 'token=' in query_string:
+        return query_string.split('token=')[1].split('&')[0]
+    return None
+
+
+@database_sync_to_async
+def usuario_por_token(token):
+    """Obtiene el usuario desde el token (cacheado; respeta la expiración)"""
+    return auth_cache.usuario_por_token(token)
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -13,14 +31,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_id = self.scope['url_route']['kwargs']['room_id']
         self.room_group_name = f'chat_{self.room_id}'
 
-        # Obtener token del query string
-        query_string = self.scope['query_string'].decode()
-        token = None
-        if 'token=' in query_string:
-            token = query_string.split('token=')[1].split('&')[0]
-
-        # Validar token y usuario
-        self.user = await self.get_user_from_token(token)
+        # Validar token (query string) y usuario
+        self.user = await usuario_por_token(token_de_query(self.scope))
         if not self.user:
             await self.close()
             return
@@ -30,6 +42,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        # Control de flujo: bucket del usuario en esta sala y envíos pendientes de juntar
+        self.bucket = await self.get_bucket()
+        self.pending = []
+        self.flush_task = None
+        self.last_sent = 0.0
+        self.last_typing = 0.0
+
         # Unirse al grupo de la sala
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -45,9 +64,27 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'messages': recent_messages
         }))
 
+        # Presencia (solo Redis): avisar a la sala y enviar quién está conectado
+        self.presence_joined = True
+        if await self.presence_connect():
+            await self.broadcast_presence('entro')
+        await self.send(text_data=json.dumps({
+            'type': 'online',
+            'usuarios': await self.presence_online(),
+        }))
+
     async def disconnect(self, close_code):
         """Se ejecuta cuando un cliente se desconecta"""
+        if getattr(self, 'bucket', None) is not None:
+            # Lo que quedó por juntar se envía igual; el bucket se respalda en Redis
+            if self.flush_task is not None:
+                self.flush_task.cancel()
+                self.flush_task = None
+            await self.flush_messages()
+            await self.backup_bucket()
         if hasattr(self, 'room_group_name'):
+            if getattr(self, 'presence_joined', False) and await self.presence_disconnect():
+                await self.broadcast_presence('salio')
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
@@ -55,42 +92,130 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def receive(self, text_data):
         """Se ejecuta cuando se recibe un mensaje del cliente"""
+        if text_data is None or len(text_data.encode()) > chat_limits.MAX_FRAME_BYTES:
+            await self.send_error('payload_too_large', 'Mensaje demasiado grande')
+            return
         try:
             data = json.loads(text_data)
             message_type = data.get('type', 'message')
 
             if message_type == 'message':
-                contenido = data['contenido']
-
-                # Guardar mensaje en la base de datos
-                mensaje = await self.save_message(
-                    self.room_id,
-                    self.user.id_usuario,
-                    contenido
-                )
-
-                # Create notification (throttled 15 min per sala)
-                await self.create_chat_notification(self.room_id, self.user, contenido)
-
-                # Enviar mensaje a todos los miembros de la sala
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'message': {
-                            'id_mensaje': mensaje['id_mensaje'],
-                            'contenido': mensaje['contenido'],
-                            'fecha_envio': mensaje['fecha_envio'],
-                            'usuario': mensaje['usuario'],
-                        }
-                    }
-                )
+                contenido = str(data.get('contenido', '')).strip()
+                if not contenido:
+                    return
+                if len(contenido) > chat_limits.MAX_MESSAGE_LENGTH:
+                    await self.send_error(
+                        'message_too_long',
+                        f'El mensaje supera {chat_limits.MAX_MESSAGE_LENGTH} caracteres'
+                    )
+                    return
+
+                espera = self.bucket.tomar()
+                if espera:
+                    await self.backup_bucket()
+                    await self.send_error(
+                        'rate_limited',
+                        'Estás enviando mensajes muy rápido',
+                        retry_after=round(espera, 1)
+                    )
+                    return
+
+                await self.queue_message(contenido)
+
+            elif message_type == 'typing':
+                escribiendo = bool(data.get('escribiendo', True))
+                ahora = time.monotonic()
+                # 'dejó de escribir' siempre pasa; 'escribiendo' como máximo cada TYPING_INTERVAL
+                if escribiendo and ahora - self.last_typing < chat_limits.TYPING_INTERVAL:
+                    return
+                self.last_typing = ahora if escribiendo else 0.0
+                await self.channel_layer.group_send(self.room_group_name, {
+                    'type': 'chat_typing',
+                    'usuario': self._usuario_publico(),
+                    'escribiendo': escribiendo,
+                })
+
+            elif message_type == 'heartbeat':
+                await self.presence_heartbeat()
         except Exception as e:
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': str(e)
             }))
 
+    async def send_error(self, code, message, **extra):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'code': code,
+            'message': message,
+            **extra,
+        }))
+
+    async def queue_message(self, contenido):
+        """
+        Los envíos dentro de COALESCE_SECONDS del anterior se juntan y salen
+        como un solo mensaje al cerrar la ventana.
+        """
+        self.pending.append(contenido)
+        if self.flush_task is not None:
+            return
+        espera = self.last_sent + chat_limits.COALESCE_SECONDS - time.monotonic()
+        if espera <= 0:
+            await self.flush_messages()
+        else:
+            self.flush_task = asyncio.ensure_future(self._flush_later(espera))
+
+    async def _flush_later(self, espera):
+        await asyncio.sleep(espera)
+        self.flush_task = None
+        # Corre como tarea aparte: un error aquí no llega a receive()
+        contenido = '\n'.join(self.pending)
+        try:
+            await self.flush_messages()
+        except Exception as e:
+            logger.exception(f'Chat: no se pudo publicar en sala {self.room_id}')
+            await self.send_error('send_failed', str(e), contenido=contenido)
+
+    async def flush_messages(self):
+        """Publica lo pendiente, juntando envíos sin pasar MAX_MESSAGE_LENGTH"""
+        pendientes, self.pending = self.pending, []
+        bloque = []
+        for contenido in pendientes:
+            if bloque and len('\n'.join(bloque + [contenido])) > chat_limits.MAX_MESSAGE_LENGTH:
+                await self.publish_message('\n'.join(bloque))
+                bloque = []
+            bloque.append(contenido)
+        if bloque:
+            await self.publish_message('\n'.join(bloque))
+
+    async def publish_message(self, contenido):
+        self.last_sent = time.monotonic()
+
+        # Id asignado en Redis; se guarda en MySQL por lotes (chat_buffer)
+        mensaje = await self.save_message(
+            self.room_id,
+            self.user,
+            contenido
+        )
+
+        # Enviar mensaje a todos los miembros de la sala
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'chat_message',
+                'message': {
+                    'id_mensaje': mensaje['id_mensaje'],
+                    'contenido': mensaje['contenido'],
+                    'fecha_envio': mensaje['fecha_envio'],
+                    'usuario': mensaje['usuario'],
+                }
+            }
+        )
+
+        # Create notification (throttled 15 min per sala)
+        if await self.should_notify(self.room_id):
+            await self.create_chat_notification(self.room_id, self.user, contenido)
+
     async def chat_message(self, event):
         """Envía el mensaje al WebSocket"""
         await self.send(text_data=json.dumps({
@@ -98,82 +223,187 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'message': event['message']
         }))
 
+    async def chat_typing(self, event):
+        """Indicador de 'escribiendo' (no se reenvía a quien escribe)"""
+        if event['usuario']['id_usuario'] != self.user.id_usuario:
+            await self.send(text_data=json.dumps({
+                'type': 'typing',
+                'usuario': event['usuario'],
+                'escribiendo': event['escribiendo'],
+            }))
+
+    async def chat_presence(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'evento': event['evento'],
+            'usuario': event['usuario'],
+        }))
+
+    def _usuario_publico(self):
+        return {'id_usuario': self.user.id_usuario, 'nombre_usuario': self.user.nombre_usuario}
+
+    async def broadcast_presence(self, evento):
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'chat_presence',
+            'evento': evento,
+            'usuario': self._usuario_publico(),
+        })
+
     @database_sync_to_async
-    def get_user_from_token(self, token):
-        """Obtiene el usuario desde el token"""
-        try:
-            token_obj = Token.objects.get(key=token)
-            return Usuario.objects.get(user=token_obj.user)
-        except:
-            return None
+    def get_bucket(self):
+        return chat_limits.bucket(self.user.id_usuario, self.room_id)
+
+    @database_sync_to_async
+    def backup_bucket(self):
+        chat_limits.respaldar(self.user.id_usuario, self.room_id)
+
+    @database_sync_to_async
+    def presence_connect(self):
+        return presence.conectar(self.room_id, self.user.id_usuario, self.channel_name)
+
+    @database_sync_to_async
+    def presence_heartbeat(self):
+        presence.latido(self.room_id, self.user.id_usuario, self.channel_name)
+
+    @database_sync_to_async
+    def presence_disconnect(self):
+        return presence.desconectar(self.room_id, self.user.id_usuario, self.channel_name)
+
+    @database_sync_to_async
+    def presence_online(self):
+        return presence.en_linea(self.room_id)
 
     @database_sync_to_async
     def user_in_room(self, usuario, room_id):
-        """Verifica si el usuario pertenece a la sala"""
-        from .models import UsuarioSala
-        return UsuarioSala.objects.filter(
-            id_usuario=usuario,
-            id_sala_id=room_id
-        ).exists()
+        """Verifica si el usuario pertenece a la sala (cacheado)"""
+        return auth_cache.es_miembro(usuario.id_usuario, room_id)
 
     @database_sync_to_async
-    def save_message(self, room_id, usuario_id, contenido):
-        """Guarda el mensaje en la base de datos"""
-        mensaje = MensajeChat.objects.create(
-            id_sala_id=room_id,
-            id_usuario_id=usuario_id,
-            contenido=contenido
-        )
-        return {
-            'id_mensaje': mensaje.id_mensaje,
-            'contenido': mensaje.contenido,
-            'fecha_envio': mensaje.fecha_envio.isoformat(),
-            'usuario': {
-                'id_usuario': mensaje.id_usuario.id_usuario,
-                'nombre_usuario': mensaje.id_usuario.nombre_usuario,
-                'foto_perfil': mensaje.id_usuario.foto_perfil,
-            }
-        }
+    def save_message(self, room_id, usuario, contenido):
+        """Encola el mensaje (write-behind) y dispara el flush si el lote se llenó"""
+        from .tasks import flush_chat_messages
+        data, lleno = chat_buffer.encolar(room_id, usuario, contenido)
+        if lleno:
+            flush_chat_messages.delay()
+        return data
+
+    @database_sync_to_async
+    def should_notify(self, room_id):
+        return chat_buffer.debe_notificar(room_id)
 
     @database_sync_to_async
     def create_chat_notification(self, room_id, usuario, contenido):
-        """Creates a chat notification for the sala, throttled to once per 15 minutes"""
+        """Creates a chat notification for the sala (caller checks the 15 min throttle)"""
         try:
-            sala = Sala.objects.get(id_sala=room_id)
-            quince_min_atras = timezone.now() - timedelta(minutes=15)
-            ya_existe = SalaNotificacion.objects.filter(
-                id_sala=sala,
+            preview = contenido[:80] + ('...' if len(contenido) > 80 else '')
+            SalaNotificacion.objects.create(
+                id_sala_id=room_id,
                 tipo='nuevo_mensaje_chat',
-                fecha__gte=quince_min_atras
-            ).exists()
-            if not ya_existe:
-                preview = contenido[:80] + ('...' if len(contenido) > 80 else '')
-                SalaNotificacion.objects.create(
-                    id_sala=sala,
-                    tipo='nuevo_mensaje_chat',
-                    mensaje=f'{usuario.nombre_usuario}: \u201c{preview}\u201d',
-                    icono='\U0001f4ac',
-                    color='text-blue-400',
-                    usuario_relacionado=usuario,
-                )
+                mensaje=f'{usuario.nombre_usuario}: \u201c{preview}\u201d',
+                icono='\U0001f4ac',
+                color='text-blue-400',
+                usuario_relacionado=usuario,
+            )
         except Exception:
             pass  # Non-blocking
 
     @database_sync_to_async
     def get_recent_messages(self, room_id, limit=50):
-        """Obtiene los últimos N mensajes de la sala"""
-        mensajes = MensajeChat.objects.filter(
-            id_sala_id=room_id,
-            estado='activo'
-        ).select_related('id_usuario').order_by('-fecha_envio')[:limit]
-
-        return [{
-            'id_mensaje': m.id_mensaje,
-            'contenido': m.contenido,
-            'fecha_envio': m.fecha_envio.isoformat(),
-            'usuario': {
-                'id_usuario': m.id_usuario.id_usuario,
-                'nombre_usuario': m.id_usuario.nombre_usuario,
-                'foto_perfil': m.id_usuario.foto_perfil,
-            }
-        } for m in reversed(mensajes)]
+        """Obtiene los últimos N mensajes de la sala (historial en Redis)"""
+        return chat_history.recientes(room_id, limit)
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Canal de eventos del usuario (ws/notificaciones/?token=...): notificaciones,
+    marcadores en vivo, resultados y cambios de lider de todas sus salas.
+    Los eventos se publican con bets.realtime.
+    """
+
+    async def connect(self):
+        self.user = await usuario_por_token(token_de_query(self.scope))
+        if not self.user:
+            await self.close()
+            return
+
+        self.groups_joined = {realtime.grupo_usuario(self.user.id_usuario)}
+        self.groups_joined.update(
+            realtime.grupo_sala(s) for s in await self.get_sala_ids(self.user)
+        )
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, 'groups_joined', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data):
+        """El canal es solo de salida; se responde 'ping' para keepalive"""
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if data.get('type') == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+
+    async def push_evento(self, event):
+        """Reenvía un evento de bets.realtime al cliente"""
+        evento, data = event['evento'], event['data']
+        # Entrar/salir de una sala cambia los grupos de esta conexión
+        if evento in ('sala_agregada', 'sala_removida'):
+            group = realtime.grupo_sala(data['sala_id'])
+            if evento == 'sala_agregada':
+                self.groups_joined.add(group)
+                await self.channel_layer.group_add(group, self.channel_name)
+            else:
+                self.groups_joined.discard(group)
+                await self.channel_layer.group_discard(group, self.channel_name)
+        await self.send(text_data=json.dumps({'type': evento, 'data': data}))
+
+    @database_sync_to_async
+    def get_sala_ids(self, usuario):
+        from .models import UsuarioSala
+        return list(
+            UsuarioSala.objects.filter(id_usuario=usuario).values_list('id_sala_id', flat=True)
+        )
+
+
+class LiveMatchConsumer(AsyncWebsocketConsumer):
+    """
+    Marcador en vivo de un partido (ws/partidos/<partido_id>/?token=...).
+    Al conectarse recibe el estado actual; después, un delta por tick de
+    sincronización (bets.live_scores).
+    """
+
+    async def connect(self):
+        self.partido_id = self.scope['url_route']['kwargs']['partido_id']
+        self.user = await usuario_por_token(token_de_query(self.scope))
+        if not self.user:
+            await self.close()
+            return
+
+        estado = await self.get_estado(self.partido_id)
+        if estado is None:
+            await self.close()
+            return
+
+        self.group_name = live_scores.grupo_partido(self.partido_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send(text_data=json.dumps({'type': 'estado', 'data': estado}))
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def push_evento(self, event):
+        await self.send(text_data=json.dumps({'type': event['evento'], 'data': event['data']}))
+
+    @database_sync_to_async
+    def get_estado(self, partido_id):
+        from .models import ApiPartido
+        partido = ApiPartido.objects.filter(id_partido=partido_id).only(
+            'id_partido', *live_scores.CAMPOS).first()
+        return live_scores.estado_partido(partido) if partido else None
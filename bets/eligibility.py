@@ -0,0 +1,164 @@
+"""
+Indice de elegibilidad de partidos por sala.
+
+Centraliza la regla "este partido se puede apostar en esta sala" segun
+`modo_sala`:
+- 'ligas': partidos de las ligas habilitadas (sin ligas = todos)
+- 'partidos_individuales': solo partidos agregados manualmente (sin partidos = ninguno)
+- 'mixto': ligas habilitadas + partidos manuales (sin ninguno = todos)
+
+La configuracion de cada sala (modo, ligas, partidos manuales) se guarda en
+cache y se invalida desde signals.py cuando cambian Sala, SalaLiga o
+SalaPartido. Con la cache caliente, preguntar por N salas cuesta un
+`get_many`; en frio son 3 queries sin importar N.
+"""
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import ApiPartido, Sala, SalaLiga, SalaPartido, UsuarioSala
+
+CACHE_PREFIX = 'sala_elegibilidad:'
+CACHE_TTL = 60 * 60 * 24  # La invalidacion es explicita; el TTL es solo un respaldo
+
+
+class SalaElegibilidad:
+    """Configuracion de apuestas de una sala, inmutable y barata de cachear"""
+
+    __slots__ = ('sala_id', 'modo', 'ligas', 'partidos')
+
+    def __init__(self, sala_id, modo, ligas, partidos):
+        self.sala_id = sala_id
+        self.modo = modo
+        self.ligas = frozenset(ligas)
+        self.partidos = frozenset(partidos)
+
+    def __getstate__(self):
+        return (self.sala_id, self.modo, tuple(self.ligas), tuple(self.partidos))
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @property
+    def sin_restriccion(self):
+        """True si la sala admite cualquier partido (configuracion vacia)"""
+        if self.modo == 'ligas':
+            return not self.ligas
+        if self.modo == 'mixto':
+            return not self.ligas and not self.partidos
+        return False
+
+    def admite(self, liga_id, partido_id):
+        """Regla de apuestas: ¿se puede apostar este partido en la sala?"""
+        if self.sin_restriccion:
+            return True
+        if self.modo == 'partidos_individuales':
+            return partido_id in self.partidos
+        if self.modo == 'ligas':
+            return liga_id in self.ligas
+        return liga_id in self.ligas or partido_id in self.partidos
+
+    def incluye(self, liga_id, partido_id):
+        """Pertenencia explicita (liga habilitada o partido agregado), sin
+        importar el modo. Es la regla que usan los recordatorios: una sala
+        sin configuracion no recibe recordatorios de todos los partidos."""
+        return liga_id in self.ligas or partido_id in self.partidos
+
+    def filtrar(self, queryset):
+        """Aplica la regla de apuestas a un queryset de ApiPartido"""
+        if self.sin_restriccion:
+            return queryset
+        if self.modo == 'partidos_individuales':
+            return queryset.filter(id_partido__in=self.partidos) if self.partidos else queryset.none()
+        if self.modo == 'ligas':
+            return queryset.filter(id_liga__in=self.ligas)
+        return queryset.filter(Q(id_liga__in=self.ligas) | Q(id_partido__in=self.partidos))
+
+
+def _ids_validos(sala_ids):
+    """Normaliza IDs que pueden venir de query params; descarta los no numericos"""
+    validos = set()
+    for sala_id in sala_ids:
+        try:
+            validos.add(int(sala_id))
+        except (TypeError, ValueError):
+            continue
+    return validos
+
+
+def _cache_key(sala_id):
+    return f'{CACHE_PREFIX}{sala_id}'
+
+
+def _cargar_desde_bd(sala_ids):
+    """Construye la configuracion de varias salas con 3 queries"""
+    modos = dict(Sala.objects.filter(id_sala__in=sala_ids).values_list('id_sala', 'modo_sala'))
+    ligas = {sala_id: [] for sala_id in modos}
+    partidos = {sala_id: [] for sala_id in modos}
+    for sala_id, liga_id in SalaLiga.objects.filter(id_sala__in=modos).values_list('id_sala_id', 'id_liga_id'):
+        ligas[sala_id].append(liga_id)
+    for sala_id, partido_id in SalaPartido.objects.filter(id_sala__in=modos).values_list('id_sala_id', 'id_partido_id'):
+        partidos[sala_id].append(partido_id)
+    return {
+        sala_id: SalaElegibilidad(sala_id, modo, ligas[sala_id], partidos[sala_id])
+        for sala_id, modo in modos.items()
+    }
+
+
+def configs_salas(sala_ids):
+    """
+    Configuracion de elegibilidad de varias salas: {sala_id: SalaElegibilidad}.
+    Las salas que no existen no aparecen en el resultado.
+    """
+    sala_ids = _ids_validos(sala_ids)
+    if not sala_ids:
+        return {}
+
+    claves = {_cache_key(s): s for s in sala_ids}
+    encontrados = cache.get_many(claves.keys())
+    configs = {claves[k]: v for k, v in encontrados.items()}
+
+    faltantes = sala_ids - configs.keys()
+    if faltantes:
+        nuevos = _cargar_desde_bd(faltantes)
+        cache.set_many({_cache_key(s): c for s, c in nuevos.items()}, CACHE_TTL)
+        configs.update(nuevos)
+    return configs
+
+
+def config_sala(sala_id):
+    """Configuracion de una sala, o None si no existe"""
+    configs = configs_salas([sala_id])
+    return next(iter(configs.values()), None)
+
+
+def invalidar_sala(sala_id):
+    cache.delete(_cache_key(sala_id))
+
+
+def partidos_elegibles(sala_id, desde=None, hasta=None, queryset=None):
+    """
+    Partidos apostables en la sala dentro de la ventana [desde, hasta].
+    Si la sala no existe no se aplica filtro de sala (igual que `proximos`).
+    """
+    if queryset is None:
+        queryset = ApiPartido.objects.all()
+    if desde is not None:
+        queryset = queryset.filter(fecha__gte=desde)
+    if hasta is not None:
+        queryset = queryset.filter(fecha__lte=hasta)
+
+    config = config_sala(sala_id)
+    return config.filtrar(queryset) if config else queryset
+
+
+def salas_elegibles_para_partido(usuario, partido, excluir=()):
+    """IDs de las salas del usuario donde se puede apostar el partido"""
+    sala_ids = set(
+        UsuarioSala.objects.filter(id_usuario=usuario).values_list('id_sala_id', flat=True)
+    )
+    sala_ids.difference_update(_ids_validos(excluir))
+    configs = configs_salas(sala_ids)
+    return [
+        sala_id for sala_id, config in configs.items()
+        if config.admite(partido.id_liga_id, partido.id_partido)
+    ]
@@ -1,13 +1,77 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.utils.html import strip_tags
-from django.db.models import Sum
+from django.utils.safestring import mark_safe
+from functools import lru_cache
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 
+def email_message(to, subject, html_message, body=None):
+    """
+    Mensaje serializable (JSON) para el envio masivo: se arma una vez y se
+    puede pasar a una tarea de Celery. `body` es la version en texto plano
+    (por defecto, el HTML sin etiquetas).
+    """
+    return {
+        'to': to,
+        'subject': subject,
+        'body': body if body is not None else strip_tags(html_message),
+        'html': html_message,
+    }
+
+
+def send_bulk(messages, connection=None):
+    """
+    Envia muchos mensajes (ver email_message) sobre una sola conexion SMTP.
+
+    Cada mensaje se envia por separado en la misma conexion, asi un destinatario
+    rechazado no corta el lote: sus mensajes se devuelven en 'failed' para
+    reintentarlos individualmente.
+
+    Returns:
+        dict: {'sent': int, 'failed': [mensajes], 'elapsed_ms': int, 'per_second': float}
+    """
+    inicio = time.perf_counter()
+    sent = 0
+    failed = []
+    conexion = connection or get_connection(fail_silently=False)
+    try:
+        conexion.open()
+        for m in messages:
+            email = EmailMultiAlternatives(
+                subject=m['subject'],
+                body=m['body'],
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[m['to']],
+                connection=conexion,
+            )
+            email.attach_alternative(m['html'], 'text/html')
+            try:
+                sent += conexion.send_messages([email]) or 0
+            except Exception as e:
+                logger.error(f"Failed to send email to {m['to']}: {e}")
+                failed.append(m)
+    except Exception as e:
+        # No se pudo abrir la conexion: todo el lote queda para reintento
+        logger.error(f"Bulk email connection error: {e}")
+        failed = list(messages)
+    finally:
+        if connection is None:
+            conexion.close()
+
+    elapsed = time.perf_counter() - inicio
+    return {
+        'sent': sent,
+        'failed': failed,
+        'elapsed_ms': round(elapsed * 1000),
+        'per_second': round(sent / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
 def send_verification_email(user_email, verification_token, username):
     """
     Send email verification link to user
@@ -200,148 +264,92 @@ def send_room_invitation_email(invited_email, invite_token, room_name, inviter_n
         raise
 
 
-def send_match_reminder_email(user_email, username, salas_data, tomorrow_str):
+@lru_cache(maxsize=None)
+def _template(name):
+    """Plantilla compilada una sola vez por proceso"""
+    return get_template(name)
+
+
+def _match_key(matches):
+    return tuple((m['local'], m['visitante'], m['liga'], m['hora'], m.get('prediccion', ''))
+                 for m in matches)
+
+
+@lru_cache(maxsize=4096)
+def _reminder_block(kind, lang, matches):
     """
-    Envia recordatorio diario de partidos de manana.
+    Bloque de partidos de una sala ('placed' / 'missing'). Los partidos sin
+    apostar de una sala son los mismos para casi todos sus miembros: el
+    bloque se renderiza una vez y se reutiliza.
+    """
+    if not matches:
+        return ''
+    filas = [dict(zip(('local', 'visitante', 'liga', 'hora', 'prediccion'), m)) for m in matches]
+    return _template('emails/match_reminder_block.html').render(
+        {'kind': kind, 'lang': lang, 'matches': filas})
+
+
+def _reminder_card(sala, lang):
+    placed = _reminder_block('placed', lang, _match_key(sala['bets_placed']))
+    missing = _reminder_block('missing', lang, _match_key(sala['bets_missing']))
+    if not placed and not missing:
+        return ''
+    return _template('emails/match_reminder_sala.html').render({
+        'sala_nombre': sala['sala_nombre'],
+        'placed': mark_safe(placed),
+        'missing': mark_safe(missing),
+    })
+
+
+def build_match_reminder_email(user_email, username, salas_data, tomorrow_str):
+    """
+    Arma el recordatorio diario de partidos de manana (ver email_message).
     salas_data: list of dicts with keys:
         sala_nombre, bets_placed (list of match dicts), bets_missing (list of match dicts)
     Each match dict: {local, visitante, liga, hora, prediccion}
+    Devuelve None si no hay partidos.
     """
-    from django.utils.html import strip_tags
-
     total_placed = sum(len(s['bets_placed']) for s in salas_data)
     total_missing = sum(len(s['bets_missing']) for s in salas_data)
 
     if total_placed == 0 and total_missing == 0:
-        return
+        return None
 
     subject = f'[FriendlyBet] Partidos manana {tomorrow_str} / Tomorrow matches'
+    context = {
+        'username': username,
+        'tomorrow_str': tomorrow_str,
+        'total_missing': total_missing,
+        'salas_data': salas_data,
+        'cta_url': getattr(settings, 'FRONTEND_URL', 'https://friendlybet.260569.xyz'),
+        'cards_es': [mark_safe(c) for c in (_reminder_card(s, 'es') for s in salas_data) if c],
+        'cards_en': [mark_safe(c) for c in (_reminder_card(s, 'en') for s in salas_data) if c],
+    }
+    return {
+        'to': user_email,
+        'subject': subject,
+        'body': _template('emails/match_reminder.txt').render(context),
+        'html': _template('emails/match_reminder.html').render(context),
+    }
 
-    BALL = '&#x26BD;'
-    CHECK = '&#x2705;'
-    CLOCK = '&#x23F3;'
-    HOUSE = '&#x1F3E0;'
-    TROPHY = '&#x1F3C6;'
-    CAL = '&#x1F4C5;'
-
-    def match_row_green(m):
-        return (
-            f'<div style="padding:6px 10px;margin:3px 0;background:#f0fdf4;border-left:3px solid #16a34a;border-radius:4px;font-size:13px;color:#374151;">'
-            f'{BALL} <strong>{m["local"]}</strong> vs <strong>{m["visitante"]}</strong>'
-            f'<span style="color:#6b7280;font-size:12px;"> &middot; {m["liga"]} &middot; {m["hora"]} UTC</span>'
-            f'<span style="color:#16a34a;font-size:12px;margin-left:6px;">{{label}}: {m["prediccion"]}</span>'
-            f'</div>'
-        )
-
-    def match_row_amber(m):
-        return (
-            f'<div style="padding:6px 10px;margin:3px 0;background:#fffbeb;border-left:3px solid #d97706;border-radius:4px;font-size:13px;color:#374151;">'
-            f'{BALL} <strong>{m["local"]}</strong> vs <strong>{m["visitante"]}</strong>'
-            f'<span style="color:#6b7280;font-size:12px;"> &middot; {m["liga"]} &middot; {m["hora"]} UTC</span>'
-            f'<span style="color:#d97706;font-size:12px;margin-left:6px;">{{label}}</span>'
-            f'</div>'
-        )
-
-    def sala_block(sala, lang):
-        rows = ''
-        placed_label = 'Tu marcador' if lang == 'es' else 'Your score'
-        missing_label = '&iexcl;Otros ya apostaron!' if lang == 'es' else 'Others have bet!'
-        placed_heading = f'{CHECK} Ya tienes prediccion:' if lang == 'es' else f'{CHECK} Already predicted:'
-        missing_heading = f'{CLOCK} Faltan por registrar:' if lang == 'es' else f'{CLOCK} Missing predictions:'
-
-        if sala['bets_placed']:
-            rows += f'<p style="margin:8px 0 4px;font-size:13px;color:#16a34a;font-weight:600;">{placed_heading}</p>'
-            for m in sala['bets_placed']:
-                rows += match_row_green(m).format(label=placed_label)
-        if sala['bets_missing']:
-            rows += f'<p style="margin:12px 0 4px;font-size:13px;color:#d97706;font-weight:600;">{missing_heading}</p>'
-            for m in sala['bets_missing']:
-                rows += match_row_amber(m).format(label=missing_label)
-        return rows
-
-    def sala_card(sala, lang):
-        inner = sala_block(sala, lang)
-        if not inner:
-            return ''
-        return (
-            f'<div style="margin-bottom:20px;background:#fff;border:1px solid #e5e7eb;border-radius:8px;overflow:hidden;">'
-            f'<div style="background:#16a34a;color:white;padding:8px 14px;font-size:14px;font-weight:700;">'
-            f'{HOUSE} {sala["sala_nombre"]}'
-            f'</div>'
-            f'<div style="padding:12px 14px;">{inner}</div>'
-            f'</div>'
-        )
-
-    salas_es = ''.join(sala_card(s, 'es') for s in salas_data)
-    salas_en = ''.join(sala_card(s, 'en') for s in salas_data)
-
-    cta_url = getattr(settings, 'FRONTEND_URL', 'https://friendlybet.260569.xyz')
 
-    pending_es = (
-        f'<span style="color:#d97706;font-weight:600;">Tienes {total_missing} prediccion(es) pendiente(s).</span>'
-        if total_missing > 0 else
-        '<span style="color:#16a34a;font-weight:600;">Todo al dia! &#x1F389;</span>'
-    )
-    pending_en = (
-        f'<span style="color:#d97706;font-weight:600;">You have {total_missing} missing prediction(s).</span>'
-        if total_missing > 0 else
-        '<span style="color:#16a34a;font-weight:600;">All caught up! &#x1F389;</span>'
-    )
-
-    html_message = f"""
-    <html>
-    <body style="margin:0;padding:0;background:#f3f4f6;font-family:Arial,sans-serif;">
-      <div style="max-width:600px;margin:30px auto;background:#fff;border-radius:12px;overflow:hidden;box-shadow:0 2px 8px rgba(0,0,0,0.08);">
-        <div style="background:linear-gradient(135deg,#16a34a,#15803d);padding:28px 30px;text-align:center;">
-          <h1 style="margin:0;color:white;font-size:22px;font-weight:800;">{TROPHY} FriendlyBet</h1>
-          <p style="margin:6px 0 0;color:rgba(255,255,255,0.85);font-size:14px;">{tomorrow_str}</p>
-        </div>
-        <div style="padding:28px 30px;">
-          <div style="border-bottom:2px solid #e5e7eb;padding-bottom:24px;margin-bottom:24px;">
-            <h2 style="margin:0 0 6px;font-size:17px;color:#111827;">{CAL} Tus partidos de manana</h2>
-            <p style="margin:0 0 16px;font-size:13px;color:#6b7280;">
-              Hola <strong>{username}</strong>, aqui estan los partidos de manana en tus salas. {pending_es}
-            </p>
-            {salas_es}
-            <div style="text-align:center;margin-top:20px;">
-              <a href="{cta_url}" style="background:#16a34a;color:white;padding:11px 28px;border-radius:8px;text-decoration:none;font-size:14px;font-weight:700;display:inline-block;">
-                Registrar predicciones &rarr;
-              </a>
-            </div>
-          </div>
-          <div>
-            <h2 style="margin:0 0 6px;font-size:17px;color:#111827;">{CAL} Your matches tomorrow</h2>
-            <p style="margin:0 0 16px;font-size:13px;color:#6b7280;">
-              Hi <strong>{username}</strong>, here are tomorrow's matches in your rooms. {pending_en}
-            </p>
-            {salas_en}
-            <div style="text-align:center;margin-top:20px;">
-              <a href="{cta_url}" style="background:#16a34a;color:white;padding:11px 28px;border-radius:8px;text-decoration:none;font-size:14px;font-weight:700;display:inline-block;">
-                Place your predictions &rarr;
-              </a>
-            </div>
-          </div>
-        </div>
-        <div style="background:#f9fafb;border-top:1px solid #e5e7eb;padding:14px 30px;text-align:center;">
-          <p style="margin:0;font-size:11px;color:#9ca3af;">
-            FriendlyBet &middot; Sports Predictions with Friends
-          </p>
-        </div>
-      </div>
-    </body>
-    </html>
+def send_match_reminder_email(user_email, username, salas_data, tomorrow_str):
     """
-
-    plain_message = strip_tags(html_message)
+    Envia recordatorio diario de partidos de manana a un solo usuario.
+    La tarea diaria usa build_match_reminder_email + send_bulk.
+    """
+    message = build_match_reminder_email(user_email, username, salas_data, tomorrow_str)
+    if message is None:
+        return
 
     try:
-        logger.info(f"Sending match reminder to {user_email} ({total_placed} placed, {total_missing} missing)")
+        logger.info(f"Sending match reminder to {user_email}")
         result = send_mail(
-            subject=subject,
-            message=plain_message,
+            subject=message['subject'],
+            message=message['body'],
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[user_email],
-            html_message=html_message,
+            html_message=message['html'],
             fail_silently=False,
         )
         logger.info(f"Match reminder sent to {user_email}. Result: {result}")
@@ -351,7 +359,7 @@ def send_match_reminder_email(user_email, username, salas_data, tomorrow_str):
         raise
 
 
-def send_phase_transition_email(sala_id, ronda_patron='group'):
+def send_phase_transition_email(sala_id, ronda_patron='group', liga_id=None):
     """
     Sends a group-stage wrap-up email to every member of the given room.
 
@@ -364,12 +372,13 @@ def send_phase_transition_email(sala_id, ronda_patron='group'):
         ronda_patron: String fragment used to identify group-stage matches
                       via a case-insensitive ronda__icontains filter.
                       Defaults to 'group' (matches "Group Stage - 1", etc.).
+        liga_id: Optional league restriction for the matches counted.
 
     Returns:
         dict: {'sent': int, 'failed': int}
     """
-    from django.utils.html import strip_tags as _strip
-    from bets.models import Sala, UsuarioSala, ApuestaFutbol, ApiPartido, ApuestaStatus
+    from bets import leaderboard
+    from bets.models import Sala, UsuarioSala
 
     sala = Sala.objects.select_related('id_usuario').get(id_sala=sala_id)
     members = list(
@@ -380,325 +389,52 @@ def send_phase_transition_email(sala_id, ronda_patron='group'):
         logger.warning(f"send_phase_transition_email: sala {sala_id} has no members")
         return {'sent': 0, 'failed': 0}
 
-    # Identify all group-stage match IDs scoped to this sala's bets
-    group_match_ids = list(
-        ApiPartido.objects.filter(ronda__icontains=ronda_patron)
-        .values_list('id_partido', flat=True)
-    )
-
-    # Compute standings: total points per user from group-stage bets in this sala
-    standings = []
-    for m in members:
-        pts = (
-            ApuestaFutbol.objects.filter(
-                id_sala=sala,
-                id_usuario=m.id_usuario,
-                id_partido_id__in=group_match_ids,
-                estado=ApuestaStatus.GANADA,
-            ).aggregate(total=Sum('puntos_ganados'))['total']
-            or 0
-        )
-        standings.append({'usuario': m.id_usuario, 'puntos': pts})
-
-    standings.sort(key=lambda x: x['puntos'], reverse=True)
-
-    # Extract top-3 data
-    def _entry(idx):
-        return standings[idx] if idx < len(standings) else None
-
-    first = _entry(0)
-    second = _entry(1)
-    third = _entry(2)
-
-    first_name = first['usuario'].nombre_usuario if first else '—'
-    first_pts = first['puntos'] if first else 0
-    second_name = second['usuario'].nombre_usuario if second else '—'
-    second_gap = (first_pts - second['puntos']) if second else 0
-    third_name = third['usuario'].nombre_usuario if third else '—'
-    third_gap = (first_pts - third['puntos']) if third else 0
-
-    # Render standings table rows (top-N)
-    def _standings_rows(lang):
-        medals = ['🥇', '🥈', '🥉']
-        pts_label = 'pts'
-        rows = ''
-        for i, entry in enumerate(standings):
-            medal = medals[i] if i < 3 else f'{i + 1}.'
-            rows += (
-                f'<tr style="border-bottom:1px solid #e5e7eb;">'
-                f'<td style="padding:8px 12px;font-size:14px;color:#374151;">{medal}</td>'
-                f'<td style="padding:8px 12px;font-size:14px;color:#111827;font-weight:{"700" if i == 0 else "400"};">'
-                f'{entry["usuario"].nombre_usuario}</td>'
-                f'<td style="padding:8px 12px;font-size:14px;color:#16a34a;font-weight:700;text-align:right;">'
-                f'{entry["puntos"]} {pts_label}</td>'
-                f'</tr>'
-            )
-        return rows
-
-    TROPHY = '&#x1F3C6;'
-    BALL = '&#x26BD;'
-    cta_url = getattr(settings, 'FRONTEND_URL', 'https://friendlybet.260569.xyz')
-
-    html_message = f"""
-    <html>
-    <body style="margin:0;padding:0;background:#f3f4f6;font-family:Arial,sans-serif;">
-      <div style="max-width:600px;margin:30px auto;background:#fff;border-radius:12px;
-                  overflow:hidden;box-shadow:0 2px 8px rgba(0,0,0,0.08);">
-
-        <!-- Header -->
-        <div style="background:#1d4ed8;padding:32px 30px;text-align:center;">
-          <h1 style="margin:0;color:white;font-size:24px;font-weight:800;">{TROPHY} FriendlyBet</h1>
-          <p style="margin:8px 0 0;color:rgba(255,255,255,0.9);font-size:16px;font-weight:600;">
-            {sala.nombre}
-          </p>
-        </div>
-
-        <div style="padding:32px 30px;">
-
-          <!-- ===== ESPAÑOL ===== -->
-          <div style="border-bottom:2px solid #e5e7eb;padding-bottom:28px;margin-bottom:28px;">
-
-            <h2 style="margin:0 0 4px;font-size:20px;color:#111827;">{BALL} Fase de Grupos — Clasificación Parcial</h2>
-            <p style="margin:0 0 6px;font-size:13px;color:#6b7280;">
-              La fase de grupos ha concluido. Estos son los puntos acumulados hasta ahora en <strong>{sala.nombre}</strong>.
-            </p>
-            <div style="background:#fef9c3;border:1px solid #fde047;border-radius:6px;padding:10px 14px;margin-bottom:20px;">
-              <p style="margin:0;font-size:12px;color:#713f12;">
-                &#x26A0;&#xFE0F; <strong>Clasificación parcial:</strong> estos puntos son solo de la fase de grupos.
-                La competencia continúa a través de los octavos, cuartos, semifinales y la gran final —
-                hasta que haya un <strong>Campeón del Mundial</strong> en tu sala. ¡Todos los puntos se acumulan!
-              </p>
-            </div>
-
-            <!-- Podium callout -->
-            <div style="background:#fefce8;border:1px solid #fde68a;border-radius:8px;padding:16px 20px;margin-bottom:20px;">
-              <p style="margin:0 0 6px;font-size:15px;font-weight:700;color:#92400e;">
-                🥇 Lider de grupo: <span style="color:#1d4ed8;">{first_name}</span>
-              </p>
-              {"" if not second else f'<p style="margin:0 0 6px;font-size:13px;color:#374151;">🥈 {second_name} &mdash; a {second_gap} punto{"s" if second_gap != 1 else ""} del lider</p>'}
-              {"" if not third else f'<p style="margin:0;font-size:13px;color:#374151;">🥉 {third_name} &mdash; a {third_gap} punto{"s" if third_gap != 1 else ""} del lider</p>'}
-            </div>
-
-            <!-- Full standings table -->
-            <table style="width:100%;border-collapse:collapse;border:1px solid #e5e7eb;border-radius:8px;overflow:hidden;">
-              <thead>
-                <tr style="background:#f9fafb;">
-                  <th style="padding:10px 12px;font-size:12px;color:#6b7280;text-align:left;font-weight:600;">POS</th>
-                  <th style="padding:10px 12px;font-size:12px;color:#6b7280;text-align:left;font-weight:600;">JUGADOR</th>
-                  <th style="padding:10px 12px;font-size:12px;color:#6b7280;text-align:right;font-weight:600;">PUNTOS (FASE DE GRUPOS)</th>
-                </tr>
-              </thead>
-              <tbody>
-                {_standings_rows('es')}
-              </tbody>
-            </table>
-
-            <!-- New scoring callout ES -->
-            <div style="margin-top:20px;border:1px solid #bfdbfe;border-radius:8px;overflow:hidden;">
-              <div style="background:#1d4ed8;padding:10px 16px;">
-                <p style="margin:0;font-size:13px;font-weight:700;color:white;">&#x1F195; Nuevo sistema de puntuacion — desde Octavos de Final</p>
-              </div>
-              <div style="padding:14px 16px;background:#eff6ff;">
-                <p style="margin:0 0 10px;font-size:12px;color:#1e3a5f;">
-                  A partir de los octavos de final, el sistema de puntuacion cambia para recompensar el
-                  <strong>conocimiento futbolistico real</strong>. Ya no es solo acertar el ganador —
-                  cada gol que predices con exactitud suma puntos, incluso si fallas el resultado global:
-                </p>
-                <table style="width:100%;font-size:12px;color:#1e3a5f;border-collapse:collapse;">
-                  <thead>
-                    <tr style="border-bottom:1px solid #bfdbfe;">
-                      <th style="padding:5px 4px 5px 0;text-align:left;font-weight:600;color:#1e40af;">Situacion</th>
-                      <th style="padding:5px 0;text-align:left;font-weight:600;color:#1e40af;">Ejemplo</th>
-                      <th style="padding:5px 0;text-align:right;font-weight:600;color:#1e40af;">Puntos</th>
-                    </tr>
-                  </thead>
-                  <tbody>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x1F3AF; Marcador exacto</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predices 2-1, cae 2-1</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">10 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x1F4CA; Diferencia de goles correcta</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predices 3-1, cae 4-2</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">8 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x2705; Resultado correcto + un equipo exacto</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predices 2-0, cae 3-0</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">6 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x1F3C6; Resultado correcto unicamente</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predices 1-0, cae 3-1</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">5 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x26A0;&#xFE0F; Resultado fallado, pero un equipo exacto</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predices 2-1, cae 0-1</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#d97706;">1 pt</td>
-                    </tr>
-                    <tr>
-                      <td style="padding:5px 4px 5px 0;">&#x274C; Sin aciertos</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predices 2-0, cae 0-3</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#dc2626;">0 pts</td>
-                    </tr>
-                  </tbody>
-                </table>
-                <p style="margin:12px 0 0;font-size:12px;color:#1e40af;font-style:italic;">
-                  La diferencia entre el primero y el ultimo puede cambiar con un solo marcador exacto.
-                  ¡Cada partido de la eliminatoria cuenta!
-                </p>
-              </div>
-            </div>
-
-            <div style="text-align:center;margin-top:20px;">
-              <a href="{cta_url}" style="background:#1d4ed8;color:white;padding:11px 28px;border-radius:8px;
-                 text-decoration:none;font-size:14px;font-weight:700;display:inline-block;">
-                Ver sala &rarr;
-              </a>
-            </div>
-          </div>
-
-          <!-- ===== ENGLISH ===== -->
-          <div>
-
-            <h2 style="margin:0 0 4px;font-size:20px;color:#111827;">{BALL} Group Stage — Partial Standings</h2>
-            <p style="margin:0 0 6px;font-size:13px;color:#6b7280;">
-              The group stage is over. Here are the points accumulated so far in <strong>{sala.nombre}</strong>.
-            </p>
-            <div style="background:#fef9c3;border:1px solid #fde047;border-radius:6px;padding:10px 14px;margin-bottom:20px;">
-              <p style="margin:0;font-size:12px;color:#713f12;">
-                &#x26A0;&#xFE0F; <strong>Partial standings:</strong> these points cover the group stage only.
-                The competition runs all the way through the Round of 16, Quarter-finals, Semi-finals,
-                and the Final — until a <strong>World Champion</strong> is crowned in your room. All points accumulate!
-              </p>
-            </div>
-
-            <!-- Podium callout -->
-            <div style="background:#fefce8;border:1px solid #fde68a;border-radius:8px;padding:16px 20px;margin-bottom:20px;">
-              <p style="margin:0 0 6px;font-size:15px;font-weight:700;color:#92400e;">
-                🥇 Group leader: <span style="color:#1d4ed8;">{first_name}</span>
-              </p>
-              {"" if not second else f'<p style="margin:0 0 6px;font-size:13px;color:#374151;">🥈 {second_name} &mdash; {second_gap} point{"s" if second_gap != 1 else ""} behind the leader</p>'}
-              {"" if not third else f'<p style="margin:0;font-size:13px;color:#374151;">🥉 {third_name} &mdash; {third_gap} point{"s" if third_gap != 1 else ""} behind the leader</p>'}
-            </div>
-
-            <!-- Full standings table -->
-            <table style="width:100%;border-collapse:collapse;border:1px solid #e5e7eb;border-radius:8px;overflow:hidden;">
-              <thead>
-                <tr style="background:#f9fafb;">
-                  <th style="padding:10px 12px;font-size:12px;color:#6b7280;text-align:left;font-weight:600;">POS</th>
-                  <th style="padding:10px 12px;font-size:12px;color:#6b7280;text-align:left;font-weight:600;">PLAYER</th>
-                  <th style="padding:10px 12px;font-size:12px;color:#6b7280;text-align:right;font-weight:600;">POINTS (GROUP STAGE)</th>
-                </tr>
-              </thead>
-              <tbody>
-                {_standings_rows('en')}
-              </tbody>
-            </table>
-
-            <!-- New scoring callout EN -->
-            <div style="margin-top:20px;border:1px solid #bfdbfe;border-radius:8px;overflow:hidden;">
-              <div style="background:#1d4ed8;padding:10px 16px;">
-                <p style="margin:0;font-size:13px;font-weight:700;color:white;">&#x1F195; New scoring system — starting from the Round of 16</p>
-              </div>
-              <div style="padding:14px 16px;background:#eff6ff;">
-                <p style="margin:0 0 10px;font-size:12px;color:#1e3a5f;">
-                  From the Round of 16 onwards, the scoring system changes to reward
-                  <strong>real football knowledge</strong>. It's no longer just about picking the winner —
-                  every goal you predict correctly earns you points, even if you miss the overall result:
-                </p>
-                <table style="width:100%;font-size:12px;color:#1e3a5f;border-collapse:collapse;">
-                  <thead>
-                    <tr style="border-bottom:1px solid #bfdbfe;">
-                      <th style="padding:5px 4px 5px 0;text-align:left;font-weight:600;color:#1e40af;">Situation</th>
-                      <th style="padding:5px 0;text-align:left;font-weight:600;color:#1e40af;">Example</th>
-                      <th style="padding:5px 0;text-align:right;font-weight:600;color:#1e40af;">Points</th>
-                    </tr>
-                  </thead>
-                  <tbody>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x1F3AF; Exact score</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predict 2-1, ends 2-1</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">10 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x1F4CA; Correct goal difference</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predict 3-1, ends 4-2</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">8 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x2705; Correct outcome + one team exact</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predict 2-0, ends 3-0</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">6 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x1F3C6; Correct outcome only</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predict 1-0, ends 3-1</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#16a34a;">5 pts</td>
-                    </tr>
-                    <tr style="border-bottom:1px solid #dbeafe;">
-                      <td style="padding:5px 4px 5px 0;">&#x26A0;&#xFE0F; Wrong outcome, but one team exact</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predict 2-1, ends 0-1</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#d97706;">1 pt</td>
-                    </tr>
-                    <tr>
-                      <td style="padding:5px 4px 5px 0;">&#x274C; No match at all</td>
-                      <td style="padding:5px 0;color:#6b7280;">Predict 2-0, ends 0-3</td>
-                      <td style="padding:5px 0;text-align:right;font-weight:700;color:#dc2626;">0 pts</td>
-                    </tr>
-                  </tbody>
-                </table>
-                <p style="margin:12px 0 0;font-size:12px;color:#1e40af;font-style:italic;">
-                  The gap between first and last can flip with a single exact score.
-                  Every knockout match counts!
-                </p>
-              </div>
-            </div>
-
-            <div style="text-align:center;margin-top:20px;">
-              <a href="{cta_url}" style="background:#1d4ed8;color:white;padding:11px 28px;border-radius:8px;
-                 text-decoration:none;font-size:14px;font-weight:700;display:inline-block;">
-                View room &rarr;
-              </a>
-            </div>
-          </div>
-
-        </div>
-
-        <div style="background:#f9fafb;border-top:1px solid #e5e7eb;padding:14px 30px;text-align:center;">
-          <p style="margin:0;font-size:11px;color:#9ca3af;">
-            FriendlyBet &middot; Sports Predictions with Friends
-          </p>
-        </div>
-      </div>
-    </body>
-    </html>
-    """
+    # Standings: one grouped aggregate joined on the match round (shared,
+    # cached leaderboard), regardless of the number of members
+    standings = leaderboard.tabla(sala, ronda_patron=ronda_patron, miembros=members,
+                                  liga_id=liga_id)
+
+    # Podio y tabla: se renderizan una vez por sala y se reutilizan para
+    # todos los destinatarios
+    medals = ['🥇', '🥈', '🥉']
+    leader_pts = standings[0]['puntos'] if standings else 0
+    rows = [{
+        'medal': medals[i] if i < 3 else f'{i + 1}.',
+        'nombre': entry['usuario'].nombre_usuario,
+        'puntos': entry['puntos'],
+        'gap': leader_pts - entry['puntos'],
+    } for i, entry in enumerate(standings)]
+
+    context = {
+        'sala_nombre': sala.nombre,
+        'first_name': rows[0]['nombre'] if rows else '—',
+        'second': rows[1] if len(rows) > 1 else None,
+        'third': rows[2] if len(rows) > 2 else None,
+        'standings': rows,
+        'standings_rows': mark_safe(
+            _template('emails/phase_standings_rows.html').render({'standings': rows})),
+        'cta_url': getattr(settings, 'FRONTEND_URL', 'https://friendlybet.260569.xyz'),
+    }
+    html_message = _template('emails/phase_transition.html').render(context)
+    plain_message = _template('emails/phase_transition.txt').render(context)
 
     subject = f'[FriendlyBet] {sala.nombre} — Fase de Grupos / Group Stage Results'
-    plain_message = _strip(html_message)
-
-    sent = 0
-    failed = 0
-    for m in members:
-        user = m.id_usuario
-        if not user.email_verified:
-            continue
-        try:
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.correo],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            logger.info(f"Phase transition email sent to {user.correo} (sala={sala.nombre})")
-            sent += 1
-        except Exception as e:
-            logger.error(f"Failed to send phase transition email to {user.correo}: {e}")
-            failed += 1
+    messages = [
+        email_message(m.id_usuario.correo, subject, html_message, body=plain_message)
+        for m in members if m.id_usuario.email_verified
+    ]
+
+    # Una sola conexion SMTP para toda la sala; los rechazados se reintentan
+    # una vez por separado
+    result = send_bulk(messages)
+    sent = result['sent']
+    for m in result['failed']:
+        retry = send_bulk([m])
+        sent += retry['sent']
+    failed = len(messages) - sent
+    logger.info(
+        f"Phase transition email for sala={sala.nombre}: {sent} sent, {failed} failed "
+        f"({result['per_second']} msg/s)"
+    )
 
     return {'sent': sent, 'failed': failed}
@@ -0,0 +1,82 @@
+"""
+Tabla de posiciones de una sala (ApuestaFutbol).
+
+Una sola query agregada (GROUP BY usuario) por sala y filtro de ronda, en
+lugar de un SUM por miembro. El resultado se guarda en cache bajo la
+version de puntos de la sala (ver response_cache): signals.py la incrementa
+cuando se guarda o borra una apuesta, y el codigo que actualiza apuestas con
+`bulk_update()` debe llamar a `invalidar()`.
+
+La usan RankingViewSet.actual, la notificacion de nuevo lider, el ranking
+periodico de procesar_partidos_finalizados y el resumen de fase de grupos.
+"""
+from django.db.models import Count, Q, Sum
+
+from .models import ApuestaFutbol, ApuestaStatus, UsuarioSala
+from . import response_cache
+
+VERSION_PREFIX = 'sala_puntos:'
+
+
+def _version_nombre(sala_id):
+    return f'{VERSION_PREFIX}{sala_id}'
+
+
+def invalidar(sala_ids):
+    """Marca como viejas las tablas cacheadas de esas salas"""
+    for sala_id in set(sala_ids):
+        response_cache.bump(_version_nombre(sala_id))
+
+
+def _calcular(sala_id, ronda_patron, liga_id):
+    qs = ApuestaFutbol.objects.filter(id_sala_id=sala_id)
+    if ronda_patron:
+        qs = qs.filter(id_partido__ronda__icontains=ronda_patron)
+    if liga_id:
+        qs = qs.filter(id_partido__id_liga_id=liga_id)
+    filas = qs.values('id_usuario').annotate(
+        puntos=Sum('puntos_ganados', filter=Q(estado=ApuestaStatus.GANADA)),
+        total_apuestas=Count('id_apuesta'),
+        apuestas_ganadas=Count('id_apuesta', filter=Q(estado=ApuestaStatus.GANADA)),
+        apuestas_perdidas=Count('id_apuesta', filter=Q(estado=ApuestaStatus.PERDIDA)),
+    )
+    return {
+        f['id_usuario']: (f['puntos'] or 0, f['total_apuestas'],
+                          f['apuestas_ganadas'], f['apuestas_perdidas'])
+        for f in filas
+    }
+
+
+def puntos_por_usuario(sala_id, ronda_patron=None, liga_id=None):
+    """
+    {id_usuario: (puntos, total_apuestas, ganadas, perdidas)} de la sala.
+    `ronda_patron` filtra por ApiPartido.ronda (icontains), ej. 'group';
+    `liga_id` limita a los partidos de una liga.
+    """
+    version = response_cache.version(_version_nombre(sala_id))
+    clave = response_cache.response_key(
+        'leaderboard', sala_id, ronda_patron or '', liga_id or '', version)
+    return response_cache.cached(clave, lambda: _calcular(sala_id, ronda_patron, liga_id))
+
+
+def tabla(sala, ronda_patron=None, miembros=None, liga_id=None):
+    """
+    Miembros de la sala ordenados por puntos (descendente):
+    [{'usuario', 'puntos', 'total_apuestas', 'apuestas_ganadas', 'apuestas_perdidas'}]
+    `miembros` permite pasar UsuarioSala ya cargados (con id_usuario).
+    """
+    if miembros is None:
+        miembros = UsuarioSala.objects.filter(id_sala=sala).select_related('id_usuario')
+    stats = puntos_por_usuario(sala.id_sala, ronda_patron, liga_id)
+    filas = []
+    for miembro in miembros:
+        puntos, total, ganadas, perdidas = stats.get(miembro.id_usuario_id, (0, 0, 0, 0))
+        filas.append({
+            'usuario': miembro.id_usuario,
+            'puntos': puntos,
+            'total_apuestas': total,
+            'apuestas_ganadas': ganadas,
+            'apuestas_perdidas': perdidas,
+        })
+    filas.sort(key=lambda f: f['puntos'], reverse=True)
+    return filas
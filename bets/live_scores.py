@@ -0,0 +1,89 @@
+"""
+Marcadores en vivo: de la sincronizacion (update_sofascore_football) a los
+clientes conectados por WebSocket.
+
+Cada cambio de marcador o estado se registra como un delta compacto (solo
+los campos que cambiaron). Dentro de un `lote()` (un tick de
+sincronizacion) los deltas se acumulan por partido y al cerrar el lote se
+envia UN mensaje por grupo:
+- `partido_{id}` (LiveMatchConsumer, ws/partidos/<id>/): evento 'marcador'
+  con el delta del partido.
+- `sala_{id}` (NotificationConsumer): evento 'marcadores' con los deltas de
+  todos los partidos de la sala que cambiaron en el tick.
+
+Asi una rafaga de actualizaciones cuesta un broadcast por grupo, sin
+importar cuantos clientes esten mirando. Fuera de un lote cada `registrar()`
+se envia de inmediato.
+"""
+import threading
+from contextlib import contextmanager
+
+from . import realtime
+
+CAMPOS = ('estado', 'goles_local', 'goles_visitante')
+
+_local = threading.local()
+
+
+def grupo_partido(partido_id):
+    return f'partido_{partido_id}'
+
+
+def estado_partido(partido):
+    """Estado completo (para el cliente que recien se conecta)"""
+    return {'partido_id': partido.id_partido, **{c: getattr(partido, c) for c in CAMPOS}}
+
+
+@contextmanager
+def lote():
+    """Acumula los deltas registrados y los envia coalescidos al salir"""
+    if getattr(_local, 'pendientes', None) is not None:  # Lote anidado: lo maneja el de afuera
+        yield
+        return
+    _local.pendientes = {}
+    try:
+        yield
+    finally:
+        pendientes, _local.pendientes = _local.pendientes, None
+        _enviar(pendientes)
+
+
+def registrar(partido, campos=CAMPOS):
+    """Registra que cambiaron `campos` del partido"""
+    pendientes = getattr(_local, 'pendientes', None)
+    if pendientes is None:
+        _enviar({partido.id_partido: (partido, set(campos))})
+        return
+    _, previos = pendientes.get(partido.id_partido, (None, set()))
+    pendientes[partido.id_partido] = (partido, previos | set(campos))
+
+
+def _salas_por_partido(partidos):
+    """{partido_id: [sala_id]} con las salas donde se puede apostar cada partido"""
+    from .eligibility import configs_salas
+    from .models import Sala
+
+    configs = configs_salas(Sala.objects.values_list('id_sala', flat=True))
+    return {
+        p.id_partido: [s for s, c in configs.items() if c.admite(p.id_liga_id, p.id_partido)]
+        for p in partidos
+    }
+
+
+def _enviar(pendientes):
+    if not pendientes:
+        return
+    deltas = {}
+    for partido_id, (partido, campos) in pendientes.items():
+        delta = {'partido_id': partido_id}
+        delta.update((c, getattr(partido, c)) for c in CAMPOS if c in campos)
+        deltas[partido_id] = delta
+        realtime.publicar_grupos([grupo_partido(partido_id)], 'marcador', delta)
+
+    por_sala = {}
+    salas = _salas_por_partido(p for p, _ in pendientes.values())
+    for partido_id, sala_ids in salas.items():
+        for sala_id in sala_ids:
+            por_sala.setdefault(sala_id, []).append(deltas[partido_id])
+    for sala_id, lista in por_sala.items():
+        realtime.publicar_salas([sala_id], 'marcadores', {'sala_id': sala_id, 'partidos': lista})
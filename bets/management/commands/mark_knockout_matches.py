@@ -18,6 +18,7 @@ import logging
 from django.core.management.base import BaseCommand
 
 from bets.models import ApiPartido
+from bets import response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -116,7 +117,10 @@ class Command(BaseCommand):
             self.stdout.write(f'  … and {count - 20} more')
 
         if not dry_run and count:
+            ligas = set(qs.values_list('id_liga_id', flat=True))
             updated = qs.update(is_knockout=True)
+            # update() no dispara signals: invalidar respuestas cacheadas a mano
+            response_cache.bump_ligas(ligas)
             self.stdout.write(self.style.SUCCESS(f'Updated {updated} matches to is_knockout=True'))
         elif dry_run:
             self.stdout.write(self.style.WARNING('Dry run — nothing saved'))
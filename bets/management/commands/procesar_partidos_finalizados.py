@@ -24,8 +24,8 @@ Uso:
 
 from django.core.management.base import BaseCommand
 from django.db.models import Q, Sum
-from django.db import models
 from django.utils import timezone
+from bets import leaderboard, realtime
 from bets.models import (
     ApiPartido, ApuestaFutbol, Usuario, Ranking, Sala,
     PartidoStatus, ApuestaStatus
@@ -225,6 +225,9 @@ class Command(BaseCommand):
             for sala_id in salas_afectadas:
                 self.actualizar_ranking_sala(sala_id)
 
+            # Avisar a los clientes conectados de esas salas
+            realtime.resultados({sala_id: [partido.id_partido] for sala_id in salas_afectadas})
+
         self.stats['partidos_procesados'] += 1
 
     def actualizar_ranking_sala(self, sala_id):
@@ -241,16 +244,13 @@ class Command(BaseCommand):
             # Obtener todos los miembros de la sala
             miembros = UsuarioSala.objects.filter(id_sala=sala).select_related('id_usuario')
 
+            # Puntos de todos los miembros en una sola query agregada
+            stats = leaderboard.puntos_por_usuario(sala.id_sala)
+
             # Crear o actualizar ranking para cada miembro
             for miembro in miembros:
                 usuario = miembro.id_usuario
-
-                # Calcular puntos totales del usuario en esta sala
-                puntos_sala = ApuestaFutbol.objects.filter(
-                    id_usuario=usuario,
-                    id_sala=sala,
-                    estado=ApuestaStatus.GANADA
-                ).aggregate(total=models.Sum('puntos_ganados'))['total'] or 0
+                puntos_sala = stats.get(usuario.id_usuario, (0,))[0]
 
                 # Crear o actualizar registro de ranking
                 ranking, created = Ranking.objects.update_or_create(
@@ -20,12 +20,10 @@ Usage:
 import logging
 
 from django.core.management.base import BaseCommand
-from django.db.models import Sum
 
+from bets import leaderboard
 from bets.models import (
     ApiPartido,
-    ApuestaFutbol,
-    ApuestaStatus,
     PartidoStatus,
     Sala,
     SalaNotificacion,
@@ -116,8 +114,6 @@ class Command(BaseCommand):
             '✅ GATE PASS: todos los partidos de grupo están finalizados.\n'
         ))
 
-        group_ids = list(group_qs.values_list('id_partido', flat=True))
-
         # ── Obtener salas a procesar ──
         salas_qs = Sala.objects.filter(estado=True)
         if sala_id:
@@ -133,7 +129,7 @@ class Command(BaseCommand):
         stats = {'sent': 0, 'skipped': 0, 'failed': 0}
 
         for sala in salas:
-            result = self._procesar_sala(sala, group_ids, dry_run)
+            result = self._procesar_sala(sala, patron, liga_id, dry_run)
             for key in stats:
                 stats[key] += result.get(key, 0)
 
@@ -146,7 +142,7 @@ class Command(BaseCommand):
         self.stdout.write('=' * 70 + '\n')
 
     # ------------------------------------------------------------------
-    def _procesar_sala(self, sala, group_ids, dry_run):
+    def _procesar_sala(self, sala, patron, liga_id, dry_run):
         """
         Procesa una sala individual.  Devuelve dict con claves sent/skipped/failed.
         """
@@ -167,20 +163,9 @@ class Command(BaseCommand):
             self.stdout.write('   Sin miembros. Saltando.')
             return {'skipped': 1}
 
-        standings = []
-        for m in miembros:
-            pts = (
-                ApuestaFutbol.objects.filter(
-                    id_sala=sala,
-                    id_usuario=m.id_usuario,
-                    id_partido_id__in=group_ids,
-                    estado=ApuestaStatus.GANADA,
-                ).aggregate(total=Sum('puntos_ganados'))['total']
-                or 0
-            )
-            standings.append({'usuario': m.id_usuario, 'puntos': pts})
-
-        standings.sort(key=lambda x: x['puntos'], reverse=True)
+        # Una query agregada por sala (tabla compartida con el email)
+        standings = leaderboard.tabla(sala, ronda_patron=patron, miembros=miembros,
+                                      liga_id=liga_id)
 
         # Mostrar top-3 en consola
         medals = ['🥇', '🥈', '🥉']
@@ -202,7 +187,7 @@ class Command(BaseCommand):
         # ── Enviar email vía capa de servicio ──
         try:
             from bets.email_service import send_phase_transition_email
-            result = send_phase_transition_email(sala.id_sala)
+            result = send_phase_transition_email(sala.id_sala, patron, liga_id)
             sent = result.get('sent', 0)
             failed = result.get('failed', 0)
         except Exception as exc:
@@ -40,6 +40,7 @@ from bets.utils.sofascore_api import (
     get_event,
 )
 from bets.models import ApiPartido, ApiEquipo, ApiLiga, PartidoStatus
+from bets import live_scores
 
 
 class Command(BaseCommand):
@@ -93,19 +94,21 @@ class Command(BaseCommand):
             'errors': 0,
         }
 
-        if update_all:
-            # Actualizar todos los partidos en BD
-            self.stdout.write("   Modo: Actualizar TODOS los partidos en BD\n")
-            self.update_all_fixtures(league_id, only_pending)
-        else:
-            # Actualizar por rango de fechas
-            self.stdout.write(f"   Días hacia atrás: {days_back}")
-            self.stdout.write(f"   Días hacia adelante: {days_forward}")
-            if league_id:
-                self.stdout.write(f"   Liga filtrada: ID {league_id}")
-            self.stdout.write("")
+        # Los cambios de marcador se envían a los clientes al final (un mensaje por grupo)
+        with live_scores.lote():
+            if update_all:
+                # Actualizar todos los partidos en BD
+                self.stdout.write("   Modo: Actualizar TODOS los partidos en BD\n")
+                self.update_all_fixtures(league_id, only_pending)
+            else:
+                # Actualizar por rango de fechas
+                self.stdout.write(f"   Días hacia atrás: {days_back}")
+                self.stdout.write(f"   Días hacia adelante: {days_forward}")
+                if league_id:
+                    self.stdout.write(f"   Liga filtrada: ID {league_id}")
+                self.stdout.write("")
 
-            self.update_by_date_range(days_back, days_forward, league_id, only_pending)
+                self.update_by_date_range(days_back, days_forward, league_id, only_pending)
 
         # Mostrar resumen
         self.stdout.write("\n" + "="*80)
@@ -277,6 +280,7 @@ class Command(BaseCommand):
         """Actualiza un partido existente con datos de SofaScore"""
 
         changed = False
+        marcador = set()  # Campos de marcador/estado que cambiaron
 
         # Extraer datos del evento
         status_data = event.get('status', {})
@@ -297,6 +301,7 @@ class Command(BaseCommand):
         # Actualizar estado si cambió
         if partido.estado != nuevo_estado:
             partido.estado = nuevo_estado
+            marcador.add('estado')
             changed = True
 
         # Actualizar marcadores si están disponibles
@@ -308,10 +313,12 @@ class Command(BaseCommand):
 
         if goles_local is not None and partido.goles_local != goles_local:
             partido.goles_local = goles_local
+            marcador.add('goles_local')
             changed = True
 
         if goles_visitante is not None and partido.goles_visitante != goles_visitante:
             partido.goles_visitante = goles_visitante
+            marcador.add('goles_visitante')
             changed = True
 
         # Actualizar timestamp
@@ -326,6 +333,8 @@ class Command(BaseCommand):
         if changed:
             partido.ultima_actualizacion = timezone.now()
             partido.save()
+            if marcador:
+                live_scores.registrar(partido, marcador)
 
             score_str = f"{partido.goles_local or '-'} - {partido.goles_visitante or '-'}"
             self.stdout.write(
@@ -24,13 +24,13 @@ Uso:
 
 from django.core.management.base import BaseCommand, CommandError
 
+from bets import worldcup_standings
 from bets.models import ApiLiga, ApiPartido, ApiEquipo, PartidoStatus
 from bets.worldcup_bracket import (
-    FIXTURE_ID_BASE, GROUPS, R32_TEMPLATE, KO_TEMPLATE, THIRD_ASSIGN,
+    FIXTURE_ID_BASE, GROUPS, R32_TEMPLATE, KO_TEMPLATE, mask_combo,
 )
 
 TBD_API_ID = 9049
-MATCHES_PER_GROUP = 6
 
 
 class Command(BaseCommand):
@@ -85,41 +85,26 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('   [DRY RUN — no se guarda nada]'))
         self.stdout.write('=' * 70 + '\n')
 
-        # ── 1. Posiciones por grupo (solo partidos finalizados) ─────────
-        tables = {g: {} for g in GROUPS}
-        finished = {g: 0 for g in GROUPS}
+        # ── 1. Posiciones por grupo (motor compartido con tablero/juego) ─
+        # Se leen de la BD, no de la cache: lo que se escribe aqui es permanente
+        estado = worldcup_standings.construir(liga.id_liga)
+        equipos = {}
         for p in partidos:
-            ronda = p.ronda or ''
-            if not ronda.startswith('Group'):
-                continue
-            letter = ronda[6:7]
-            if letter not in tables:
-                continue
-            for eq in (p.equipo_local, p.equipo_visitante):
-                tables[letter].setdefault(eq.id_equipo, {
-                    'eq': eq, 'gf': 0, 'gc': 0, 'pts': 0})
-            if p.estado != PartidoStatus.FINALIZADO or p.goles_local is None:
-                continue
-            finished[letter] += 1
-            h = tables[letter][p.equipo_local.id_equipo]
-            a = tables[letter][p.equipo_visitante.id_equipo]
-            gl, gv = p.goles_local, p.goles_visitante
-            h['gf'] += gl; h['gc'] += gv
-            a['gf'] += gv; a['gc'] += gl
-            if gl > gv:
-                h['pts'] += 3
-            elif gl < gv:
-                a['pts'] += 3
-            else:
-                h['pts'] += 1; a['pts'] += 1
+            equipos[p.equipo_local.id_equipo] = p.equipo_local
+            equipos[p.equipo_visitante.id_equipo] = p.equipo_visitante
+
+        def equipo_de(row):
+            return equipos.get(row['team']['id_equipo']) if row['team'] else None
+
+        def con_equipo(row):
+            return dict(row, eq=equipo_de(row))
 
-        self.sorted_tables = {}
-        for letter, rows in tables.items():
-            lst = sorted(rows.values(), key=lambda r: (
-                -r['pts'], -(r['gf'] - r['gc']), -r['gf'], r['eq'].nombre))
-            self.sorted_tables[letter] = lst
-        self.group_complete = {g: finished[g] >= MATCHES_PER_GROUP for g in GROUPS}
-        self.all_complete = all(self.group_complete.values())
+        tablas = estado.tablas()
+        self.sorted_tables = {
+            letter: [con_equipo(r) for r in rows] for letter, rows in tablas.items()
+        }
+        self.group_complete = {g: estado.completo(g) for g in GROUPS}
+        self.all_complete = estado.todos_completos
 
         done = sum(1 for g in GROUPS if self.group_complete[g])
         self.stdout.write(f'   Grupos completos: {done}/12\n')
@@ -127,19 +112,11 @@ class Command(BaseCommand):
         # ── 2. Asignacion de terceros (solo si los 12 terminaron) ───────
         self.third_map = {}
         if self.all_complete:
-            thirds = []
-            for letter, rows in self.sorted_tables.items():
-                if len(rows) >= 3:
-                    t = rows[2]
-                    thirds.append((letter, t))
-            thirds.sort(key=lambda x: (
-                -x[1]['pts'], -(x[1]['gf'] - x[1]['gc']), -x[1]['gf'],
-                x[1]['eq'].nombre))
-            best8 = thirds[:8]
-            combo = ''.join(sorted(l for l, _ in best8))
-            assign = THIRD_ASSIGN.get(combo)
+            thirds = estado.terceros(tablas)
+            mask, assign = estado.asignacion_terceros(thirds)
+            combo = mask_combo(mask)
             if assign:
-                third_by_group = {l: t['eq'] for l, t in thirds}
+                third_by_group = {t['group']: equipo_de(t) for t in thirds}
                 self.third_map = {slot: third_by_group[grp]
                                   for slot, grp in assign.items()}
                 self.stdout.write(self.style.SUCCESS(
@@ -1,15 +1,13 @@
-from django.utils import timezone
-from django.conf import settings
-from rest_framework.authtoken.models import Token
-from datetime import timedelta
 from django.http import JsonResponse
-from django.core.cache import cache
+
+from . import auth_cache
 
 
 class TokenExpirationMiddleware:
     """
-    Valida la expiración de tokens. El resultado se cachea en Redis para
-    evitar una query a MySQL en cada request autenticado.
+    Valida la expiración de tokens. El estado del token se cachea en Redis
+    (auth_cache) con una LRU local delante; CachedTokenAuthentication lee la
+    misma entrada, asi que el request autenticado no toca MySQL.
     """
     def __init__(self, get_response):
         self.get_response = get_response
@@ -19,39 +17,13 @@ class TokenExpirationMiddleware:
 
         if auth_header.startswith('Token '):
             token_key = auth_header.split(' ')[1]
-            cache_key = f'token_valid:{token_key}'
-
-            cached_state = cache.get(cache_key)
 
-            if cached_state == 'expired':
+            # Token inexistente: Django lo manejará en la vista
+            if auth_cache.estado_token(token_key) == auth_cache.EXPIRADO:
                 return JsonResponse(
                     {"error": "Token expirado", "code": "token_expired"},
                     status=401
                 )
 
-            if cached_state is None:
-                # Cache miss: consultar la BD una sola vez
-                try:
-                    token = Token.objects.get(key=token_key)
-                    expiration_hours = getattr(settings, 'TOKEN_EXPIRATION_HOURS', 24)
-                    token_age = timezone.now() - token.created
-
-                    if token_age > timedelta(hours=expiration_hours):
-                        token.delete()
-                        cache.set(cache_key, 'expired', 60)
-                        return JsonResponse(
-                            {"error": "Token expirado", "code": "token_expired"},
-                            status=401
-                        )
-
-                    # Cachear como válido hasta 5 minutos antes de expirar
-                    remaining = timedelta(hours=expiration_hours) - token_age
-                    ttl = max(int(remaining.total_seconds()) - 300, 60)
-                    ttl = min(ttl, 300)
-                    cache.set(cache_key, 'valid', ttl)
-
-                except Token.DoesNotExist:
-                    pass  # Django lo manejará en la vista
-
         response = self.get_response(request)
         return response
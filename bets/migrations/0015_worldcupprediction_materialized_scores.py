@@ -0,0 +1,67 @@
+# Generated manually for WorldCupPrediction materialized scores (Django 5.2.5)
+#
+# Las filas existentes quedan sin resolver (resolved_winners y scored_version
+# NULL): game_ranking resuelve y puntua cada una la primera vez. No se usa
+# codigo de la app aqui para que la migracion no cambie si worldcup_game cambia.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0014_apipartido_knockout_result_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='resolved_winners',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='score_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='score_groups',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='score_thirds',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='score_knockout',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='exact_positions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='champion_pick',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='champion_correct',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='scored_version',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='worldcupprediction',
+            name='scored_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
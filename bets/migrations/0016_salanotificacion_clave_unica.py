@@ -0,0 +1,23 @@
+"""
+Migration: add SalaNotificacion.clave_unica.
+
+Unique key for notifications created by scheduled tasks (match reminders use
+'recordatorio:{sala}:{partido}'), so concurrent or repeated runs cannot
+insert duplicates. NULL for every other notification.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0015_worldcupprediction_materialized_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salanotificacion',
+            name='clave_unica',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+"""
+Migration: MensajeChat.fecha_envio uses default=timezone.now instead of
+auto_now_add.
+
+Chat messages are persisted in batches by a write-behind buffer
+(bets/chat_buffer.py); auto_now_add would overwrite the real send time with
+the flush time. No schema change in the database.
+"""
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0016_salanotificacion_clave_unica'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mensajechat',
+            name='fecha_envio',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,22 @@
+"""
+Migration: composite index on mensajes_chat (id_sala, fecha_envio, id_mensaje).
+
+Backs the keyset pagination of the chat history
+(MensajeChatViewSet.historial): each "load older" page is an index range
+scan regardless of how far back it starts.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bets', '0017_mensajechat_fecha_envio_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mensajechat',
+            index=models.Index(fields=['id_sala', 'fecha_envio', 'id_mensaje'], name='mensajes_sala_cursor_idx'),
+        ),
+    ]
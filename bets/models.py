@@ -703,7 +703,8 @@ class MensajeChat(models.Model):
     id_sala = models.ForeignKey(Sala, on_delete=models.CASCADE, db_column='id_sala')
     id_usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, db_column='id_usuario')
     contenido = models.TextField()
-    fecha_envio = models.DateTimeField(auto_now_add=True)
+    # default (no auto_now_add): la escritura diferida (chat_buffer) guarda la hora de envío real
+    fecha_envio = models.DateTimeField(default=timezone.now)
     estado = models.CharField(max_length=10, choices=MensajeStatus.choices, default=MensajeStatus.ACTIVO)
     
     def __str__(self):
@@ -717,6 +718,8 @@ class MensajeChat(models.Model):
             models.Index(fields=['id_sala']),
             models.Index(fields=['id_usuario']),
             models.Index(fields=['fecha_envio']),
+            # Paginacion por cursor del historial (chat_history.pagina)
+            models.Index(fields=['id_sala', 'fecha_envio', 'id_mensaje'], name='mensajes_sala_cursor_idx'),
 # [MermaidChart: b67144a3-89b0-4a02-8112-a740c05d5b93]
         ]
 
@@ -807,6 +810,8 @@ class SalaNotificacion(models.Model):
     fecha = models.DateTimeField(auto_now_add=True)
     usuario_relacionado = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, db_column='usuario_relacionado')
     partido_relacionado = models.ForeignKey(ApiPartido, on_delete=models.SET_NULL, null=True, blank=True, db_column='partido_relacionado')
+    # Identifica notificaciones generadas por tareas (ej. 'recordatorio:{sala}:{partido}') para no duplicarlas
+    clave_unica = models.CharField(max_length=100, unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"{self.id_sala.nombre} - {self.tipo}: {self.mensaje[:50]}"
@@ -920,6 +925,23 @@ class WorldCupPrediction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Bracket resuelto {"73": "Nombre equipo", ...}: se recalcula al guardar
+    # la prediccion (signals.py). None = aun no resuelto.
+    resolved_winners = models.JSONField(null=True, blank=True)
+    # Puntaje materializado contra actual_results; scored_version es la
+    # version de datos del Mundial con la que se calculo (None = pendiente)
+    score_total = models.IntegerField(default=0)
+    score_groups = models.IntegerField(default=0)
+    score_thirds = models.IntegerField(default=0)
+    score_knockout = models.IntegerField(default=0)
+    exact_positions = models.IntegerField(default=0)
+    champion_pick = models.CharField(max_length=100, null=True, blank=True)
+    champion_correct = models.BooleanField(default=False)
+    scored_version = models.BigIntegerField(null=True, blank=True)
+    # updated_at de la prediccion al puntuar: si no coincide, la prediccion
+    # cambio mientras se puntuaba y se vuelve a puntuar
+    scored_updated_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         return f"WC2026 {self.usuario.nombre_usuario}"
 
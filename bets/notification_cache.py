@@ -0,0 +1,125 @@
+"""
+Cache de notificaciones de sala: ultimas N por sala y contadores de no leidas.
+
+- `notif_top:{sala}`: las TOP_N notificaciones mas recientes de la sala ya
+  serializadas. Se invalida cuando se crea o borra una notificacion de la
+  sala; en frio se reconstruyen todas las salas que faltan en 1 query.
+- `notif_no_leidas:{usuario}:{sala}`: cuantas de esas TOP_N no vio el
+  usuario. Crear una notificacion incrementa el contador de cada miembro
+  (fan-out al escribir) y `marcar_vistas()` lo pone en 0. Si el contador no
+  existe se calcula con la lista cacheada y `ultima_notificacion_vista`, sin
+  ir a la BD. Al leerlo se acota al largo de la lista.
+
+Como las notificaciones se muestran de la mas nueva a la mas vieja, las no
+leidas son siempre las primeras `no_leidas` de la lista.
+
+signals.py llama a `registrar_nuevas()` / `invalidar()` para cada
+SalaNotificacion guardada o borrada. `bulk_create()` no dispara signals: el
+codigo que lo use debe llamar a `registrar_nuevas()` despues.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import SalaNotificacion, UsuarioSala
+
+TOP_N = 10
+TOP_PREFIX = 'notif_top:'
+NO_LEIDAS_PREFIX = 'notif_no_leidas:'
+CACHE_TTL = 60 * 60 * 24 * 7  # La invalidacion es explicita; el TTL es solo un respaldo
+
+
+def _top_key(sala_id):
+    return f'{TOP_PREFIX}{sala_id}'
+
+
+def _no_leidas_key(usuario_id, sala_id):
+    return f'{NO_LEIDAS_PREFIX}{usuario_id}:{sala_id}'
+
+
+def _serializar(n):
+    return {
+        'id': n.id_notificacion,
+        'tipo': n.tipo,
+        'mensaje': n.mensaje,
+        'icono': n.icono,
+        'color': n.color,
+        'fecha': n.fecha,
+    }
+
+
+def ultimas(sala_ids):
+    """{sala_id: [notificacion, ...]} con las TOP_N mas recientes de cada sala"""
+    claves = {_top_key(s): s for s in sala_ids}
+    encontradas = cache.get_many(claves.keys())
+    resultado = {claves[k]: v for k, v in encontradas.items()}
+    faltan = [s for s in sala_ids if s not in resultado]
+    if faltan:
+        filas = (
+            SalaNotificacion.objects
+            .filter(id_sala_id__in=faltan)
+            .annotate(fila=Window(
+                RowNumber(),
+                partition_by=F('id_sala_id'),
+                order_by=(F('fecha').desc(), F('id_notificacion').desc()),
+            ))
+            .filter(fila__lte=TOP_N)
+            .order_by('id_sala_id', 'fila')
+        )
+        nuevas = {s: [] for s in faltan}
+        for n in filas:
+            nuevas[n.id_sala_id].append(_serializar(n))
+        cache.set_many({_top_key(s): v for s, v in nuevas.items()}, CACHE_TTL)
+        resultado.update(nuevas)
+    return resultado
+
+
+def no_leidas(memberships, top):
+    """
+    {sala_id: no_leidas} para las membresias de un usuario. `top` es el
+    resultado de `ultimas()` para esas salas.
+    """
+    claves = {_no_leidas_key(m.id_usuario_id, m.id_sala_id): m for m in memberships}
+    encontradas = cache.get_many(claves.keys())
+    resultado = {}
+    for clave, m in claves.items():
+        valor = encontradas.get(clave)
+        if valor is None:
+            vista = m.ultima_notificacion_vista
+            valor = sum(1 for n in top[m.id_sala_id] if vista is None or n['fecha'] > vista)
+            cache.add(clave, valor, CACHE_TTL)
+        resultado[m.id_sala_id] = min(valor, len(top[m.id_sala_id]))
+    return resultado
+
+
+def registrar_nuevas(sala_ids):
+    """
+    Una notificacion nueva por cada aparicion de la sala en `sala_ids`:
+    invalida la lista de la sala e incrementa el contador de cada miembro.
+    Los contadores que no existen se dejan asi (se calculan al leerlos).
+    """
+    por_sala = Counter(sala_ids)
+    cache.delete_many([_top_key(s) for s in por_sala])
+    miembros = UsuarioSala.objects.filter(id_sala_id__in=por_sala).values_list(
+        'id_usuario_id', 'id_sala_id')
+    for usuario_id, sala_id in miembros:
+        clave = _no_leidas_key(usuario_id, sala_id)
+        try:
+            cache.incr(clave, por_sala[sala_id])
+        except ValueError:  # Sin contador: se calcula en la siguiente lectura
+            pass
+
+
+def invalidar(sala_id):
+    """
+    Una notificacion de la sala se borro: la lista se reconstruye al leer.
+    Los contadores se acotan al largo de la lista al leerlos.
+    """
+    cache.delete(_top_key(sala_id))
+
+
+def marcar_vistas(usuario_id, sala_ids):
+    """El usuario vio las notificaciones de esas salas"""
+    cache.set_many({_no_leidas_key(usuario_id, s): 0 for s in sala_ids}, CACHE_TTL)
@@ -0,0 +1,74 @@
+"""
+Presencia en el chat de cada sala, solo en Redis (sin escrituras a MySQL).
+
+`presencia:{sala}` es un sorted set: miembro `{usuario}|{canal}` (una
+entrada por conexion WebSocket, un usuario puede tener varias pestañas) y
+score = ultimo latido (epoch). ChatConsumer registra la conexion, renueva el
+latido con cada 'heartbeat' del cliente y la quita al desconectarse. Las
+entradas sin latido por mas de HEARTBEAT_TTL (conexiones caidas sin
+disconnect) se descartan al leer.
+
+`conectar()` / `desconectar()` dicen si el usuario paso a estar en linea o
+dejo de estarlo, para difundir 'entro' / 'salio' solo una vez por usuario.
+"""
+import time
+
+from .redis_client import get_client
+
+HEARTBEAT_TTL = 60  # El cliente envia 'heartbeat' cada ~25 s
+KEY_PREFIX = 'presencia:'
+
+
+def _key(sala_id):
+    return f'{KEY_PREFIX}{sala_id}'
+
+
+def _miembro(usuario_id, canal):
+    return f'{usuario_id}|{canal}'
+
+
+def _vigentes(pipe, key, ahora):
+    pipe.zremrangebyscore(key, '-inf', ahora - HEARTBEAT_TTL)
+    pipe.zrange(key, 0, -1)
+
+
+def _usuarios(miembros):
+    return {int(m.decode().split('|', 1)[0]) for m in miembros}
+
+
+def _registrar(sala_id, usuario_id, canal):
+    """Actualiza el latido y devuelve los usuarios en linea antes y despues"""
+    key, ahora = _key(sala_id), time.time()
+    pipe = get_client().pipeline(transaction=True)
+    _vigentes(pipe, key, ahora)
+    pipe.zadd(key, {_miembro(usuario_id, canal): ahora})
+    pipe.expire(key, HEARTBEAT_TTL * 2)
+    _, antes, _, _ = pipe.execute()
+    return _usuarios(antes)
+
+
+def conectar(sala_id, usuario_id, canal):
+    """Registra la conexion. True si el usuario no estaba en linea."""
+    return usuario_id not in _registrar(sala_id, usuario_id, canal)
+
+
+def latido(sala_id, usuario_id, canal):
+    _registrar(sala_id, usuario_id, canal)
+
+
+def desconectar(sala_id, usuario_id, canal):
+    """Quita la conexion. True si el usuario ya no tiene otras abiertas."""
+    key = _key(sala_id)
+    pipe = get_client().pipeline(transaction=True)
+    pipe.zrem(key, _miembro(usuario_id, canal))
+    _vigentes(pipe, key, time.time())
+    _, _, despues = pipe.execute()
+    return usuario_id not in _usuarios(despues)
+
+
+def en_linea(sala_id):
+    """IDs de los usuarios conectados a la sala"""
+    pipe = get_client().pipeline(transaction=True)
+    _vigentes(pipe, _key(sala_id), time.time())
+    _, miembros = pipe.execute()
+    return sorted(_usuarios(miembros))
@@ -0,0 +1,95 @@
+"""
+Eventos en tiempo real por WebSocket (NotificationConsumer, ws/notificaciones/).
+
+Cada conexion se une al grupo de su usuario (`usuario_{id}`) y al de cada
+sala a la que pertenece (`sala_{id}`). El codigo sincrono (signals, tareas,
+comandos) publica aqui eventos que llegan a los clientes a traves del
+channel layer de Redis, en lugar de que los clientes consulten
+mis_notificaciones / rankings/actual periodicamente.
+
+Eventos (campo 'type' del mensaje que recibe el cliente):
+- 'notificacion': nueva SalaNotificacion de la sala
+- 'marcadores': deltas de marcador/estado de los partidos de la sala, uno
+  por tick de sincronizacion (ver live_scores)
+- 'resultados': apuestas de la sala resueltas; la tabla cambio
+- 'nuevo_lider': cambio de lider de la sala (ademas de su notificacion)
+- 'sala_agregada' / 'sala_removida': el usuario entro o salio de una sala
+  (el consumer actualiza sus grupos)
+
+Publicar nunca rompe al que publica: si el channel layer no esta disponible
+se registra y se sigue. Los eventos se envian al confirmar la transaccion.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def grupo_usuario(usuario_id):
+    return f'usuario_{usuario_id}'
+
+
+def grupo_sala(sala_id):
+    return f'sala_{sala_id}'
+
+
+def _enviar(grupos, evento, data):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    mensaje = {'type': 'push.evento', 'evento': evento, 'data': data}
+    try:
+        for grupo in grupos:
+            async_to_sync(layer.group_send)(grupo, mensaje)
+    except Exception as e:
+        logger.warning(f'⚠️ No se pudo publicar {evento}: {e}')
+
+
+def publicar_grupos(grupos, evento, data):
+    grupos = list(grupos)
+    if grupos:
+        transaction.on_commit(lambda: _enviar(grupos, evento, data))
+
+
+def publicar_salas(sala_ids, evento, data):
+    """Envia `evento` a los miembros conectados de esas salas"""
+    publicar_grupos((grupo_sala(s) for s in set(sala_ids)), evento, data)
+
+
+def publicar_usuario(usuario_id, evento, data):
+    publicar_grupos([grupo_usuario(usuario_id)], evento, data)
+
+
+def notificacion_creada(notificacion):
+    publicar_salas([notificacion.id_sala_id], 'notificacion', {
+        'id': notificacion.id_notificacion,
+        'sala_id': notificacion.id_sala_id,
+        'tipo': notificacion.tipo,
+        'mensaje': notificacion.mensaje,
+        'icono': notificacion.icono,
+        'color': notificacion.color,
+        'fecha': notificacion.fecha.isoformat(),
+    })
+
+
+def resultados(partidos_por_sala):
+    """{sala_id: ids de partidos con apuestas resueltas}"""
+    for sala_id, partido_ids in partidos_por_sala.items():
+        publicar_salas([sala_id], 'resultados', {
+            'sala_id': sala_id,
+            'partidos': sorted(partido_ids),
+        })
+
+
+def nuevo_lider(sala_id, usuario, puntos):
+    publicar_salas([sala_id], 'nuevo_lider', {
+        'sala_id': sala_id,
+        'usuario': {
+            'id_usuario': usuario.id_usuario,
+            'nombre_usuario': usuario.nombre_usuario,
+        },
+        'puntos': puntos,
+    })
@@ -0,0 +1,19 @@
+"""
+Cliente Redis compartido (settings.REDIS_URL).
+
+La cache de Django solo expone get/set/incr; las estructuras que necesitan
+operaciones atomicas propias de Redis (listas acotadas con LTRIM, etc.) usan
+este cliente. Una sola instancia por proceso: redis-py mantiene su propio
+pool de conexiones y es seguro entre hilos.
+"""
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URL)
+    return _client
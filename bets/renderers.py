@@ -0,0 +1,67 @@
+"""
+Renderer y parser JSON de alto rendimiento para los endpoints de lectura
+mas consultados (tablero del Mundial, rankings, notificaciones, proximos
+partidos).
+
+Usan orjson, que serializa datetime/date/UUID de forma nativa y es varias
+veces mas rapido que el json de la libreria estandar. orjson es opcional:
+si no esta instalado ambas clases se comportan exactamente como el
+JSONRenderer / JSONParser de DRF.
+
+Uso:
+    @api_view(['GET'])
+    @renderer_classes([ORJSONRenderer])
+    def mi_vista(request): ...
+
+    @action(detail=False, methods=['get'], renderer_classes=[ORJSONRenderer])
+    def mi_accion(self, request): ...
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+
+if orjson is not None:
+    # OPT_UTC_Z: '+00:00' -> 'Z', igual que DateTimeField de DRF.
+    # OPT_NON_STR_KEYS: varias vistas devuelven dicts con claves int
+    # (ej. numero de partido), que json de la stdlib convierte a str.
+    ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+else:
+    ORJSON_OPTIONS = 0
+
+_drf_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """Tipos que orjson no conoce (Decimal, lazy strings, QuerySet...)
+    se delegan al encoder de DRF para mantener la misma salida."""
+    return _drf_encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer de DRF acelerado con orjson (mismo media type)."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser de DRF acelerado con orjson."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,101 @@
+"""
+Cache de respuestas versionada por liga.
+
+Cada liga tiene una "version de datos" en cache que se incrementa (signals.py)
+cada vez que se guarda o borra un ApiPartido de esa liga. Las respuestas se
+cachean bajo una clave que incluye esa version: cuando un partido cambia, la
+clave cambia y la siguiente lectura reconstruye la respuesta. No hay TTL fijo
+que deje datos viejos; los TTL que se usan aqui solo acotan memoria o marcan
+el momento en que la respuesta deja de ser valida por el paso del tiempo.
+
+Ademas de la version por liga existe una version global ('*') para las
+respuestas que dependen de partidos de cualquier liga. El mismo mecanismo
+sirve para otras fuentes de datos con nombre propio (ver `bump`).
+
+IMPORTANTE: `QuerySet.update()` y `bulk_update()` no disparan signals; el
+codigo que modifique partidos asi debe llamar a `bump_ligas()`.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+VERSION_PREFIX = 'liga_version:'
+RESPONSE_PREFIX = 'resp:'
+TODAS = '*'
+VERSION_TTL = None  # Las versiones no expiran
+RESPONSE_TTL = 60 * 60 * 24  # Respaldo para liberar memoria de claves huerfanas
+
+
+def _version_key(liga_id):
+    return f'{VERSION_PREFIX}{liga_id}'
+
+
+def _nueva_version():
+    # Basada en el reloj: si la clave de version se pierde (flush de Redis) no
+    # se reutiliza un numero viejo que apunte a respuestas desactualizadas.
+    return time.time_ns() // 1000
+
+
+def versiones(liga_ids):
+    """{liga_id: version} para varias ligas (incluye TODAS si se pide)"""
+    claves = {_version_key(liga_id): liga_id for liga_id in liga_ids}
+    encontradas = cache.get_many(claves.keys())
+    resultado = {claves[k]: v for k, v in encontradas.items()}
+    for clave, liga_id in claves.items():
+        if liga_id not in resultado:
+            cache.add(clave, _nueva_version(), VERSION_TTL)
+            resultado[liga_id] = cache.get(clave)
+    return resultado
+
+
+def version(liga_id):
+    return versiones([liga_id])[liga_id]
+
+
+def bump_ligas(liga_ids):
+    """
+    Invalida las respuestas de esas ligas y las globales.
+    Devuelve {liga_id: version nueva}; None si la version se reinicio (no
+    habia clave), en cuyo caso no hay una version anterior de la cual partir.
+    """
+    return {liga_id: bump(liga_id) for liga_id in set(liga_ids) | {TODAS}}
+
+
+def bump(nombre):
+    """
+    Incrementa una version (de liga u otra fuente de datos, ej. las
+    predicciones del Mundial). Devuelve la version nueva, o None si no
+    existia y se reinicio.
+    """
+    clave = _version_key(nombre)
+    try:
+        return cache.incr(clave)
+    except ValueError:  # La clave no existe todavia
+        cache.set(clave, _nueva_version(), VERSION_TTL)
+        return None
+
+
+def response_key(nombre, *partes):
+    """Clave compacta para una respuesta; `partes` incluye las versiones"""
+    crudo = ':'.join(str(p) for p in partes)
+    digest = hashlib.blake2b(crudo.encode(), digest_size=16).hexdigest()
+    return f'{RESPONSE_PREFIX}{nombre}:{digest}'
+
+
+def cached(clave, construir, timeout=RESPONSE_TTL):
+    """
+    Devuelve la respuesta cacheada o la construye con `construir()`.
+    `construir` puede devolver (data, timeout) para fijar un TTL propio.
+    """
+    data = cache.get(clave)
+    if data is not None:
+        return data
+    resultado = construir()
+    if isinstance(resultado, tuple):
+        data, timeout = resultado
+    else:
+        data = resultado
+    if timeout is None or timeout > 0:
+        cache.set(clave, data, timeout)
+    return data
@@ -3,4 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<room_id>\w+)/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/notificaciones/$', consumers.NotificationConsumer.as_asgi()),
+    re_path(r'ws/partidos/(?P<partido_id>\d+)/$', consumers.LiveMatchConsumer.as_asgi()),
 ]
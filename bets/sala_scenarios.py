@@ -0,0 +1,256 @@
+"""
+Escenarios del ranking de una sala: "¿todavia puedo ganar?".
+
+Para cada miembro calcula la mejor y la peor posicion final posibles
+considerando todos los marcadores que pueden tener los partidos que quedan
+(los que tienen apuestas pendientes en la sala).
+
+Por partido solo importa el vector de puntos que deja a cada miembro
+(calcular_puntos_futbol con las reglas de cada apuesta). Una grilla acotada
+de marcadores (0..2*max_goles_predichos+2) produce todos los vectores
+distintos posibles: fuera de ella ningun marcador cambia igualdades de
+goles, diferencia ni ganador respecto de las predicciones.
+
+La busqueda es branch-and-bound por miembro:
+- se trabaja con la diferencia de puntos de cada rival respecto del miembro,
+- por partido se descartan los marcadores dominados (Pareto),
+- la cota usa, para cada rival, la mejor/peor diferencia alcanzable en los
+  partidos que faltan (sumas sufijas precalculadas),
+- los rivales ya decididos (siempre arriba / siempre abajo) salen del
+  problema y los partidos que quedan se vuelven a filtrar sobre el resto.
+Si se agota NODE_BUDGET se devuelve la mejor solucion encontrada junto con
+la cota y `exacto: False`.
+
+Posiciones: la mejor cuenta solo a los rivales con mas puntos (empates a
+favor); la peor cuenta tambien los empates en contra.
+
+Los bonus de eliminatoria (tiempo extra / penales, calcular_bonus_ko) no se
+modelan: dependen de datos del partido que no son el marcador.
+"""
+import json
+
+import numpy as np
+
+from .models import ApuestaFutbol, ApuestaStatus, PartidoStatus, UsuarioSala
+from .points_management.scoring import calcular_puntos_futbol
+
+NODE_BUDGET = 20_000  # nodos por miembro y sentido (mejor / peor)
+
+
+def _puntos_grilla(pl, pv, reglas, tope, memo):
+    """Puntos de una prediccion para cada marcador de la grilla (aplanada)"""
+    clave = (pl, pv, tope, json.dumps(reglas, sort_keys=True) if reglas else None)
+    grilla = memo.get(clave)
+    if grilla is None:
+        grilla = np.array([calcular_puntos_futbol(pl, pv, gl, gv, reglas)
+                           for gl in range(tope + 1) for gv in range(tope + 1)],
+                          dtype=np.int64)
+        memo[clave] = grilla
+    return grilla
+
+
+def _opciones_partido(apuestas, indice, memo):
+    """
+    Vectores de puntos distintos (n_opciones x n_miembros) que puede dejar un
+    partido. `apuestas`: [(id_usuario, pred_local, pred_visit, reglas)].
+    """
+    tope = 2 * max(max(a[1], a[2]) for a in apuestas) + 2
+    matriz = np.zeros(((tope + 1) ** 2, len(indice)), dtype=np.int64)
+    for id_usuario, pl, pv, reglas in apuestas:
+        matriz[:, indice[id_usuario]] += _puntos_grilla(pl, pv, reglas, tope, memo)
+    return np.unique(matriz, axis=0)
+
+
+def _pareto(opciones, mejor):
+    """Quita opciones dominadas o repetidas (mejor: menor es mejor; peor: mayor es mejor)"""
+    if len(opciones) == 1:
+        return opciones
+    o = opciones if mejor else -opciones
+    # a <= b en todo: a domina a b, o son iguales (se conserva la primera)
+    menor_igual = (o[:, None, :] <= o[None, :, :]).all(axis=2)
+    iguales = menor_igual & menor_igual.T
+    domina = menor_igual & ~iguales
+    repetida = np.triu(iguales, k=1)
+    descartar = (domina | repetida).any(axis=0)
+    return opciones[~descartar]
+
+
+def _preparar(gap, diffs, mejor):
+    """
+    Restringe las opciones a los rivales de `gap`: quita dominadas, aplica
+    los partidos que quedan con una sola opcion y ordena por dispersion.
+    Devuelve (gap, diffs, suf_min, suf_max).
+    """
+    restantes = []
+    for d in diffs:
+        d = _pareto(d, mejor)
+        if len(d) == 1:
+            gap = gap + d[0]
+        else:
+            restantes.append(d)
+    # Partidos con mas dispersion primero: las cotas se ajustan antes
+    restantes.sort(key=lambda d: -(d.max(axis=0) - d.min(axis=0)).sum())
+    suf_min = np.zeros((len(restantes) + 1, len(gap)), dtype=np.int64)
+    suf_max = np.zeros((len(restantes) + 1, len(gap)), dtype=np.int64)
+    for k in range(len(restantes) - 1, -1, -1):
+        suf_min[k] = suf_min[k + 1] + restantes[k].min(axis=0)
+        suf_max[k] = suf_max[k + 1] + restantes[k].max(axis=0)
+    return gap, restantes, suf_min, suf_max
+
+
+class _Busqueda:
+    """
+    Branch-and-bound para un miembro. Cada fila de `diffs[k]` son los
+    puntos_rival - puntos_miembro de un marcador del partido k; `gap` es la
+    diferencia actual.
+    Mejor caso: minimizar rivales con diferencia final > 0.
+    Peor caso: maximizar rivales con diferencia final >= 0.
+    En cada nodo los rivales ya decididos salen del problema; si cambian, las
+    opciones de los partidos que faltan se vuelven a filtrar (Pareto) sobre
+    los rivales abiertos, lo que colapsa la ramificacion rapidamente.
+    """
+
+    def __init__(self, mejor):
+        self.mejor = mejor
+        self.nodos = 0
+        self.agotado = False
+        self.incumbente = None
+
+    def _es_mejor(self, a, b):
+        return b is None or (a < b if self.mejor else a > b)
+
+    def _clasificar(self, gap, suf_min, suf_max):
+        """(rivales que ya quedan arriba, mascara de rivales abiertos)"""
+        if self.mejor:
+            arriba = gap + suf_min > 0
+            abiertos = ~arriba & (gap + suf_max > 0)
+        else:
+            arriba = gap + suf_min >= 0
+            abiertos = ~arriba & (gap + suf_max >= 0)
+        return int(arriba.sum()), abiertos
+
+    def resolver(self, gap, diffs):
+        """(valor, cota): mejor valor encontrado y cota de la raiz"""
+        gap, diffs, suf_min, suf_max = _preparar(gap, diffs, self.mejor)
+        fijos, abiertos = self._clasificar(gap, suf_min[0], suf_max[0])
+        cota = fijos if self.mejor else fijos + int(abiertos.sum())
+        self._dfs(gap, diffs, suf_min, suf_max, 0, 0)
+        return self.incumbente, cota
+
+    def _dfs(self, gap, diffs, suf_min, suf_max, k, fijos):
+        if self.nodos >= NODE_BUDGET:
+            self.agotado = True
+            return
+        self.nodos += 1
+
+        arriba, abiertos = self._clasificar(gap, suf_min[k], suf_max[k])
+        fijos += arriba
+        n_abiertos = int(abiertos.sum())
+        cota = fijos if self.mejor else fijos + n_abiertos
+        if not self._es_mejor(cota, self.incumbente):
+            return
+        if n_abiertos == 0:
+            self.incumbente = fijos
+            return
+        if n_abiertos < len(gap):
+            gap, diffs, suf_min, suf_max = _preparar(
+                gap[abiertos], [d[:, abiertos] for d in diffs[k:]], self.mejor)
+            k = 0
+            if not diffs:
+                self._dfs(gap, diffs, suf_min, suf_max, k, fijos)
+                return
+
+        # Hijos ordenados por su cota (y por la diferencia total como desempate)
+        hijos = gap[None, :] + diffs[k]
+        if self.mejor:
+            extremos = hijos + suf_min[k + 1]
+            cotas = (extremos > 0).sum(axis=1)
+            orden = np.lexsort((extremos.sum(axis=1), cotas))
+        else:
+            extremos = hijos + suf_max[k + 1]
+            cotas = (extremos >= 0).sum(axis=1)
+            orden = np.lexsort((-extremos.sum(axis=1), -cotas))
+        for i in orden:
+            if self.nodos >= NODE_BUDGET:
+                self.agotado = True
+                return
+            if not self._es_mejor(fijos + int(cotas[i]), self.incumbente):
+                break
+            self._dfs(hijos[i], diffs, suf_min, suf_max, k + 1, fijos)
+
+
+def _rango(puntos, opciones, i, mejor):
+    """(posicion, exacto) mejor o peor para el miembro i"""
+    rivales = [j for j in range(len(puntos)) if j != i]
+    if not rivales:
+        return 1, True
+    gap = np.array([puntos[j] - puntos[i] for j in rivales], dtype=np.int64)
+    diffs = [(o[:, rivales] - o[:, [i]]) for o in opciones]
+
+    busqueda = _Busqueda(mejor)
+    valor, cota = busqueda.resolver(gap, diffs)
+    if valor is None:  # presupuesto agotado sin ninguna hoja: se informa la cota
+        return 1 + cota, False
+    exacto = not busqueda.agotado or valor == cota
+    return 1 + valor, exacto
+
+
+def calcular_escenarios(sala):
+    """
+    Mejor y peor posicion final posible de cada miembro de la sala.
+    Devuelve (filas, partidos_restantes); filas ordenadas por puntos.
+    """
+    miembros = list(
+        UsuarioSala.objects.filter(id_sala=sala).select_related('id_usuario')
+    )
+    usuarios = [m.id_usuario for m in miembros]
+    indice = {u.id_usuario: i for i, u in enumerate(usuarios)}
+    puntos = [0] * len(usuarios)
+
+    # Una sola query: todas las apuestas de la sala (puntos ya ganados + pendientes)
+    apuestas = ApuestaFutbol.objects.filter(id_sala=sala, id_usuario__in=list(indice)).exclude(
+        estado=ApuestaStatus.CANCELADA
+    ).values_list(
+        'id_usuario', 'id_partido', 'estado', 'puntos_ganados',
+        'prediccion_local', 'prediccion_visitante', 'reglas_puntuacion',
+        'id_partido__estado', 'id_partido__goles_local', 'id_partido__goles_visitante',
+    )
+    pendientes = {}
+    for (id_usuario, id_partido, estado, ganados, pl, pv, reglas,
+         estado_partido, gl, gv) in apuestas:
+        i = indice[id_usuario]
+        if estado != ApuestaStatus.PENDIENTE:
+            puntos[i] += ganados or 0
+        elif estado_partido == PartidoStatus.FINALIZADO and gl is not None and gv is not None:
+            # Resultado conocido pero aun no procesado: puntos ya determinados
+            puntos[i] += calcular_puntos_futbol(pl, pv, gl, gv, reglas)
+        elif estado_partido != PartidoStatus.CANCELADO:
+            pendientes.setdefault(id_partido, []).append((id_usuario, pl, pv, reglas))
+
+    memo = {}
+    opciones = [_opciones_partido(a, indice, memo) for a in pendientes.values()]
+    maximos = [puntos[i] + sum(int(o[:, i].max()) for o in opciones)
+               for i in range(len(usuarios))]
+
+    filas = []
+    for i, usuario in enumerate(usuarios):
+        mejor, exacto_mejor = _rango(puntos, opciones, i, mejor=True)
+        peor, exacto_peor = _rango(puntos, opciones, i, mejor=False)
+        filas.append({
+            'usuario': {
+                'id_usuario': usuario.id_usuario,
+                'nombre_usuario': usuario.nombre_usuario,
+                'foto_perfil': usuario.foto_perfil,
+            },
+            'puntos': puntos[i],
+            'puntos_maximos': maximos[i],
+            'mejor_posicion': mejor,
+            'peor_posicion': peor,
+            'puede_ganar': mejor == 1,
+            'exacto': exacto_mejor and exacto_peor,
+        })
+
+    filas.sort(key=lambda f: f['puntos'], reverse=True)
+    for idx, fila in enumerate(filas, start=1):
+        fila['posicion'] = idx
+    return filas, len(pendientes)
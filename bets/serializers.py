@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 import secrets
@@ -13,7 +14,6 @@ from .models import (
     RoomInvitation
 )
 from .validators import validate_username, validate_password, validate_email, validate_name, validate_lastname, validate_phoneNum
-from .email_service import send_verification_email
 
 class ApiPaisSerializer(serializers.ModelSerializer):
     class Meta:
@@ -96,18 +96,14 @@ class UsuarioCreateSerializer(serializers.ModelSerializer):
         )
 
         # Send verification email in background so the registration request
-        # returns immediately (SMTP can take >10s and the frontend times out)
-        import threading
+        # returns immediately (SMTP can take >10s and the frontend times out).
+        # Se encola al confirmar la transaccion: el worker ya ve el token.
+        from .tasks import send_verification_email_task
 
-        def _send_email_async(correo=usuario.correo, tk=token, nombre=usuario.nombre_usuario):
-            try:
-                send_verification_email(correo, tk, nombre)
-            except Exception as e:
-                import logging
-                logging.getLogger(__name__).error(
-                    f"Failed to send verification email to {correo}: {str(e)}")
-
-        threading.Thread(target=_send_email_async, daemon=True).start()
+        correo, nombre = usuario.correo, usuario.nombre_usuario
+        transaction.on_commit(
+            lambda: send_verification_email_task.delay(correo, token, nombre)
+        )
 
         # Auto-join room if a valid invite token was provided
         if invite_token:
@@ -204,6 +200,34 @@ class ApiJugadorSerializer(serializers.ModelSerializer):
         model = ApiJugador
         fields = '__all__'
 
+def equipo_logo_url(equipo, request=None):
+    """Logo de un equipo; las imagenes de SofaScore pasan por el proxy (CORS)"""
+    if not equipo:
+        return None
+
+    logo_url = equipo.logo_url
+
+    # Si no hay logo_url, retornar None (el frontend mostrará fallback)
+    if not logo_url:
+        return None
+
+    # Si es de SofaScore, usar el proxy
+    if 'sofascore.app' in logo_url:
+        parts = logo_url.split('/')
+        if 'team' in parts:
+            try:
+                team_index = parts.index('team')
+                team_id = parts[team_index + 1]
+                if request:
+                    return request.build_absolute_uri(f'/api/proxy/sofascore/team/{team_id}/image')
+                return f'http://localhost:8000/api/proxy/sofascore/team/{team_id}/image'
+            except (ValueError, IndexError):
+                pass
+
+    # Si es de api-sports.io u otra fuente, retornar directamente
+    return logo_url
+
+
 class ApiPartidoSerializer(serializers.ModelSerializer):
     equipo_local_nombre = serializers.ReadOnlyField(source='equipo_local.nombre')
     equipo_visitante_nombre = serializers.ReadOnlyField(source='equipo_visitante.nombre')
@@ -216,59 +240,11 @@ class ApiPartidoSerializer(serializers.ModelSerializer):
 
     def get_equipo_local_logo(self, obj):
         """Retorna el logo del equipo local, priorizando SofaScore con proxy"""
-        if not obj.equipo_local:
-            return None
-
-        logo_url = obj.equipo_local.logo_url
-
-        # Si no hay logo_url, retornar None (el frontend mostrará fallback)
-        if not logo_url:
-            return None
-
-        # Si es de SofaScore, usar el proxy
-        if 'sofascore.app' in logo_url:
-            parts = logo_url.split('/')
-            if 'team' in parts:
-                try:
-                    team_index = parts.index('team')
-                    team_id = parts[team_index + 1]
-                    request = self.context.get('request')
-                    if request:
-                        return request.build_absolute_uri(f'/api/proxy/sofascore/team/{team_id}/image')
-                    return f'http://localhost:8000/api/proxy/sofascore/team/{team_id}/image'
-                except (ValueError, IndexError):
-                    pass
-
-        # Si es de api-sports.io u otra fuente, retornar directamente
-        return logo_url
+        return equipo_logo_url(obj.equipo_local, self.context.get('request'))
 
     def get_equipo_visitante_logo(self, obj):
         """Retorna el logo del equipo visitante, priorizando SofaScore con proxy"""
-        if not obj.equipo_visitante:
-            return None
-
-        logo_url = obj.equipo_visitante.logo_url
-
-        # Si no hay logo_url, retornar None (el frontend mostrará fallback)
-        if not logo_url:
-            return None
-
-        # Si es de SofaScore, usar el proxy
-        if 'sofascore.app' in logo_url:
-            parts = logo_url.split('/')
-            if 'team' in parts:
-                try:
-                    team_index = parts.index('team')
-                    team_id = parts[team_index + 1]
-                    request = self.context.get('request')
-                    if request:
-                        return request.build_absolute_uri(f'/api/proxy/sofascore/team/{team_id}/image')
-                    return f'http://localhost:8000/api/proxy/sofascore/team/{team_id}/image'
-                except (ValueError, IndexError):
-                    pass
-
-        # Si es de api-sports.io u otra fuente, retornar directamente
-        return logo_url
+        return equipo_logo_url(obj.equipo_visitante, self.context.get('request'))
 
     class Meta:
         model = ApiPartido
@@ -477,4 +453,51 @@ class SalaNotificacionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SalaNotificacion
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+# =============================================================================
+# SERIALIZERS LIGEROS DE SOLO LECTURA
+# =============================================================================
+# Para endpoints calientes: construyen dicts planos en lugar de pasar por los
+# Field de DRF (que validan y resuelven `source` campo a campo). Devuelven los
+# datetime sin convertir para que ORJSONRenderer los serialice de forma nativa.
+# Requieren que el queryset venga con select_related de las relaciones usadas.
+
+def partido_dict(partido, request=None):
+    """Misma salida que ApiPartidoSerializer, sin el overhead de DRF."""
+    local = partido.equipo_local
+    visitante = partido.equipo_visitante
+    liga = partido.id_liga
+    venue = partido.id_venue
+    return {
+        'id_partido': partido.id_partido,
+        'equipo_local_nombre': local.nombre,
+        'equipo_visitante_nombre': visitante.nombre,
+        'equipo_local_logo': equipo_logo_url(local, request),
+        'equipo_visitante_logo': equipo_logo_url(visitante, request),
+        'liga_nombre': liga.nombre,
+        'liga_logo': liga.logo_url,
+        'venue_nombre': venue.nombre if venue else None,
+        'venue_ciudad': venue.ciudad if venue else None,
+        'api_fixture_id': partido.api_fixture_id,
+        'temporada': partido.temporada,
+        'fecha': partido.fecha,
+        'ronda': partido.ronda,
+        'goles_local': partido.goles_local,
+        'goles_visitante': partido.goles_visitante,
+        'estado': partido.estado,
+        'tiempo_partido': partido.tiempo_partido,
+        'is_knockout': partido.is_knockout,
+        'resultado_tiene_tiempo_extra': partido.resultado_tiene_tiempo_extra,
+        'resultado_tiene_penales': partido.resultado_tiene_penales,
+        'eventos_cargados': partido.eventos_cargados,
+        'alineaciones_cargadas': partido.alineaciones_cargadas,
+        'estadisticas_cargadas': partido.estadisticas_cargadas,
+        'ultima_actualizacion': partido.ultima_actualizacion,
+        'id_liga': partido.id_liga_id,
+        'equipo_local': partido.equipo_local_id,
+        'equipo_visitante': partido.equipo_visitante_id,
+        'id_venue': partido.id_venue_id,
+        'ganador_penales': partido.ganador_penales_id,
+    }
@@ -1,6 +1,15 @@
-from django.db.models.signals import post_save, pre_save
+import copy
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, pre_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
-from .models import UsuarioSala, Ranking, SalaPartido, SalaLiga, SalaNotificacion, ApuestaFutbol
+from rest_framework.authtoken.models import Token
+from .models import (
+    UsuarioSala, Ranking, Sala, SalaPartido, SalaLiga, SalaNotificacion, ApuestaFutbol, ApiPartido,
+    Usuario, MensajeChat, WorldCupPrediction,
+)
+from . import auth_cache, chat_history, eligibility, leaderboard, notification_cache, realtime, response_cache, worldcup_standings
 
 
 @receiver(post_save, sender=UsuarioSala)
@@ -17,6 +26,53 @@ def crear_notificacion_nuevo_miembro(sender, instance, created, **kwargs):
         )
 
 
+@receiver(post_save, sender=UsuarioSala)
+@receiver(post_delete, sender=UsuarioSala)
+def publicar_membresia(sender, instance, created=False, **kwargs):
+    """La conexión en tiempo real del usuario entra o sale del grupo de la sala"""
+    if kwargs['signal'] is post_delete:
+        realtime.publicar_usuario(instance.id_usuario_id, 'sala_removida', {'sala_id': instance.id_sala_id})
+    elif created:
+        realtime.publicar_usuario(instance.id_usuario_id, 'sala_agregada', {'sala_id': instance.id_sala_id})
+
+
+@receiver(post_save, sender=UsuarioSala)
+@receiver(post_delete, sender=UsuarioSala)
+def invalidar_membresia(sender, instance, **kwargs):
+    """
+    Unirse / salir de la sala cambia la membresía cacheada (auth_cache).
+    Después del commit: antes, otra lectura podría volver a cachear el valor viejo.
+    """
+    usuario_id, sala_id = instance.id_usuario_id, instance.id_sala_id
+    transaction.on_commit(lambda: auth_cache.invalidar_membresia(usuario_id, sala_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidar_token(sender, instance, **kwargs):
+    """Logout, re-login o token expirado"""
+    auth_cache.invalidar_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Usuario)
+def invalidar_usuario(sender, instance, **kwargs):
+    """La entrada del token guarda el User y su perfil (auth_cache)"""
+    user_id = instance.pk if sender is User else instance.user_id
+    if user_id:
+        auth_cache.invalidar_usuario(user_id)
+
+
+@receiver(post_save, sender=MensajeChat)
+@receiver(post_delete, sender=MensajeChat)
+def actualizar_historial_chat(sender, instance, created=False, **kwargs):
+    """Mensaje editado, moderado o borrado: se actualiza su entrada en el historial"""
+    if not created:
+        borrado = kwargs['signal'] is post_delete
+        # delete() deja el pk en None antes del commit: se usa una copia
+        mensaje = copy.copy(instance) if borrado else instance
+        transaction.on_commit(lambda: chat_history.actualizar(mensaje, borrado))
+
+
 @receiver(post_save, sender=SalaPartido)
 def crear_notificacion_nuevo_partido(sender, instance, created, **kwargs):
     """Crear notificación cuando se agrega un nuevo partido individual a la sala"""
@@ -48,30 +104,105 @@ def crear_notificacion_nueva_liga(sender, instance, created, **kwargs):
         )
 
 
+@receiver(post_save, sender=Sala)
+@receiver(post_delete, sender=Sala)
+def invalidar_elegibilidad_sala(sender, instance, **kwargs):
+    """El modo de la sala define qué partidos se pueden apostar"""
+    eligibility.invalidar_sala(instance.id_sala)
+
+
+@receiver(post_save, sender=Sala)
+@receiver(post_delete, sender=Sala)
+def invalidar_nombre_sala_chat(sender, instance, **kwargs):
+    """por_sala devuelve el nombre de la sala desde cache"""
+    chat_history.invalidar_nombre_sala(instance.id_sala)
+
+
+@receiver(post_save, sender=SalaLiga)
+@receiver(post_delete, sender=SalaLiga)
+@receiver(post_save, sender=SalaPartido)
+@receiver(post_delete, sender=SalaPartido)
+def invalidar_elegibilidad_config(sender, instance, **kwargs):
+    """Ligas habilitadas o partidos manuales cambiaron"""
+    eligibility.invalidar_sala(instance.id_sala_id)
+
+
+@receiver(post_save, sender=SalaNotificacion)
+def registrar_notificacion(sender, instance, created, **kwargs):
+    """Fan-out a los contadores de no leídas de los miembros (al confirmar)"""
+    if created:
+        sala_id = instance.id_sala_id
+        transaction.on_commit(lambda: notification_cache.registrar_nuevas([sala_id]))
+        realtime.notificacion_creada(instance)
+
+
+@receiver(post_delete, sender=SalaNotificacion)
+def invalidar_notificaciones(sender, instance, **kwargs):
+    notification_cache.invalidar(instance.id_sala_id)
+
+
+@receiver(post_save, sender=ApiPartido)
+def invalidar_respuestas_liga(sender, instance, **kwargs):
+    """Nueva versión de datos de la liga: invalida tablero, próximos, etc.
+    Las posiciones de grupo cacheadas se actualizan con el delta del partido."""
+    nuevas = response_cache.bump_ligas([instance.id_liga_id])
+    worldcup_standings.aplicar_cambio(instance, nuevas[instance.id_liga_id])
+
+
+@receiver(post_delete, sender=ApiPartido)
+def invalidar_respuestas_liga_borrado(sender, instance, **kwargs):
+    nuevas = response_cache.bump_ligas([instance.id_liga_id])
+    worldcup_standings.aplicar_cambio(instance, nuevas[instance.id_liga_id], borrado=True)
+
+
+@receiver(pre_save, sender=WorldCupPrediction)
+def resolver_prediccion_mundial(sender, instance, **kwargs):
+    """Persistir el bracket resuelto; el puntaje queda pendiente"""
+    from .worldcup_game import refresh_resolved
+    refresh_resolved(instance)
+
+
+@receiver(post_save, sender=WorldCupPrediction)
+@receiver(post_delete, sender=WorldCupPrediction)
+def invalidar_ranking_mundial(sender, instance, **kwargs):
+    from .worldcup_game import PREDICTIONS_VERSION
+    response_cache.bump(PREDICTIONS_VERSION)
+
+
+@receiver(pre_save, sender=Usuario)
+def invalidar_perfiles_ranking_mundial(sender, instance, update_fields=None, **kwargs):
+    """El ranking del Mundial cachea el nombre y la foto de cada jugador"""
+    campos = ('nombre_usuario', 'foto_perfil')
+    if not instance.pk or (update_fields is not None and not set(campos) & set(update_fields)):
+        return
+    anterior = Usuario.objects.filter(pk=instance.pk).values_list(*campos).first()
+    if anterior is not None and anterior != tuple(getattr(instance, c) for c in campos):
+        from .worldcup_game import PROFILES_VERSION
+        transaction.on_commit(lambda: response_cache.bump(PROFILES_VERSION))
+
+
+@receiver(post_save, sender=ApuestaFutbol)
+@receiver(post_delete, sender=ApuestaFutbol)
+def invalidar_tabla_sala(sender, instance, **kwargs):
+    """Debe correr antes que verificar_cambio_lider (orden de registro)"""
+    leaderboard.invalidar([instance.id_sala_id])
+
+
 @receiver(post_save, sender=ApuestaFutbol)
 def verificar_cambio_lider(sender, instance, created, **kwargs):
     """Verificar si hay un cambio de líder cuando se actualiza una apuesta"""
     if not created and instance.estado == 'ganada':  # Solo cuando se procesa una apuesta ganada
-        from django.db.models import Sum, Q
-
         # Obtener el ranking actual de la sala
         sala = instance.id_sala
 
-        # Calcular puntos de todos los usuarios
+        # Puntos de todos los miembros (tabla agregada compartida)
         usuarios_sala = UsuarioSala.objects.filter(id_sala=sala).values_list('id_usuario', flat=True)
+        stats = leaderboard.puntos_por_usuario(sala.id_sala)
 
-        ranking_actual = []
-        for usuario_id in usuarios_sala:
-            puntos = ApuestaFutbol.objects.filter(
-                id_usuario_id=usuario_id,
-                id_sala=sala,
-                estado='ganada'
-            ).aggregate(total=Sum('puntos_ganados'))['total'] or 0
-
-            ranking_actual.append({
-                'usuario_id': usuario_id,
-                'puntos': puntos
-            })
+        ranking_actual = [
+            {'usuario_id': usuario_id, 'puntos': stats.get(usuario_id, (0,))[0]}
+            for usuario_id in usuarios_sala
+        ]
 
         # Ordenar por puntos descendente
         ranking_actual.sort(key=lambda x: x['puntos'], reverse=True)
@@ -99,6 +230,7 @@ def verificar_cambio_lider(sender, instance, created, **kwargs):
                     color='text-yellow-500',
                     usuario_relacionado=nuevo_lider
                 )
+                realtime.nuevo_lider(sala.id_sala, nuevo_lider, ranking_actual[0]['puntos'])
 
 
 @receiver(pre_save, sender=ApuestaFutbol)
@@ -126,6 +126,15 @@ def process_finished_matches():
 
         if apuestas_a_guardar:
             ApuestaFutbol.objects.bulk_update(apuestas_a_guardar, ['puntos_ganados', 'estado'])
+            # bulk_update no dispara signals
+            from bets import leaderboard, realtime
+            leaderboard.invalidar(a.id_sala_id for a in apuestas_a_guardar)
+
+            # Avisar a los clientes conectados de las salas afectadas
+            partidos_por_sala = {}
+            for a in apuestas_a_guardar:
+                partidos_por_sala.setdefault(a.id_sala_id, set()).add(a.id_partido_id)
+            realtime.resultados(partidos_por_sala)
 
         logger.info(f'✅ {len(apuestas_a_guardar)} apuestas procesadas')
         return {
@@ -166,6 +175,106 @@ def cleanup_old_notifications():
         return {'status': 'error', 'error': str(e)}
 
 
+@shared_task(name='generate_match_reminders')
+def generate_match_reminders(hours_ahead=12):
+    """
+    Crea las notificaciones 'recordatorio_partido' de los partidos que empiezan
+    en las próximas `hours_ahead` horas, en cada sala que los incluye.
+    Ejecutar cada 15 minutos
+
+    Una notificación por (sala, partido): `clave_unica` lo garantiza en la BD,
+    así que dos ejecuciones simultáneas no duplican nada.
+    """
+    from bets.models import ApiPartido, SalaNotificacion, UsuarioSala
+    from bets.eligibility import configs_salas
+    from bets import notification_cache, realtime
+
+    logger.info('⏰ Generando recordatorios de partidos próximos')
+    try:
+        ahora = timezone.now()
+        partidos = list(ApiPartido.objects.filter(
+            fecha__gte=ahora,
+            fecha__lte=ahora + timedelta(hours=hours_ahead),
+            estado='programado',
+        ).select_related('equipo_local', 'equipo_visitante'))
+        if not partidos:
+            return {'status': 'success', 'created': 0, 'timestamp': ahora.isoformat()}
+
+        # Salas con miembros; ligas y partidos manuales de cada una (cacheado)
+        sala_ids = set(UsuarioSala.objects.values_list('id_sala_id', flat=True))
+        configs = configs_salas(sala_ids)
+
+        candidatas = {}
+        for sala_id, config in configs.items():
+            for partido in partidos:
+                if config.incluye(partido.id_liga_id, partido.id_partido):
+                    candidatas[f'recordatorio:{sala_id}:{partido.id_partido}'] = (sala_id, partido)
+
+        existentes = set(SalaNotificacion.objects.filter(
+            clave_unica__in=list(candidatas)
+        ).values_list('clave_unica', flat=True))
+
+        nuevas = []
+        for clave, (sala_id, partido) in candidatas.items():
+            if clave in existentes:
+                continue
+            minutos = int((partido.fecha - ahora).total_seconds() / 60)
+            tiempo_texto = f"{minutos // 60}h" if minutos >= 60 else f"{minutos}min"
+            local = partido.equipo_local.nombre if partido.equipo_local else '?'
+            visitante = partido.equipo_visitante.nombre if partido.equipo_visitante else '?'
+            nuevas.append(SalaNotificacion(
+                id_sala_id=sala_id,
+                tipo='recordatorio_partido',
+                mensaje=f"⚽ {local} vs {visitante} empieza en {tiempo_texto} — ¡no olvides apostar!",
+                icono='⏰',
+                color='text-yellow-400',
+                partido_relacionado_id=partido.id_partido,
+                clave_unica=clave,
+            ))
+
+        # ignore_conflicts: si otra ejecución ya insertó alguna, se omite.
+        # Con ignore_conflicts Django no asigna ids: se vuelven a leer por
+        # clave_unica y solo cuentan las filas cuya `fecha` es la que puso
+        # este bulk_create (las de otra ejecución tienen otra).
+        SalaNotificacion.objects.bulk_create(nuevas, batch_size=500, ignore_conflicts=True)
+        fechas = {n.clave_unica: n.fecha for n in nuevas}
+        insertadas = [
+            n for n in SalaNotificacion.objects.filter(clave_unica__in=list(fechas))
+            if n.fecha == fechas[n.clave_unica]
+        ]
+        notification_cache.registrar_nuevas([n.id_sala_id for n in insertadas])
+        for n in insertadas:
+            realtime.notificacion_creada(n)
+
+        logger.info(f'✅ {len(insertadas)} recordatorios creados')
+        return {
+            'status': 'success',
+            'created': len(insertadas),
+            'timestamp': timezone.now().isoformat()
+        }
+    except Exception as e:
+        logger.error(f'❌ Error generando recordatorios: {str(e)}')
+        return {'status': 'error', 'error': str(e)}
+
+
+@shared_task(name='flush_chat_messages')
+def flush_chat_messages():
+    """
+    Guarda en MySQL los mensajes del chat pendientes (bets/chat_buffer.py)
+    Ejecutar cada 5 segundos
+    """
+    from bets import chat_buffer
+
+    try:
+        guardados = chat_buffer.flush()
+        if guardados:
+            logger.info(f'💬 {guardados} mensajes de chat guardados')
+        return {'status': 'success', 'saved': guardados}
+    except Exception as e:
+        logger.error(f'❌ Error guardando mensajes de chat: {str(e)}')
+        return {'status': 'error', 'error': str(e)}
+
+
 @shared_task(name='update_specific_league')
 def update_specific_league(league_id, days_back=1, days_forward=7):
     """
@@ -194,109 +303,198 @@ def send_daily_match_reminders():
     - Matches they have already placed a prediction for (in their salas)
     - Matches other sala members have bet on but they haven't yet
     Runs once a day at 08:00 America/Santiago via Celery Beat.
+
+    Todo se arma con 3 queries (apuestas de mañana de todas las salas,
+    membresías de usuarios verificados en esas salas y el conteo de
+    omitidos), agrupando en memoria por sala y luego por usuario.
     """
-    from bets.models import Usuario, UsuarioSala, ApuestaFutbol, ApiPartido, PartidoStatus
-    from bets.email_service import send_match_reminder_email
-    from datetime import date
+    from bets.models import UsuarioSala, ApuestaFutbol, PartidoStatus
+    from bets.email_service import build_match_reminder_email
 
     logger.info('📧 Starting daily match reminder task')
 
     tomorrow = (timezone.now() + timedelta(days=1)).date()
     tomorrow_str = tomorrow.strftime('%A, %B %d %Y')  # e.g. "Tuesday, June 11 2026"
 
-    # Only users with verified email
-    users = Usuario.objects.filter(email_verified=True).prefetch_related('usuariosala_set')
+    # 1 query: todas las apuestas de mañana, de todas las salas
+    apuestas = ApuestaFutbol.objects.filter(
+        id_partido__fecha__date=tomorrow,
+        id_partido__estado=PartidoStatus.PROGRAMADO,
+    ).select_related(
+        'id_partido__equipo_local',
+        'id_partido__equipo_visitante',
+        'id_partido__id_liga',
+    ).only(
+        'id_usuario', 'id_sala', 'prediccion_local', 'prediccion_visitante',
+        'id_partido__fecha', 'id_partido__equipo_local__nombre',
+        'id_partido__equipo_visitante__nombre', 'id_partido__id_liga__nombre',
+    )
+
+    partidos = {}       # id_partido -> dict base del partido (se arma una vez)
+    por_sala = {}       # id_sala -> {'partidos': set, 'predicciones': {(usuario, partido): 'x-y'}}
+    for bet in apuestas:
+        partido = bet.id_partido
+        if partido.id_partido not in partidos:
+            partidos[partido.id_partido] = {
+                'local': partido.equipo_local.nombre,
+                'visitante': partido.equipo_visitante.nombre,
+                'liga': partido.id_liga.nombre if partido.id_liga else '—',
+                'hora': partido.fecha.strftime('%H:%M'),
+            }
+        sala = por_sala.setdefault(bet.id_sala_id, {'partidos': set(), 'predicciones': {}})
+        sala['partidos'].add(partido.id_partido)
+        sala['predicciones'][(bet.id_usuario_id, partido.id_partido)] = (
+            f'{bet.prediccion_local}-{bet.prediccion_visitante}'
+        )
 
-    sent = 0
-    skipped = 0
+    # 1 query: miembros verificados de las salas con partidos mañana
+    miembros = UsuarioSala.objects.filter(
+        id_sala__in=list(por_sala),
+        id_usuario__email_verified=True,
+    ).select_related('id_usuario', 'id_sala').order_by('id_usuario', 'id_usuario_sala')
+
+    destinatarios = {}  # id_usuario -> (usuario, salas_data)
+    for membership in miembros:
+        user = membership.id_usuario
+        sala = por_sala[membership.id_sala_id]
+        bets_placed, bets_missing = [], []
+        for id_partido in sala['partidos']:
+            pred = sala['predicciones'].get((user.id_usuario, id_partido))
+            if pred is None:
+                bets_missing.append(dict(partidos[id_partido], prediccion=''))
+            else:
+                bets_placed.append(dict(partidos[id_partido], prediccion=pred))
+        bets_placed.sort(key=lambda x: x['hora'])
+        bets_missing.sort(key=lambda x: x['hora'])
+
+        destinatarios.setdefault(user.id_usuario, (user, []))[1].append({
+            'sala_nombre': membership.id_sala.nombre,
+            'bets_placed': bets_placed,
+            'bets_missing': bets_missing,
+        })
+
+    messages = []
+    for user, salas_data in destinatarios.values():
+        message = build_match_reminder_email(
+            user_email=user.correo,
+            username=user.nombre_usuario,
+            salas_data=salas_data,
+            tomorrow_str=tomorrow_str,
+        )
+        if message is not None:
+            messages.append(message)
+    # Solo se encolan: los envios reales los reporta cada send_email_batch
+    batches = dispatch_bulk_email(messages)
+    queued = len(messages)
+
+    # Usuarios verificados con salas pero sin partidos mañana
+    con_salas = UsuarioSala.objects.filter(
+        id_usuario__email_verified=True,
+    ).values('id_usuario').distinct().count()
+    skipped = con_salas - len(destinatarios)
+
+    logger.info(
+        f'Daily match reminders done: {queued} queued in {batches} batches, '
+        f'{skipped} skipped (no matches)'
+    )
+    return {'status': 'success', 'queued': queued, 'batches': batches, 'skipped': skipped}
+
+
+@shared_task(name='simulate_worldcup_projections')
+def simulate_worldcup_projections(n_sims=None, force=False):
+    """
+    Proyecciones Monte Carlo del juego del Mundial (probabilidad de terminar
+    primero y puntaje esperado por usuario). Solo recalcula si cambiaron los
+    resultados o las predicciones desde la ultima corrida.
+    """
+    from bets.worldcup_simulation import refresh_projections
 
-    def partido_to_dict(partido, prediccion_str=''):
+    logger.info('🎲 Simulando proyecciones del Mundial')
+    try:
+        proyecciones, recalculado = refresh_projections(n_sims=n_sims, force=force)
+        if not recalculado:
+            logger.info('⏭️  Proyecciones al dia, sin cambios')
+            return {'status': 'success', 'skipped': True}
+        logger.info(
+            f"✅ {proyecciones['n_sims']} simulaciones para "
+            f"{len(proyecciones['by_user'])} usuarios en {proyecciones['elapsed_ms']} ms"
+        )
         return {
-            'local': partido.equipo_local.nombre,
-            'visitante': partido.equipo_visitante.nombre,
-            'liga': partido.id_liga.nombre if partido.id_liga else '—',
-            'hora': partido.fecha.strftime('%H:%M'),
-            'prediccion': prediccion_str,
+            'status': 'success',
+            'n_sims': proyecciones['n_sims'],
+            'users': len(proyecciones['by_user']),
+            'elapsed_ms': proyecciones['elapsed_ms'],
         }
+    except Exception as e:
+        logger.error(f'❌ Error simulando proyecciones: {str(e)}')
+        return {'status': 'error', 'error': str(e)}
 
-    for user in users:
-        try:
-            memberships = UsuarioSala.objects.filter(
-                id_usuario=user
-            ).select_related('id_sala')
 
-            if not memberships.exists():
-                continue
+def dispatch_bulk_email(messages, batch_size=None):
+    """
+    Reparte los mensajes (email_service.email_message) en lotes y los envia
+    en paralelo como subtareas send_email_batch. Devuelve la cantidad de lotes.
+    """
+    from celery import group
+    from django.conf import settings
 
-            salas_data = []
-
-            for membership in memberships:
-                sala = membership.id_sala
-
-                # 1 query: todas las apuestas de esta sala para mañana
-                # (tanto las de este usuario como las del resto)
-                todas_apuestas = list(
-                    ApuestaFutbol.objects.filter(
-                        id_sala=sala,
-                        id_partido__fecha__date=tomorrow,
-                        id_partido__estado=PartidoStatus.PROGRAMADO,
-                    ).select_related(
-                        'id_partido__equipo_local',
-                        'id_partido__equipo_visitante',
-                        'id_partido__id_liga',
-                    )
-                )
-
-                if not todas_apuestas:
-                    continue
-
-                # Separar en Python sin queries adicionales
-                bets_placed = []
-                all_partido_ids = set()
-                user_partido_ids = set()
-
-                for bet in todas_apuestas:
-                    all_partido_ids.add(bet.id_partido_id)
-                    if bet.id_usuario_id == user.id_usuario:
-                        pred = f'{bet.prediccion_local}-{bet.prediccion_visitante}'
-                        bets_placed.append(partido_to_dict(bet.id_partido, pred))
-                        user_partido_ids.add(bet.id_partido_id)
-
-                missing_ids = all_partido_ids - user_partido_ids
-
-                # 1 query para partidos sin apostar (solo si hay)
-                bets_missing = []
-                if missing_ids:
-                    missing_qs = ApiPartido.objects.filter(
-                        id_partido__in=missing_ids,
-                    ).select_related('equipo_local', 'equipo_visitante', 'id_liga')
-                    bets_missing = [partido_to_dict(p) for p in missing_qs]
-
-                bets_placed.sort(key=lambda x: x['hora'])
-                bets_missing.sort(key=lambda x: x['hora'])
-
-                salas_data.append({
-                    'sala_nombre': sala.nombre,
-                    'bets_placed': bets_placed,
-                    'bets_missing': bets_missing,
-                })
-
-            if not salas_data or all(
-                not s['bets_placed'] and not s['bets_missing'] for s in salas_data
-            ):
-                skipped += 1
-                continue
+    batch_size = batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', 50)
+    lotes = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+    if lotes:
+        group(send_email_batch.s(lote) for lote in lotes).apply_async()
+    return len(lotes)
 
-            send_match_reminder_email(
-                user_email=user.correo,
-                username=user.nombre_usuario,
-                salas_data=salas_data,
-                tomorrow_str=tomorrow_str,
-            )
-            sent += 1
 
-        except Exception as e:
-            logger.error(f'Error sending reminder to {user.correo}: {e}')
+@shared_task(name='send_email_batch')
+def send_email_batch(messages, attempt=0):
+    """
+    Envia un lote de correos sobre una sola conexion SMTP. Las direcciones
+    que fallan se reintentan de a una, con backoff exponencial, hasta
+    EMAIL_MAX_RETRIES veces.
+    """
+    from django.conf import settings
+    from bets.email_service import send_bulk
+
+    result = send_bulk(messages)
+    failed = result['failed']
+    logger.info(
+        f"📨 Lote de {len(messages)} correos (intento {attempt}): {result['sent']} enviados, "
+        f"{len(failed)} fallidos en {result['elapsed_ms']} ms ({result['per_second']} msg/s)"
+    )
+
+    max_retries = getattr(settings, 'EMAIL_MAX_RETRIES', 3)
+    retried = 0
+    abandoned = []
+    for m in failed:
+        if attempt < max_retries:
+            send_email_batch.apply_async(args=[[m], attempt + 1], countdown=60 * 2 ** attempt)
+            retried += 1
+        else:
+            abandoned.append(m['to'])
+    if abandoned:
+        logger.error(f'❌ Correos descartados tras {max_retries} reintentos: {abandoned}')
+
+    return {
+        'status': 'success',
+        'sent': result['sent'],
+        'failed': len(failed),
+        'retried': retried,
+        'elapsed_ms': result['elapsed_ms'],
+        'per_second': result['per_second'],
+    }
+
+
+@shared_task(name='send_verification_email', bind=True, max_retries=3, default_retry_delay=60)
+def send_verification_email_task(self, user_email, verification_token, username):
+    """
+    Correo de verificacion en segundo plano: el registro responde sin esperar
+    al SMTP (que puede tardar >10s).
+    """
+    from bets.email_service import send_verification_email
 
-    logger.info(f'Daily match reminders done: {sent} sent, {skipped} skipped (no matches)')
-    return {'status': 'success', 'sent': sent, 'skipped': skipped}
+    try:
+        send_verification_email(user_email, verification_token, username)
+        return {'status': 'success'}
+    except Exception as e:
+        logger.error(f'❌ Error enviando verificacion a {user_email}: {str(e)}')
+        raise self.retry(exc=e)
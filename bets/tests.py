@@ -1,3 +1,654 @@
-from django.test import TestCase
+import itertools
+import json
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
 
-# Create your tests here.
+import fakeredis
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .models import (
+    ApiEquipo, ApiLiga, ApiPartido, ApuestaFutbol, ApuestaStatus, MensajeChat, PartidoStatus, Sala,
+    SalaNotificacion, Usuario, UsuarioSala, WorldCupPrediction,
+)
+from .points_management.scoring import calcular_puntos_futbol
+from .worldcup_bracket import GROUPS
+from . import (
+    auth_cache, chat_buffer, chat_history, notification_cache, redis_client, sala_scenarios,
+    worldcup_bitset, worldcup_game, worldcup_simulation, worldcup_standings,
+)
+
+
+def _partido(id_partido, letra, local, visitante, gl=None, gv=None):
+    terminado = gl is not None
+    return ApiPartido(
+        id_partido=id_partido,
+        ronda=f'Group {letra} - Matchday 1',
+        equipo_local=local,
+        equipo_visitante=visitante,
+        goles_local=gl,
+        goles_visitante=gv,
+        estado=PartidoStatus.FINALIZADO if terminado else PartidoStatus.PROGRAMADO,
+    )
+
+
+class WorldCupStandingsTests(SimpleTestCase):
+    """El estado incremental (aplicar / revertir) coincide con reconstruirlo"""
+
+    def setUp(self):
+        self.rng = random.Random(2026)
+        self.partidos = {}
+        id_equipo = id_partido = 0
+        for letra in GROUPS:
+            equipos = []
+            for _ in range(4):
+                id_equipo += 1
+                equipos.append(ApiEquipo(id_equipo=id_equipo, nombre=f'{letra}{id_equipo}', api_id=id_equipo))
+            for i in range(4):
+                for j in range(i + 1, 4):
+                    id_partido += 1
+                    self.partidos[id_partido] = _partido(id_partido, letra, equipos[i], equipos[j])
+
+    def _completo(self):
+        estado = worldcup_standings.EstadoGrupos()
+        for partido in self.partidos.values():
+            estado.aplicar(partido)
+        return estado
+
+    def _comparar(self, incremental):
+        completo = self._completo()
+        self.assertEqual(incremental.tablas(), completo.tablas())
+        self.assertEqual(incremental.todos_completos, completo.todos_completos)
+        self.assertEqual(incremental.terceros(), completo.terceros())
+        self.assertEqual(incremental.asignacion_terceros(), completo.asignacion_terceros())
+
+    def test_resultados_y_correcciones(self):
+        incremental = self._completo()
+        ids = list(self.partidos)
+        for _ in range(200):
+            anterior = self.partidos[self.rng.choice(ids)]
+            if self.rng.random() < 0.2:
+                gl = gv = None  # Resultado anulado
+            else:
+                gl, gv = self.rng.randint(0, 4), self.rng.randint(0, 4)
+            partido = _partido(anterior.id_partido, anterior.ronda[6], anterior.equipo_local,
+                               anterior.equipo_visitante, gl, gv)
+            self.partidos[partido.id_partido] = partido
+            incremental.aplicar(partido)
+            self._comparar(incremental)
+
+    def test_todos_terminados(self):
+        incremental = worldcup_standings.EstadoGrupos()
+        for partido in self.partidos.values():
+            incremental.aplicar(partido)
+        for id_partido, anterior in list(self.partidos.items()):
+            partido = _partido(id_partido, anterior.ronda[6], anterior.equipo_local,
+                               anterior.equipo_visitante, self.rng.randint(0, 3), self.rng.randint(0, 3))
+            self.partidos[id_partido] = partido
+            incremental.aplicar(partido)
+        self.assertTrue(incremental.todos_completos)
+        self._comparar(incremental)
+
+    def test_quitar_partido(self):
+        incremental = self._completo()
+        for id_partido in list(self.partidos)[:10]:
+            anterior = self.partidos[id_partido]
+            incremental.aplicar(_partido(id_partido, anterior.ronda[6], anterior.equipo_local,
+                                         anterior.equipo_visitante, 2, 1))
+            incremental.quitar(id_partido)
+            del self.partidos[id_partido]
+        self._comparar(incremental)
+
+
+def _score_referencia(pred, actual, winners):
+    """Scorer por nombres / sets anterior a worldcup_bitset"""
+    wg = worldcup_game
+    pts_groups = pts_thirds = pts_ko = exact = 0
+    for g, actual_order in actual["group_pos"].items():
+        pred_order = (pred.group_order or {}).get(g)
+        if not (isinstance(pred_order, list) and len(pred_order) == 4):
+            continue
+        top2 = set(actual_order[:2])
+        for i in (0, 1):
+            if pred_order[i] == actual_order[i]:
+                pts_groups += wg.PTS_GROUP_EXACT
+                exact += 1
+            elif pred_order[i] in top2:
+                pts_groups += wg.PTS_GROUP_QUALIFY
+    if actual["thirds"] is not None:
+        pts_thirds = wg.PTS_THIRD * len(set(pred.thirds or []) & actual["thirds"])
+    stages = [
+        (wg.R32_NOS, actual["r16"], wg.PTS_TO_R16),
+        (wg.R16_NOS, actual["qf"], wg.PTS_TO_QF),
+        (wg.QF_NOS, actual["sf"], wg.PTS_TO_SF),
+        (wg.SF_NOS, actual["final"], wg.PTS_TO_FINAL),
+    ]
+    for nos, advanced, pts in stages:
+        for no in nos:
+            w = winners.get(no)
+            if w and w in advanced:
+                pts_ko += pts
+    champ_pick = winners.get(wg.FINAL_NO)
+    champion_correct = bool(actual["champion"] and champ_pick == actual["champion"])
+    if champion_correct:
+        pts_ko += wg.PTS_CHAMPION
+    return {
+        "total": pts_groups + pts_thirds + pts_ko,
+        "groups": pts_groups,
+        "thirds": pts_thirds,
+        "knockout": pts_ko,
+        "exact_positions": exact,
+        "champion_pick": champ_pick,
+        "champion_correct": champion_correct,
+    }
+
+
+def _bracket_aleatorio(rng):
+    """Ganadores {match_no: nombre}: cada fase sale de los ganadores de la anterior"""
+    vivos = rng.sample([t for g in GROUPS for t in GROUPS[g]], 32)
+    winners = {}
+    for nos in (worldcup_game.R32_NOS, worldcup_game.R16_NOS, worldcup_game.QF_NOS,
+                worldcup_game.SF_NOS, [worldcup_game.FINAL_NO]):
+        vivos = rng.sample(vivos, len(nos))
+        for no, equipo in zip(nos, vivos):
+            if rng.random() < 0.9:  # Prediccion incompleta
+                winners[no] = equipo
+    return winners
+
+
+def _prediccion_aleatoria(rng):
+    group_order = {g: rng.sample(list(GROUPS[g]), 4) for g in GROUPS if rng.random() < 0.9}
+    thirds = rng.sample(sorted(GROUPS), 8) if rng.random() < 0.9 else []
+    return SimpleNamespace(group_order=group_order, thirds=thirds), _bracket_aleatorio(rng)
+
+
+def _resultados_aleatorios(rng):
+    grupos = [g for g in GROUPS if rng.random() < 0.7]
+    r16 = rng.sample([t for g in GROUPS for t in GROUPS[g]], 16)
+    qf = rng.sample(r16, 8)
+    sf = rng.sample(qf, 4)
+    final = rng.sample(sf, 2)
+    return {
+        "group_pos": {g: rng.sample(list(GROUPS[g]), 4) for g in grupos},
+        "thirds": set(rng.sample(sorted(GROUPS), 8)) if rng.random() < 0.5 else None,
+        "r16": set(r16), "qf": set(qf), "sf": set(sf), "final": set(final),
+        "champion": rng.choice(final) if rng.random() < 0.5 else None,
+    }
+
+
+class WorldCupBitsetTests(SimpleTestCase):
+    """score_bits / score_bulk dan lo mismo que el scorer por nombres"""
+
+    def test_score_bits_y_bulk(self):
+        rng = random.Random(32)
+        for _ in range(20):
+            actual = _resultados_aleatorios(rng)
+            preds = [_prediccion_aleatoria(rng) for _ in range(50)]
+            bits = [worldcup_bitset.encode_prediction(p.group_order, p.thirds, w) for p, w in preds]
+            bulk = worldcup_bitset.score_bulk(bits, worldcup_bitset.encode_actual(actual),
+                                              worldcup_game.PESOS)
+            for i, (pred, winners) in enumerate(preds):
+                esperado = _score_referencia(pred, actual, winners)
+                self.assertEqual(worldcup_game.score_prediction(pred, actual, winners), esperado)
+                for campo in ("total", "groups", "thirds", "knockout", "exact_positions",
+                              "champion_correct"):
+                    self.assertEqual(bulk[campo][i], esperado[campo], campo)
+
+    def test_ranking_order(self):
+        rng = random.Random(7)
+        filas = [{
+            "total": rng.randint(0, 5),
+            "champion_correct": rng.random() < 0.3,
+            "exact_positions": rng.randint(0, 2),
+            "completed_at": rng.choice([None, "2026-06-01T10:00:00", "2026-06-02T10:00:00"]),
+            "nombre_usuario": rng.choice(["ana", "Beto", "carla", "Dani"]) + str(i),
+        } for i in range(200)]
+        esperado = sorted(filas, key=lambda r: (
+            -r["total"], -int(r["champion_correct"]), -r["exact_positions"],
+            r["completed_at"] or "9999-12-31T00:00:00", r["nombre_usuario"].lower(),
+        ))
+        orden = worldcup_bitset.ranking_order(
+            [r["total"] for r in filas], [r["champion_correct"] for r in filas],
+            [r["exact_positions"] for r in filas], [r["completed_at"] for r in filas],
+            [r["nombre_usuario"] for r in filas],
+        )
+        self.assertEqual([filas[i] for i in orden], esperado)
+
+
+class WorldCupSimulationTests(SimpleTestCase):
+    """_score_chunk y P(primero) coinciden con score_bits y ranking_order"""
+
+    def test_score_chunk_y_primeros(self):
+        rng = random.Random(33)
+        base = datetime(2026, 6, 1, tzinfo=dt_timezone.utc)
+        preds, bits = [], []
+        for i in range(40):
+            pred, winners = _prediccion_aleatoria(rng)
+            pred.completed_at = base + timedelta(hours=rng.randint(0, 5)) if rng.random() < 0.7 else None
+            pred.usuario = SimpleNamespace(nombre_usuario=f"user{rng.randint(0, 9)}_{i}")
+            preds.append(pred)
+            bits.append(worldcup_bitset.encode_prediction(pred.group_order, pred.thirds, winners))
+        masks = np.array([b[:7] for b in bits], dtype=np.uint64)
+        champions_p = np.array([b.champion for b in bits], dtype=np.int64)
+
+        resultados = [_resultados_aleatorios(rng) for _ in range(30)]
+        for r in resultados:
+            r["champion"] = r["champion"] or sorted(r["final"])[0]
+            r["thirds"] = r["thirds"] or set(sorted(GROUPS)[:8])
+        actuales = [worldcup_bitset.encode_actual(r) for r in resultados]
+        sims = worldcup_bitset.Bits(*(
+            np.array([getattr(a, campo) for a in actuales],
+                     dtype=np.int64 if campo == "champion" else np.uint64)
+            for campo in worldcup_bitset.Bits._fields
+        ))
+
+        total, champion, exact = worldcup_simulation._score_chunk(
+            sims, masks, champions_p, worldcup_game.PESOS)
+        primeros = worldcup_simulation._primeros(
+            total, champion, exact, worldcup_simulation._desempate(preds))
+
+        for s, actual in enumerate(actuales):
+            esperados = [worldcup_bitset.score_bits(b, actual, worldcup_game.PESOS) for b in bits]
+            self.assertEqual(list(total[s]), [e["total"] for e in esperados])
+            self.assertEqual(list(champion[s]), [e["champion_correct"] for e in esperados])
+            self.assertEqual(list(exact[s]), [e["exact_positions"] for e in esperados])
+            orden = worldcup_bitset.ranking_order(
+                [e["total"] for e in esperados],
+                [e["champion_correct"] for e in esperados],
+                [e["exact_positions"] for e in esperados],
+                [p.completed_at.isoformat() if p.completed_at else None for p in preds],
+                [p.usuario.nombre_usuario for p in preds],
+            )
+            self.assertEqual(primeros[s], orden[0])
+
+
+def _crear_sala(n_miembros):
+    usuarios = []
+    for i in range(n_miembros):
+        user = User.objects.create(username=f'u{i}')
+        usuarios.append(Usuario.objects.create(
+            user=user, nombre_usuario=f'u{i}', correo=f'u{i}@example.com', contrasena='x'))
+    sala = Sala.objects.create(nombre='Sala', id_usuario=usuarios[0], codigo_sala='TEST01')
+    for u in usuarios:
+        UsuarioSala.objects.create(id_usuario=u, id_sala=sala)
+    return sala, usuarios
+
+
+def _crear_partidos(n):
+    liga = ApiLiga.objects.create(nombre='Liga')
+    local = ApiEquipo.objects.create(nombre='Local')
+    visitante = ApiEquipo.objects.create(nombre='Visitante')
+    return [ApiPartido.objects.create(
+        api_fixture_id=i + 1, id_liga=liga, temporada='2026', fecha=timezone.now(),
+        equipo_local=local, equipo_visitante=visitante,
+    ) for i in range(n)]
+
+
+class SalaScenariosTests(TestCase):
+    """calcular_escenarios contra fuerza bruta sobre todos los marcadores"""
+
+    GRILLA = range(6)  # Mas amplia que la que usa sala_scenarios para predicciones 0..1
+
+    def _fuerza_bruta(self, puntos, pendientes):
+        vectores = []
+        for apuestas in pendientes.values():
+            vectores.append([
+                np.array([sum(calcular_puntos_futbol(pl, pv, gl, gv) for u2, pl, pv in apuestas if u2 == u)
+                          for u in range(len(puntos))])
+                for gl in self.GRILLA for gv in self.GRILLA
+            ])
+        mejor = [len(puntos)] * len(puntos)
+        peor = [1] * len(puntos)
+        for combinacion in itertools.product(*vectores):
+            final = np.array(puntos) + sum(combinacion)
+            for i in range(len(puntos)):
+                mejor[i] = min(mejor[i], 1 + int((final > final[i]).sum()))
+                peor[i] = max(peor[i], int((final >= final[i]).sum()))
+        return mejor, peor
+
+    def test_contra_fuerza_bruta(self):
+        rng = random.Random(34)
+        sala, usuarios = _crear_sala(4)
+        jugado, *partidos = _crear_partidos(4)
+        puntos = [rng.randint(0, 30) for _ in usuarios]
+        pendientes = {p.id_partido: [] for p in partidos}
+        for i, usuario in enumerate(usuarios):
+            ApuestaFutbol.objects.create(
+                id_usuario=usuario, id_partido=jugado, id_sala=sala,
+                prediccion_local=0, prediccion_visitante=0,
+                estado=ApuestaStatus.GANADA, puntos_ganados=puntos[i])
+            for partido in partidos:
+                if rng.random() < 0.8:
+                    pl, pv = rng.randint(0, 1), rng.randint(0, 1)
+                    ApuestaFutbol.objects.create(
+                        id_usuario=usuario, id_partido=partido, id_sala=sala,
+                        prediccion_local=pl, prediccion_visitante=pv)
+                    pendientes[partido.id_partido].append((i, pl, pv))
+
+        filas, restantes = sala_scenarios.calcular_escenarios(sala)
+        self.assertEqual(restantes, len(partidos))
+        mejor, peor = self._fuerza_bruta(puntos, pendientes)
+        por_usuario = {f['usuario']['id_usuario']: f for f in filas}
+        for i, usuario in enumerate(usuarios):
+            fila = por_usuario[usuario.id_usuario]
+            self.assertTrue(fila['exacto'])
+            self.assertEqual(fila['puntos'], puntos[i])
+            self.assertEqual((fila['mejor_posicion'], fila['peor_posicion']), (mejor[i], peor[i]))
+
+
+class NotificationCacheTests(TestCase):
+    """Contadores de no leidas (fan-out al escribir) contra la BD"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _esperado(self, membresia):
+        vista = membresia.ultima_notificacion_vista
+        top = SalaNotificacion.objects.filter(id_sala_id=membresia.id_sala_id).order_by(
+            '-fecha', '-id_notificacion')[:notification_cache.TOP_N]
+        return sum(1 for n in top if vista is None or n.fecha > vista)
+
+    def test_no_leidas(self):
+        rng = random.Random(40)
+        sala, usuarios = _crear_sala(3)
+        otra = Sala.objects.create(nombre='Otra', id_usuario=usuarios[0], codigo_sala='TEST02')
+        UsuarioSala.objects.create(id_usuario=usuarios[0], id_sala=otra)
+        salas = [sala, otra]
+
+        for paso in range(120):
+            accion = rng.random()
+            if accion < 0.6:
+                with self.captureOnCommitCallbacks(execute=True):
+                    SalaNotificacion.objects.create(
+                        id_sala=rng.choice(salas), tipo='custom', mensaje=f'n{paso}')
+            elif accion < 0.9:
+                usuario = rng.choice(usuarios)
+                ids = [m.id_sala_id for m in UsuarioSala.objects.filter(id_usuario=usuario)]
+                UsuarioSala.objects.filter(id_usuario=usuario).update(
+                    ultima_notificacion_vista=timezone.now())
+                notification_cache.marcar_vistas(usuario.id_usuario, ids)
+            else:
+                cache.clear()
+
+            for usuario in usuarios:
+                membresias = list(UsuarioSala.objects.filter(id_usuario=usuario))
+                top = notification_cache.ultimas([m.id_sala_id for m in membresias])
+                conteo = notification_cache.no_leidas(membresias, top)
+                for m in membresias:
+                    self.assertEqual(conteo[m.id_sala_id], self._esperado(m), f'paso {paso}')
+
+
+class FakeRedisMixin:
+    """redis_client apuntando a un Redis en memoria (fakeredis) durante el test"""
+
+    def setUp(self):
+        super().setUp()
+        self._redis_real = redis_client._client
+        redis_client._client = fakeredis.FakeRedis()
+        self.redis = redis_client._client
+        cache.clear()
+
+    def tearDown(self):
+        redis_client._client = self._redis_real
+        super().tearDown()
+
+
+class ChatBufferTests(FakeRedisMixin, TestCase):
+    """Escritura diferida del chat: recuperacion del flush y lectores"""
+
+    def setUp(self):
+        super().setUp()
+        self.sala, self.usuarios = _crear_sala(2)
+        self.autor = self.usuarios[0]
+
+    def _guardados(self):
+        return sorted(MensajeChat.objects.values_list('contenido', flat=True))
+
+    def _colas_vacias(self):
+        self.assertEqual(self.redis.llen(chat_buffer.PENDIENTES_KEY), 0)
+        self.assertEqual(self.redis.llen(chat_buffer.PROCESANDO_KEY), 0)
+
+    def test_pendientes_visibles_en_recientes(self):
+        MensajeChat.objects.create(id_mensaje=chat_buffer.nuevo_id(), id_sala=self.sala,
+                                   id_usuario=self.autor, contenido='guardado')
+        chat_history.recientes(self.sala.id_sala)
+        for i in range(3):
+            chat_buffer.encolar(self.sala.id_sala, self.autor, f'm{i}')
+        esperado = ['guardado', 'm0', 'm1', 'm2']
+        self.assertEqual([m['contenido'] for m in chat_history.recientes(self.sala.id_sala)], esperado)
+
+        # Reconstruida sin la lista (expiro): los pendientes siguen ahi
+        chat_history.invalidar(self.sala.id_sala)
+        recientes = chat_history.recientes(self.sala.id_sala)
+        self.assertEqual([m['contenido'] for m in recientes], esperado)
+        self.assertEqual(recientes[-1]['usuario']['nombre_usuario'], self.autor.nombre_usuario)
+
+    def test_retoma_flush_interrumpido(self):
+        for i in range(3):
+            chat_buffer.encolar(self.sala.id_sala, self.autor, f'm{i}')
+        # Un flush anterior movio dos mensajes y se corto antes de guardarlos
+        for _ in range(2):
+            self.redis.lmove(chat_buffer.PENDIENTES_KEY, chat_buffer.PROCESANDO_KEY, 'LEFT', 'RIGHT')
+        self.assertEqual(
+            [m['contenido'] for m in chat_history.pagina(self.sala.id_sala)[0]], ['m0', 'm1', 'm2'])
+
+        self.assertEqual(chat_buffer.flush(batch_size=2), 3)
+        self.assertEqual(self._guardados(), ['m0', 'm1', 'm2'])
+        self._colas_vacias()
+
+    def test_id_ocupado_se_guarda_con_otro(self):
+        datos = [chat_buffer.encolar(self.sala.id_sala, self.autor, f'm{i}')[0] for i in range(2)]
+        # INSERT que no paso por nuevo_id() (ej. el admin) toma el id de m1
+        MensajeChat.objects.create(id_mensaje=datos[1]['id_mensaje'], id_sala=self.sala,
+                                   id_usuario=self.usuarios[1], contenido='admin')
+
+        with self.assertLogs('bets.chat_buffer', 'WARNING'):
+            chat_buffer.flush()
+        self.assertEqual(self._guardados(), ['admin', 'm0', 'm1'])
+        m1 = MensajeChat.objects.get(contenido='m1')
+        self.assertNotEqual(m1.id_mensaje, datos[1]['id_mensaje'])
+        self.assertEqual(m1.id_usuario_id, self.autor.id_usuario)
+        self._colas_vacias()
+
+        # Reintentar el mismo lote (flush cortado antes del LREM) no lo duplica
+        self.redis.rpush(chat_buffer.PROCESANDO_KEY, json.dumps({
+            'id': datos[1]['id_mensaje'], 'sala': self.sala.id_sala, 'usuario': self.autor.id_usuario,
+            'contenido': 'm1', 'fecha': datos[1]['fecha_envio'],
+        }))
+        chat_buffer.flush()
+        self.assertEqual(self._guardados(), ['admin', 'm0', 'm1'])
+
+    def test_mensaje_huerfano_no_traba_la_cola(self):
+        otra = Sala.objects.create(nombre='Otra', id_usuario=self.autor, codigo_sala='TEST02')
+        chat_buffer.encolar(otra.id_sala, self.autor, 'huerfano')
+        otra.delete()
+        chat_buffer.encolar(self.sala.id_sala, self.autor, 'antes')
+        # Flush cortado con el huerfano adentro
+        self.redis.lmove(chat_buffer.PENDIENTES_KEY, chat_buffer.PROCESANDO_KEY, 'LEFT', 'RIGHT')
+
+        with self.assertLogs('bets.chat_buffer', 'WARNING'):
+            chat_buffer.flush()
+        chat_buffer.encolar(self.sala.id_sala, self.autor, 'despues')
+        chat_buffer.flush()
+
+        self.assertEqual(self._guardados(), ['antes', 'despues'])
+        self._colas_vacias()
+        descartados = [json.loads(c) for c in self.redis.lrange(chat_buffer.DESCARTADOS_KEY, 0, -1)]
+        self.assertEqual([d['contenido'] for d in descartados], ['huerfano'])
+
+
+class ChatPaginacionTests(FakeRedisMixin, TestCase):
+    """Historial paginado por cursor (chat_history.pagina y /historial/)"""
+
+    def setUp(self):
+        super().setUp()
+        self.sala, self.usuarios = _crear_sala(1)
+
+    def _crear_mensajes(self, n, segundos):
+        """n mensajes con fechas al azar en `segundos` segundos: muchos empates de fecha_envio"""
+        rng = random.Random(7)
+        base = timezone.now() - timedelta(days=1)
+        MensajeChat.objects.bulk_create([
+            MensajeChat(id_sala=self.sala, id_usuario=self.usuarios[0], contenido=f'm{i}',
+                        fecha_envio=base + timedelta(seconds=rng.randrange(segundos)))
+            for i in range(n)
+        ])
+        return list(MensajeChat.objects.order_by('fecha_envio', 'id_mensaje').values_list('id_mensaje', flat=True))
+
+    def _recorrer(self, limite):
+        vistos = []
+        mensajes, siguiente = chat_history.pagina(self.sala.id_sala, None, limite)
+        vistos[:0] = [m['id_mensaje'] for m in mensajes]
+        while siguiente:
+            mensajes, siguiente = chat_history.pagina(self.sala.id_sala, siguiente, limite)
+            vistos[:0] = [m['id_mensaje'] for m in mensajes]
+        return vistos
+
+    def test_recorrido_completo_con_empates(self):
+        esperado = self._crear_mensajes(130, 15)
+        for limite in (7, 50, 100):
+            chat_history.invalidar(self.sala.id_sala)
+            self.assertEqual(self._recorrer(limite), esperado, limite)
+
+    def test_primera_pagina_corta_por_borrados(self):
+        esperado = self._crear_mensajes(55, 55)
+        chat_history.recientes(self.sala.id_sala)
+        with self.captureOnCommitCallbacks(execute=True):
+            MensajeChat.objects.filter(id_mensaje__in=esperado[-3:]).delete()
+        esperado = esperado[:-3]
+        self.assertEqual(len(chat_history.recientes(self.sala.id_sala)), chat_history.HISTORY_SIZE - 3)
+
+        mensajes, siguiente = chat_history.pagina(self.sala.id_sala)
+        self.assertEqual([m['id_mensaje'] for m in mensajes], esperado[-50:])
+        mensajes, siguiente = chat_history.pagina(self.sala.id_sala, siguiente)
+        self.assertEqual([m['id_mensaje'] for m in mensajes], esperado[:-50])
+        self.assertIsNone(siguiente)
+
+    def test_historial_cursor_invalido(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuarios[0].user)
+        url = '/api/mensajes-chat/historial/'
+        for antes in ('no-es-base64!', chat_history.cursor({'fecha_envio': 'ayer', 'id_mensaje': 1})):
+            respuesta = cliente.get(url, {'sala_id': self.sala.id_sala, 'antes': antes})
+            self.assertEqual(respuesta.status_code, 400, antes)
+        self.assertEqual(cliente.get(url, {'sala_id': self.sala.id_sala}).status_code, 200)
+
+    def test_por_sala_mismo_formato_a_cualquier_limite(self):
+        self._crear_mensajes(60, 60)
+        chat_buffer.encolar(self.sala.id_sala, self.usuarios[0], 'pendiente')
+        cliente = APIClient()
+        cliente.force_authenticate(self.usuarios[0].user)
+        url = '/api/mensajes-chat/por_sala/'
+        cortos = cliente.get(url, {'sala_id': self.sala.id_sala, 'limite': 10}).json()
+        largos = cliente.get(url, {'sala_id': self.sala.id_sala, 'limite': 80}).json()
+        self.assertEqual((len(cortos), len(largos)), (10, 61))
+        self.assertEqual(largos[:10], cortos)
+        self.assertEqual(cortos[0]['contenido'], 'pendiente')
+        self.assertEqual(cortos[0]['sala_nombre'], 'Sala')
+
+
+class AuthCacheTests(TestCase):
+    """Autenticacion por token cacheada (auth_cache + CachedTokenAuthentication)"""
+
+    def setUp(self):
+        cache.clear()
+        auth_cache._local.clear()
+        self.sala, usuarios = _crear_sala(1)
+        self.perfil = usuarios[0]
+        self.token = Token.objects.create(user=self.perfil.user)
+        self.cliente = APIClient()
+        self.cliente.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_revocacion_en_otros_procesos(self):
+        self.assertEqual(self.cliente.get('/api/validate-token').status_code, 200)
+        # La LRU de otro worker, que no atendio el logout
+        otro_proceso = auth_cache._local.copy()
+        self.assertEqual(self.cliente.post('/api/logout').status_code, 200)
+        auth_cache._local.update(otro_proceso)
+        self.assertEqual(self.cliente.get('/api/validate-token').status_code, 401)
+
+        # Desactivar el usuario tambien rige en los demas procesos
+        token = Token.objects.create(user=self.perfil.user)
+        self.assertEqual(auth_cache.estado_token(token.key)['user'].is_active, True)
+        otro_proceso = auth_cache._local.copy()
+        User.objects.filter(pk=self.perfil.user_id).update(is_active=False)
+        self.perfil.user.refresh_from_db()
+        self.perfil.user.save()
+        auth_cache._local.update(otro_proceso)
+        self.assertEqual(auth_cache.estado_token(token.key)['user'].is_active, False)
+
+    def test_request_caliente_sin_queries(self):
+        self.assertEqual(self.cliente.get('/api/validate-token').status_code, 200)
+        with self.assertNumQueries(0):
+            respuesta = self.cliente.get('/api/validate-token')
+        self.assertEqual(respuesta.json()['user_id'], self.perfil.user_id)
+
+    def test_token_expirado(self):
+        creado = timezone.now() - timedelta(hours=settings.TOKEN_EXPIRATION_HOURS, seconds=1)
+        Token.objects.filter(key=self.token.key).update(created=creado)
+        respuesta = self.cliente.get('/api/validate-token')
+        self.assertEqual(respuesta.status_code, 401)
+        self.assertEqual(respuesta.json()['code'], 'token_expired')
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+
+    def test_logout(self):
+        self.assertEqual(self.cliente.get('/api/validate-token').status_code, 200)
+        self.assertEqual(self.cliente.post('/api/logout').status_code, 200)
+        self.assertEqual(self.cliente.get('/api/validate-token').status_code, 401)
+
+    def test_membresia_al_salir_de_la_sala(self):
+        self.assertTrue(auth_cache.es_miembro(self.perfil.id_usuario, self.sala.id_sala))
+        with self.captureOnCommitCallbacks(execute=True):
+            UsuarioSala.objects.filter(id_usuario=self.perfil, id_sala=self.sala).delete()
+        self.assertFalse(auth_cache.es_miembro(self.perfil.id_usuario, self.sala.id_sala))
+
+    def test_perfil_desde_cache(self):
+        auth_cache.estado_token(self.token.key)
+        with self.assertNumQueries(0):
+            user = auth_cache.estado_token(self.token.key)['user']
+            perfil = user.perfil
+            self.assertEqual((perfil.id_usuario, perfil.nombre_usuario, perfil.correo),
+                             (self.perfil.id_usuario, 'u0', 'u0@example.com'))
+            self.assertIs(perfil.user, user)
+        # Lo que no se cachea (contraseñas) se lee de la BD recien al usarlo
+        contrasena = Usuario.objects.get(pk=perfil.pk).contrasena
+        with self.assertNumQueries(1):
+            self.assertEqual(perfil.contrasena, contrasena)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, '')
+
+
+class WorldCupRankingTests(TestCase):
+    """Ranking del Mundial cacheado (worldcup_game._ranking_table)"""
+
+    def setUp(self):
+        cache.clear()
+        _, self.usuarios = _crear_sala(2)
+        for u in self.usuarios:
+            WorldCupPrediction.objects.create(usuario=u)
+
+    def _ranking(self):
+        version, actual = worldcup_game._actual_with_version()
+        return {r['id_usuario']: (r['nombre_usuario'], r['foto_perfil'])
+                for r in worldcup_game._ranking_table(actual, version)}
+
+    def test_cambio_de_nombre_y_foto(self):
+        u = self.usuarios[0]
+        self.assertEqual(self._ranking()[u.id_usuario], ('u0', None))
+        u.nombre_usuario, u.foto_perfil = 'nuevo', 'https://example.com/f.png'
+        with self.captureOnCommitCallbacks(execute=True):
+            u.save()
+        self.assertEqual(self._ranking()[u.id_usuario], ('nuevo', 'https://example.com/f.png'))
+
+        # Guardar sin cambios no invalida la tabla
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.usuarios[1].save()
+        self.assertEqual(callbacks, [])
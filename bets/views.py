@@ -2,15 +2,14 @@ from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, action
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Q, Sum, Count
+from django.db.models import Q
 from django.db.models import Prefetch
 from django.conf import settings
-from django.core.cache import cache
 from datetime import timedelta
 from django.http import HttpResponse
 import requests
@@ -20,7 +19,7 @@ from .models import (
     ApiEquipo, ApiJugador, ApiPartido, PartidoTenis, PartidoBaloncesto,
     CarreraF1, ApuestaFutbol, ApuestaTenis, ApuestaBaloncesto, ApuestaF1,
     Ranking, MensajeChat, ApiPartidoEstadisticas, ApiPartidoEvento, ApiPartidoAlineacion,
-    PartidoStatus, ApuestaStatus, SalaDeporte, SalaLiga, SalaPartido, SalaNotificacion,
+    PartidoStatus, MensajeStatus, SalaDeporte, SalaLiga, SalaPartido, SalaNotificacion,
     RoomInvitation, LoginEvent
 )
 from .serializers import (
@@ -32,8 +31,13 @@ from .serializers import (
     ApuestaFutbolSerializer, ApuestaFutbolGrupoSerializer, ApuestaTenisSerializer, ApuestaBaloncestoSerializer,
     ApuestaF1Serializer, RankingSerializer, MensajeChatSerializer,
     ApiPartidoEstadisticasSerializer, ApiPartidoEventoSerializer, ApiPartidoAlineacionSerializer,
-    SalaDeporteSerializer, SalaLigaSerializer, SalaPartidoSerializer, SalaNotificacionSerializer
+    SalaDeporteSerializer, SalaLigaSerializer, SalaPartidoSerializer, SalaNotificacionSerializer,
+    partido_dict
 )
+from .renderers import ORJSONRenderer
+from .eligibility import config_sala, salas_elegibles_para_partido
+from . import auth_cache, chat_buffer, chat_history, leaderboard, notification_cache, presence, response_cache
+from .sala_scenarios import calcular_escenarios
 
 
 # Vista de autenticación
@@ -124,7 +128,7 @@ def logout_view(request):
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
         if auth_header.startswith('Token '):
             token_key = auth_header.split(' ')[1]
-            cache.delete(f'token_valid:{token_key}')
+            auth_cache.invalidar_token(token_key)
         request.user.auth_token.delete()
         return Response({"success": "Sesión cerrada correctamente"}, status=status.HTTP_200_OK)
     except Exception as e:
@@ -378,6 +382,24 @@ class SalaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=True, methods=['get'], renderer_classes=[ORJSONRenderer])
+    def en_linea(self, request, pk=None):
+        """
+        GET /api/salas/{id}/en_linea/
+        Miembros conectados al chat de la sala (presencia en Redis, sin MySQL)
+        """
+        try:
+            sala_id = int(pk)
+        except ValueError:
+            return Response({"error": "Sala inválida"}, status=status.HTTP_400_BAD_REQUEST)
+        if not auth_cache.es_miembro(request.user.perfil.id_usuario, sala_id):
+            return Response(
+                {"error": "No tienes acceso a esta sala"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        usuarios = presence.en_linea(sala_id)
+        return Response({'sala_id': sala_id, 'en_linea': len(usuarios), 'usuarios': usuarios})
+
     @action(detail=True, methods=['get'])
     def miembros(self, request, pk=None):
         """
@@ -474,7 +496,7 @@ class ApiPartidoViewSet(viewsets.ModelViewSet):
     queryset = ApiPartido.objects.all()
     serializer_class = ApiPartidoSerializer
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=[ORJSONRenderer])
     def proximos(self, request):
         """
         Obtiene los próximos partidos programados.
@@ -483,50 +505,48 @@ class ApiPartidoViewSet(viewsets.ModelViewSet):
         - modo_sala='partidos_individuales': Solo partidos agregados manualmente
         - modo_sala='mixto': Partidos de ligas habilitadas + partidos agregados manualmente
         """
-        ahora = timezone.now()
         sala_id = request.query_params.get('sala_id')
+        config = config_sala(sala_id) if sala_id else None
 
-        # Query base: partidos próximos programados
-        partidos = ApiPartido.objects.filter(
-            fecha__gte=ahora,
-            estado=PartidoStatus.PROGRAMADO
+        # Cache versionada: la clave cambia cuando cambia un partido de las
+        # ligas relevantes o la configuración de la sala (ligas/partidos/modo)
+        if config is not None and config.modo == 'ligas' and config.ligas:
+            ligas = sorted(config.ligas)
+            config_stamp = (config.modo, ligas)
+        else:
+            ligas = [response_cache.TODAS]
+            config_stamp = (config.modo, sorted(config.ligas), sorted(config.partidos)) if config else None
+        versiones = response_cache.versiones(ligas)
+        clave = response_cache.response_key(
+            'proximos', request.get_host(), config_stamp,
+            [versiones[liga] for liga in ligas],
         )
 
-        # Si se especifica una sala, filtrar según configuración
-        if sala_id:
-            try:
-                sala = Sala.objects.get(id_sala=sala_id)
-                modo_sala = sala.modo_sala
-
-                # Obtener ligas habilitadas en la sala
-                ligas_habilitadas = SalaLiga.objects.filter(id_sala=sala_id).values_list('id_liga', flat=True)
-
-                # Obtener partidos agregados manualmente
-                partidos_manuales = SalaPartido.objects.filter(id_sala=sala_id).values_list('id_partido', flat=True)
+        def construir():
+            ahora = timezone.now()
 
-                # Filtrar según el modo de la sala
-                if modo_sala == 'partidos_individuales':
-                    if partidos_manuales.exists():
-                        partidos = partidos.filter(id_partido__in=partidos_manuales)
-                    else:
-                        partidos = ApiPartido.objects.none()
+            # Query base: partidos próximos programados
+            partidos = ApiPartido.objects.filter(
+                fecha__gte=ahora,
+                estado=PartidoStatus.PROGRAMADO
+            )
 
-                elif modo_sala == 'ligas':
-                    if ligas_habilitadas.exists():
-                        partidos = partidos.filter(id_liga__in=ligas_habilitadas)
+            # Si se especifica una sala, filtrar según configuración (cacheada)
+            if config is not None:
+                partidos = config.filtrar(partidos)
 
-                elif modo_sala == 'mixto':
-                    if ligas_habilitadas.exists() or partidos_manuales.exists():
-                        partidos = partidos.filter(
-                            Q(id_liga__in=ligas_habilitadas) | Q(id_partido__in=partidos_manuales)
-                        )
+            partidos = list(partidos.select_related(
+                'equipo_local', 'equipo_visitante', 'id_liga', 'id_venue'
+            ).order_by('fecha')[:50])  # Limitar a 50 resultados
 
-            except Sala.DoesNotExist:
-                pass  # Si la sala no existe, mostrar todos los partidos
+            # Válida hasta que empiece el primer partido (sale de la lista)
+            # o hasta que cambie una versión
+            timeout = response_cache.RESPONSE_TTL
+            if partidos:
+                timeout = min(timeout, int((partidos[0].fecha - ahora).total_seconds()))
+            return [partido_dict(p, request) for p in partidos], timeout
 
-        partidos = partidos.order_by('fecha')[:50]  # Limitar a 50 resultados
-        serializer = self.get_serializer(partidos, many=True)
-        return Response(serializer.data)
+        return Response(response_cache.cached(clave, construir))
     
     
 
@@ -932,50 +952,14 @@ class ApuestaFutbolViewSet(viewsets.ModelViewSet):
 
         usuario = request.user.perfil
 
-        salas_ids = UsuarioSala.objects.filter(id_usuario=usuario).values_list('id_sala', flat=True)
-        salas = Sala.objects.filter(id_sala__in=salas_ids)
-        if sala_actual_id:
-            salas = salas.exclude(id_sala=sala_actual_id)
-
+        elegibles = salas_elegibles_para_partido(
+            usuario, partido, excluir=[sala_actual_id] if sala_actual_id else ()
+        )
         salas_con_apuesta = ApuestaFutbol.objects.filter(
             id_usuario=usuario,
             id_partido=partido
         ).values_list('id_sala', flat=True)
-        salas = salas.exclude(id_sala__in=salas_con_apuesta)
-
-        salas_disponibles = []
-        for sala in salas:
-            modo_sala = sala.modo_sala
-            match_disponible = False
-
-            if modo_sala == 'partidos_individuales':
-                match_disponible = SalaPartido.objects.filter(
-                    id_sala=sala, id_partido=partido
-                ).exists()
-
-            elif modo_sala == 'ligas':
-                ligas_habilitadas = list(SalaLiga.objects.filter(
-                    id_sala=sala
-                ).values_list('id_liga', flat=True))
-                match_disponible = partido.id_liga_id in set(ligas_habilitadas) if ligas_habilitadas else True
-
-            elif modo_sala == 'mixto':
-                ligas_habilitadas = list(SalaLiga.objects.filter(
-                    id_sala=sala
-                ).values_list('id_liga', flat=True))
-                partidos_manuales = list(SalaPartido.objects.filter(
-                    id_sala=sala
-                ).values_list('id_partido', flat=True))
-                if ligas_habilitadas or partidos_manuales:
-                    match_disponible = (
-                        partido.id_liga_id in set(ligas_habilitadas) or
-                        partido.id_partido in set(partidos_manuales)
-                    )
-                else:
-                    match_disponible = True
-
-            if match_disponible:
-                salas_disponibles.append(sala)
+        salas_disponibles = Sala.objects.filter(id_sala__in=elegibles).exclude(id_sala__in=salas_con_apuesta)
 
         serializer = SalaSerializer(salas_disponibles, many=True)
         return Response(serializer.data)
@@ -1093,7 +1077,7 @@ class RankingViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(rankings, many=True)
         return Response(serializer.data)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], renderer_classes=[ORJSONRenderer])
     def actual(self, request):
         """
         Obtiene el ranking actual de una sala. Usa una sola query de agregación
@@ -1115,29 +1099,14 @@ class RankingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        miembros = UsuarioSala.objects.filter(id_sala=sala).select_related('id_usuario')
-        usuario_ids = [m.id_usuario_id for m in miembros]
-
-        # Una sola query GROUP BY en lugar de N queries (una por miembro)
-        stats_qs = ApuestaFutbol.objects.filter(
-            id_sala=sala,
-            id_usuario__in=usuario_ids,
-        ).values('id_usuario').annotate(
-            total_puntos=Sum('puntos_ganados'),
-            total_apuestas=Count('id_apuesta'),
-            apuestas_ganadas=Count('id_apuesta', filter=Q(estado=ApuestaStatus.GANADA)),
-            apuestas_perdidas=Count('id_apuesta', filter=Q(estado=ApuestaStatus.PERDIDA)),
-        )
-        stats_dict = {s['id_usuario']: s for s in stats_qs}
-
+        # Tabla agregada compartida (1 query GROUP BY, cacheada por version)
         ranking_data = []
-        for miembro in miembros:
-            usuario = miembro.id_usuario
-            s = stats_dict.get(usuario.id_usuario, {})
-            total = s.get('total_apuestas') or 0
-            ganadas = s.get('apuestas_ganadas') or 0
-            perdidas = s.get('apuestas_perdidas') or 0
-            puntos = s.get('total_puntos') or 0
+        for fila in leaderboard.tabla(sala):
+            usuario = fila['usuario']
+            total = fila['total_apuestas']
+            ganadas = fila['apuestas_ganadas']
+            perdidas = fila['apuestas_perdidas']
+            puntos = fila['puntos']
 
             ranking_data.append({
                 'usuario': {
@@ -1154,7 +1123,6 @@ class RankingViewSet(viewsets.ModelViewSet):
                 'efectividad': round((ganadas / total * 100) if total > 0 else 0, 2),
             })
 
-        ranking_data.sort(key=lambda x: x['puntos'], reverse=True)
         for idx, item in enumerate(ranking_data, start=1):
             item['posicion'] = idx
 
@@ -1168,6 +1136,38 @@ class RankingViewSet(viewsets.ModelViewSet):
             'total_participantes': len(ranking_data),
         })
 
+    @action(detail=False, methods=['get'], renderer_classes=[ORJSONRenderer])
+    def escenarios(self, request):
+        """
+        Mejor y peor posicion final posible de cada miembro de una sala según
+        los partidos que faltan ("¿todavía puedo ganar?").
+        """
+        sala_id = request.query_params.get('sala_id')
+
+        if not sala_id:
+            return Response(
+                {"error": "Se requiere el ID de la sala"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            sala = Sala.objects.get(id_sala=sala_id)
+        except Sala.DoesNotExist:
+            return Response(
+                {"error": "La sala especificada no existe"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        filas, partidos_restantes = calcular_escenarios(sala)
+        return Response({
+            'sala': {
+                'id_sala': sala.id_sala,
+                'nombre': sala.nombre,
+            },
+            'escenarios': filas,
+            'partidos_restantes': partidos_restantes,
+        })
+
 
 class MensajeChatViewSet(viewsets.ModelViewSet):
     queryset = MensajeChat.objects.all()
@@ -1175,17 +1175,13 @@ class MensajeChatViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        mensaje = serializer.save(id_usuario=self.request.user)
+        # El id sale del mismo contador que los mensajes del WebSocket (chat_buffer)
+        mensaje = serializer.save(id_mensaje=chat_buffer.nuevo_id(), id_usuario=self.request.user)
         sala = mensaje.id_sala
+        chat_history.agregar(sala.id_sala, chat_history.serializar(mensaje))
         usuario = self.request.user
         # One chat notification per sala per 15 minutes to avoid spamming
-        quince_min_atras = timezone.now() - timedelta(minutes=15)
-        ya_existe = SalaNotificacion.objects.filter(
-            id_sala=sala,
-            tipo='nuevo_mensaje_chat',
-            fecha__gte=quince_min_atras
-        ).exists()
-        if not ya_existe:
+        if chat_buffer.debe_notificar(sala.id_sala):
             SalaNotificacion.objects.create(
                 id_sala=sala,
                 tipo='nuevo_mensaje_chat',
@@ -1195,23 +1191,65 @@ class MensajeChatViewSet(viewsets.ModelViewSet):
                 usuario_relacionado=usuario,
             )
 
-    @action(detail=False, methods=['get'])
-    def por_sala(self, request):
-        """
-        Obtiene los mensajes de una sala específica
-        """
-        sala_id = request.query_params.get('sala_id')
-        limite = request.query_params.get('limite', 50)  # Cantidad de mensajes a devolver
+    MAX_LIMITE = 100
 
-        if not sala_id:
+    def _parametros_sala(self, request):
+        """(sala_id, limite) validados, o una Response de error"""
+        try:
+            sala_id = int(request.query_params['sala_id'])
+        except (KeyError, ValueError):
             return Response({"error": "Se requiere el ID de la sala"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limite = int(request.query_params.get('limite', chat_history.HISTORY_SIZE))
+        except ValueError:
+            return Response({"error": "limite debe ser un número"}, status=status.HTTP_400_BAD_REQUEST)
+        if not auth_cache.es_miembro(request.user.perfil.id_usuario, sala_id):
+            return Response({"error": "No tienes acceso a esta sala"}, status=status.HTTP_403_FORBIDDEN)
+        return sala_id, max(1, min(limite, self.MAX_LIMITE))
 
-        mensajes = MensajeChat.objects.filter(
-            id_sala=sala_id
-        ).order_by('-fecha_envio')[:int(limite)]
+    @action(detail=False, methods=['get'])
+    def por_sala(self, request):
+        """
+        Obtiene los mensajes activos de una sala específica (limite <= 100)
+        """
+        parametros = self._parametros_sala(request)
+        if isinstance(parametros, Response):
+            return parametros
+        sala_id, limite = parametros
+
+        # Mismo formato que el WebSocket a cualquier limite; los más recientes
+        # salen del historial en Redis
+        sala_nombre = chat_history.nombre_sala(sala_id)
+        return Response([{
+            'id_mensaje': m['id_mensaje'],
+            'usuario_nombre': m['usuario']['nombre_usuario'],
+            'sala_nombre': sala_nombre,
+            'contenido': m['contenido'],
+            'fecha_envio': m['fecha_envio'],
+            'estado': MensajeStatus.ACTIVO,
+            'id_sala': sala_id,
+            'id_usuario': m['usuario']['id_usuario'],
+        } for m in reversed(chat_history.ultimos(sala_id, limite))])
+
+    @action(detail=False, methods=['get'], renderer_classes=[ORJSONRenderer])
+    def historial(self, request):
+        """
+        GET /api/mensajes-chat/historial/?sala_id=2&limite=50&antes=<cursor>
+        Historial del chat paginado hacia atrás ("cargar anteriores"). Sin
+        `antes` devuelve los últimos mensajes; con el cursor `siguiente` de la
+        respuesta anterior, los previos. Mensajes del más viejo al más nuevo,
+        en el mismo formato que el WebSocket.
+        """
+        parametros = self._parametros_sala(request)
+        if isinstance(parametros, Response):
+            return parametros
+        sala_id, limite = parametros
 
-        serializer = self.get_serializer(mensajes, many=True)
-        return Response(serializer.data)
+        try:
+            mensajes, siguiente = chat_history.pagina(sala_id, request.query_params.get('antes') or None, limite)
+        except ValueError:
+            return Response({"error": "Cursor inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'mensajes': mensajes, 'siguiente': siguiente})
 
 
 # Proxy para imágenes de SofaScore (evita problemas de CORS)
@@ -1624,18 +1662,15 @@ def accept_invite(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([ORJSONRenderer])
 def mis_notificaciones(request):
     """
     GET /api/notificaciones/mias/
     Devuelve notificaciones recientes de todas las salas del usuario y los
-    conteos de no leídas. Crea recordatorios de partidos próximos (12h) de
-    forma lazy pero con queries batched para evitar N+1.
+    conteos de no leídas. Solo lectura: los recordatorios de partidos los
+    crea la tarea generate_match_reminders.
     """
-    from datetime import timedelta as td
-    from collections import defaultdict
     usuario = request.user.perfil
-    ahora = timezone.now()
-    ventana = ahora + td(hours=12)
 
     memberships = list(UsuarioSala.objects.filter(id_usuario=usuario).select_related('id_sala'))
     if not memberships:
@@ -1643,73 +1678,9 @@ def mis_notificaciones(request):
 
     sala_ids = [m.id_sala_id for m in memberships]
 
-    # ── Recordatorios de partidos próximos (todas las salas de una vez) ──
-    partidos_proximos = list(ApiPartido.objects.filter(
-        fecha__gte=ahora,
-        fecha__lte=ventana,
-        estado='programado',
-    ).select_related('equipo_local', 'equipo_visitante'))
-
-    if partidos_proximos:
-        partido_ids = [p.id_partido for p in partidos_proximos]
-
-        # Qué liga pertenece a qué sala (1 query)
-        sala_liga_set = set(
-            SalaLiga.objects.filter(id_sala__in=sala_ids)
-            .values_list('id_sala_id', 'id_liga_id')
-        )
-        # Qué partido manual pertenece a qué sala (1 query)
-        sala_partido_set = set(
-            SalaPartido.objects.filter(id_sala__in=sala_ids, id_partido__in=partido_ids)
-            .values_list('id_sala_id', 'id_partido_id')
-        )
-        # Recordatorios ya creados hoy (1 query)
-        hoy_inicio = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
-        existing_reminders = set(
-            SalaNotificacion.objects.filter(
-                id_sala__in=sala_ids,
-                tipo='recordatorio_partido',
-                partido_relacionado__in=partido_ids,
-                fecha__gte=hoy_inicio,
-            ).values_list('id_sala_id', 'partido_relacionado_id')
-        )
-
-        # Construir las notificaciones faltantes en memoria, luego bulk_create
-        nuevas = []
-        for sala_id in sala_ids:
-            for partido in partidos_proximos:
-                pid = partido.id_partido
-                liga_id = partido.id_liga_id
-                pertenece = (sala_id, liga_id) in sala_liga_set or (sala_id, pid) in sala_partido_set
-                if not pertenece or (sala_id, pid) in existing_reminders:
-                    continue
-                minutos = int((partido.fecha - ahora).total_seconds() / 60)
-                tiempo_texto = f"{minutos // 60}h" if minutos >= 60 else f"{minutos}min"
-                local = partido.equipo_local.nombre if partido.equipo_local else '?'
-                visitante = partido.equipo_visitante.nombre if partido.equipo_visitante else '?'
-                nuevas.append(SalaNotificacion(
-                    id_sala_id=sala_id,
-                    tipo='recordatorio_partido',
-                    mensaje=f"⚽ {local} vs {visitante} empieza en {tiempo_texto} — ¡no olvides apostar!",
-                    icono='⏰',
-                    color='text-yellow-400',
-                    partido_relacionado_id=pid,
-                ))
-        if nuevas:
-            SalaNotificacion.objects.bulk_create(nuevas)
-
-    # ── Todas las notificaciones de todas las salas en 1 query ───────────
-    all_notifs = (
-        SalaNotificacion.objects
-        .filter(id_sala__in=sala_ids)
-        .select_related('usuario_relacionado', 'partido_relacionado')
-        .order_by('id_sala_id', '-fecha')
-    )
-    notif_por_sala = defaultdict(list)
-    for n in all_notifs:
-        bucket = notif_por_sala[n.id_sala_id]
-        if len(bucket) < 10:
-            bucket.append(n)
+    # ── Ultimas notificaciones y no leidas (cache: O(salas)) ─────────────
+    top = notification_cache.ultimas(sala_ids)
+    conteos = notification_cache.no_leidas(memberships, top)
 
     # ── Construir respuesta en memoria ────────────────────────────────────
     resultado = []
@@ -1717,26 +1688,23 @@ def mis_notificaciones(request):
 
     for membership in memberships:
         sala = membership.id_sala
-        ultima_vista = membership.ultima_notificacion_vista
-        notificaciones = notif_por_sala[sala.id_sala]
-
-        no_leidas = 0
-        notifs_data = []
-        for n in notificaciones:
-            leida = ultima_vista is not None and n.fecha <= ultima_vista
-            if not leida:
-                no_leidas += 1
-            notifs_data.append({
-                'id': n.id_notificacion,
-                'tipo': n.tipo,
-                'mensaje': n.mensaje,
-                'icono': n.icono,
-                'color': n.color,
-                'fecha': n.fecha.isoformat(),
-                'leida': leida,
+        no_leidas = conteos[sala.id_sala]
+
+        # Las no leidas son las mas recientes: las primeras `no_leidas`
+        notifs_data = [
+            {
+                'id': n['id'],
+                'tipo': n['tipo'],
+                'mensaje': n['mensaje'],
+                'icono': n['icono'],
+                'color': n['color'],
+                'fecha': n['fecha'].isoformat(),
+                'leida': i >= no_leidas,
                 'sala_id': sala.id_sala,
                 'sala_nombre': sala.nombre,
-            })
+            }
+            for i, n in enumerate(top[sala.id_sala])
+        ]
 
         total_no_leidas += no_leidas
         resultado.append({
@@ -1760,14 +1728,11 @@ def marcar_notificaciones_vistas(request):
     sala_id = request.data.get('sala_id')
     ahora = timezone.now()
 
+    memberships = UsuarioSala.objects.filter(id_usuario=usuario)
     if sala_id:
-        UsuarioSala.objects.filter(
-            id_usuario=usuario,
-            id_sala_id=sala_id
-        ).update(ultima_notificacion_vista=ahora)
-    else:
-        UsuarioSala.objects.filter(
-            id_usuario=usuario
-        ).update(ultima_notificacion_vista=ahora)
+        memberships = memberships.filter(id_sala_id=sala_id)
+    sala_ids = list(memberships.values_list('id_sala_id', flat=True))
+    memberships.update(ultima_notificacion_vista=ahora)
+    notification_cache.marcar_vistas(usuario.id_usuario, sala_ids)
 
     return Response({'success': True, 'timestamp': ahora.isoformat()})
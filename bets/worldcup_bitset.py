@@ -0,0 +1,172 @@
+"""
+Representacion compacta (bitsets) de predicciones y resultados del Mundial.
+
+Cada uno de los 48 equipos es un bit (TEAM_INDEX de worldcup_bracket), asi
+que "equipos que avanzan en una fase" cabe en un entero de 64 bits. Puntuar
+una prediccion contra los resultados reales son unos cuantos AND + popcount,
+y `score_bulk` puntua todas las predicciones en una sola pasada vectorizada
+con numpy (np.bitwise_count).
+
+Campos de una prediccion / resultado codificado (Bits):
+- pos1, pos2: equipos en 1er / 2do lugar de su grupo (solo grupos completos)
+- thirds: grupos cuyos terceros clasifican (bit i = grupo i en orden alfabetico)
+- r16, qf, sf, final: equipos que llegan a esa fase
+- champion: indice del campeon (NO_TEAM / UNKNOWN_CHAMPION si no hay)
+
+Nombres que no estan en GROUPS no tienen bit y no suman puntos.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from .worldcup_bracket import GROUPS, KO_TEMPLATE, R32_TEMPLATE, TEAM_INDEX, groups_mask
+
+# Partidos cuyo ganador llega a cada fase
+R32_NOS = sorted(R32_TEMPLATE)
+R16_NOS = sorted(n for n, (_h, _a, r) in KO_TEMPLATE.items() if r == "Round of 16")
+QF_NOS = sorted(n for n, (_h, _a, r) in KO_TEMPLATE.items() if r == "Quarter-Final")
+SF_NOS = sorted(n for n, (_h, _a, r) in KO_TEMPLATE.items() if r == "Semi-Final")
+FINAL_NO = next(n for n, (_h, _a, r) in KO_TEMPLATE.items() if r == "Final")
+STAGE_SOURCES = (R32_NOS, R16_NOS, QF_NOS, SF_NOS)
+
+NO_TEAM = -1            # prediccion sin campeon
+UNKNOWN_CHAMPION = -2   # torneo sin campeon todavia (nunca coincide)
+
+Bits = namedtuple("Bits", "pos1 pos2 thirds r16 qf sf final champion")
+Pesos = namedtuple("Pesos", "group_exact group_qualify third r16 qf sf final champion")
+
+
+def team_bit(name):
+    i = TEAM_INDEX.get(name)
+    return 0 if i is None else 1 << i
+
+
+def team_mask(names):
+    mask = 0
+    for name in names:
+        if name:
+            mask |= team_bit(name)
+    return mask
+
+
+def popcount(x):
+    return x.bit_count()
+
+
+def encode_prediction(group_order, thirds, winners):
+    """
+    group_order: {"A": [4 nombres]}; thirds: ["A", ...];
+    winners: bracket resuelto {match_no(int): nombre}.
+    """
+    pos1 = pos2 = 0
+    for g, order in (group_order or {}).items():
+        if g in GROUPS and isinstance(order, list) and len(order) == 4:
+            pos1 |= team_bit(order[0])
+            pos2 |= team_bit(order[1])
+
+    thirds_mask = groups_mask(thirds or [])
+
+    stages = [team_mask(winners.get(no) for no in nos) for nos in STAGE_SOURCES]
+    champion = TEAM_INDEX.get(winners.get(FINAL_NO), NO_TEAM)
+    return Bits(pos1, pos2, thirds_mask, *stages, champion)
+
+
+def encode_actual(actual):
+    """actual_results() -> Bits. thirds es None si aun no se conocen."""
+    pos1 = pos2 = 0
+    for order in actual["group_pos"].values():
+        pos1 |= team_bit(order[0])
+        pos2 |= team_bit(order[1])
+
+    thirds = None
+    if actual["thirds"] is not None:
+        thirds = groups_mask(actual["thirds"])
+
+    champion = UNKNOWN_CHAMPION
+    if actual["champion"]:
+        champion = TEAM_INDEX.get(actual["champion"], UNKNOWN_CHAMPION)
+    return Bits(pos1, pos2, thirds,
+                team_mask(actual["r16"]), team_mask(actual["qf"]),
+                team_mask(actual["sf"]), team_mask(actual["final"]),
+                champion)
+
+
+def score_bits(pred, actual, pesos):
+    """Puntaje de una prediccion codificada (escalar)."""
+    exact = popcount(pred.pos1 & actual.pos1) + popcount(pred.pos2 & actual.pos2)
+    in_top2 = popcount((pred.pos1 | pred.pos2) & (actual.pos1 | actual.pos2))
+    pts_groups = pesos.group_exact * exact + pesos.group_qualify * (in_top2 - exact)
+
+    pts_thirds = 0
+    if actual.thirds is not None:
+        pts_thirds = pesos.third * popcount(pred.thirds & actual.thirds)
+
+    champion_correct = pred.champion >= 0 and pred.champion == actual.champion
+    pts_ko = (pesos.r16 * popcount(pred.r16 & actual.r16)
+              + pesos.qf * popcount(pred.qf & actual.qf)
+              + pesos.sf * popcount(pred.sf & actual.sf)
+              + pesos.final * popcount(pred.final & actual.final)
+              + (pesos.champion if champion_correct else 0))
+    return {
+        "total": pts_groups + pts_thirds + pts_ko,
+        "groups": pts_groups,
+        "thirds": pts_thirds,
+        "knockout": pts_ko,
+        "exact_positions": exact,
+        "champion_correct": champion_correct,
+    }
+
+
+def score_bulk(preds, actual, pesos):
+    """
+    Puntua muchas predicciones codificadas en una pasada vectorizada.
+    Devuelve un dict de arrays numpy (mismas claves que score_bits).
+    """
+    if not preds:
+        vacio = np.zeros(0, dtype=np.int64)
+        return {"total": vacio, "groups": vacio, "thirds": vacio,
+                "knockout": vacio, "exact_positions": vacio,
+                "champion_correct": np.zeros(0, dtype=bool)}
+
+    masks = np.array([p[:7] for p in preds], dtype=np.uint64)
+    champions = np.array([p.champion for p in preds], dtype=np.int64)
+
+    def bc(col, mask):
+        return np.bitwise_count(masks[:, col] & np.uint64(mask)).astype(np.int64)
+
+    exact = bc(0, actual.pos1) + bc(1, actual.pos2)
+    in_top2 = np.bitwise_count(
+        (masks[:, 0] | masks[:, 1]) & np.uint64(actual.pos1 | actual.pos2)
+    ).astype(np.int64)
+    pts_groups = pesos.group_exact * exact + pesos.group_qualify * (in_top2 - exact)
+
+    if actual.thirds is not None:
+        pts_thirds = pesos.third * bc(2, actual.thirds)
+    else:
+        pts_thirds = np.zeros(len(preds), dtype=np.int64)
+
+    champion_correct = (champions >= 0) & (champions == actual.champion)
+    pts_ko = (pesos.r16 * bc(3, actual.r16) + pesos.qf * bc(4, actual.qf)
+              + pesos.sf * bc(5, actual.sf) + pesos.final * bc(6, actual.final)
+              + pesos.champion * champion_correct)
+    return {
+        "total": pts_groups + pts_thirds + pts_ko,
+        "groups": pts_groups,
+        "thirds": pts_thirds,
+        "knockout": pts_ko,
+        "exact_positions": exact,
+        "champion_correct": champion_correct,
+    }
+
+
+def ranking_order(total, champion_correct, exact, completed_at, nombres):
+    """
+    Indices en orden de ranking: mas puntos, campeon acertado, mas posiciones
+    exactas, quien completo primero (ISO; '' = nunca) y nombre.
+    """
+    completed = np.array([c or "9999-12-31T00:00:00" for c in completed_at])
+    nombres = np.array([n.lower() for n in nombres])
+    # np.lexsort ordena por la ultima clave primero
+    return np.lexsort((nombres, completed, -np.asarray(exact),
+                       -np.asarray(champion_correct, dtype=np.int64),
+                       -np.asarray(total)))
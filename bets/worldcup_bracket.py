@@ -4,12 +4,15 @@ Generado desde el fixture oficial FIFA (WCup_2026_4.2.6_en.xlsx, hojas
 'Matches' y 'AssignThird', FIFA 23.06.2025).
 
 - GROUPS: equipos por grupo (nombres tal como estan en la BD, ApiEquipo.nombre)
+- TEAM_NAMES / TEAM_INDEX: nombre de equipo <-> entero (0..47)
 - R32_TEMPLATE: ronda de 32 -> slots ('1A' = 1ro grupo A, '2B' = 2do grupo B,
   '3-ABCDF' = mejor tercero de uno de esos grupos segun THIRD_ASSIGN)
 - KO_TEMPLATE: rondas posteriores -> 'W73' = ganador del partido 73,
   'RU101' = perdedor del partido 101
 - THIRD_ASSIGN: combinacion de 8 grupos cuyos terceros clasifican (string de
   letras ordenadas) -> {slot: grupo del tercero asignado}
+- THIRD_ASSIGN_BY_MASK / THIRD_SLOT_GROUPS: la misma tabla indexada por
+  mascara de 12 bits (ver groups_mask / third_assignment)
 - api_fixture_id en BD = 9_000_000 + numero de partido FIFA
 """
 
@@ -30,6 +33,11 @@ GROUPS = {
     "L": ["England", "Croatia", "Ghana", "Panama"],
 }
 
+# Nombres internados a enteros pequenos (orden: grupo, posicion en GROUPS).
+# Permiten guardar resultados y predicciones como tuplas/sets de int.
+TEAM_NAMES = tuple(name for g in sorted(GROUPS) for name in GROUPS[g])
+TEAM_INDEX = {name: i for i, name in enumerate(TEAM_NAMES)}
+
 # Ronda de 32: numero de partido FIFA -> (slot local, slot visitante)
 R32_TEMPLATE = {
     73: ("2A", "2B"),
@@ -569,3 +577,38 @@ THIRD_ASSIGN = {
     "DFGHIJKL": {"3-CEFHI": "H", "3-EFGIJ": "G", "3-BEFIJ": "I", "3-ABCDF": "D", "3-AEHIJ": "J", "3-CDFGH": "F", "3-DEIJL": "L", "3-EHIJK": "K"},
     "EFGHIJKL": {"3-CEFHI": "E", "3-EFGIJ": "J", "3-BEFIJ": "I", "3-ABCDF": "F", "3-AEHIJ": "H", "3-CDFGH": "G", "3-DEIJL": "L", "3-EHIJK": "K"},
 }
+
+# Indice de THIRD_ASSIGN por mascara de 12 bits (bit i = grupo i en orden
+# alfabetico). Evita armar y ordenar el string de la combinacion en cada
+# consulta; los consumidores vectorizados usan THIRD_SLOT_GROUPS.
+GROUP_LETTERS = tuple(sorted(GROUPS))
+GROUP_BIT = {g: 1 << i for i, g in enumerate(GROUP_LETTERS)}
+THIRD_SLOTS = tuple(sorted(next(iter(THIRD_ASSIGN.values()))))
+
+# mascara -> {slot: grupo} (None si no es una combinacion de 8 grupos)
+THIRD_ASSIGN_BY_MASK = [None] * (1 << len(GROUP_LETTERS))
+# mascara -> indice de grupo por slot, en el orden de THIRD_SLOTS
+THIRD_SLOT_GROUPS = [None] * (1 << len(GROUP_LETTERS))
+for _combo, _assign in THIRD_ASSIGN.items():
+    _mask = sum(GROUP_BIT[g] for g in _combo)
+    THIRD_ASSIGN_BY_MASK[_mask] = _assign
+    THIRD_SLOT_GROUPS[_mask] = tuple(GROUP_LETTERS.index(_assign[s]) for s in THIRD_SLOTS)
+del _combo, _assign, _mask
+
+
+def groups_mask(groups):
+    """Letras de grupo -> mascara de 12 bits (ignora letras desconocidas)"""
+    mask = 0
+    for g in groups:
+        mask |= GROUP_BIT.get(g, 0)
+    return mask
+
+
+def mask_combo(mask):
+    """Mascara -> combinacion en letras ordenadas (ej. 'ABCDEFGH')"""
+    return "".join(g for g in GROUP_LETTERS if mask & GROUP_BIT[g])
+
+
+def third_assignment(groups):
+    """{slot: grupo} para los 8 grupos cuyos terceros clasifican ({} si no aplica)"""
+    return THIRD_ASSIGN_BY_MASK[groups_mask(groups)] or {}
@@ -16,8 +16,10 @@ Desempates: 1) acerto el campeon, 2) mas posiciones exactas de grupo,
 """
 from datetime import datetime, timezone as dt_tz
 
+from django.core.cache import cache
+from django.db.models import F
 from django.utils import timezone
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
@@ -25,8 +27,11 @@ from rest_framework import status
 from .models import (
     ApiLiga, ApiPartido, PartidoStatus, Usuario, WorldCupPrediction,
 )
+from .renderers import ORJSONParser, ORJSONRenderer
+from . import response_cache, worldcup_bitset, worldcup_standings
 from .worldcup_bracket import (
-    FIXTURE_ID_BASE, GROUPS, R32_TEMPLATE, KO_TEMPLATE, THIRD_ASSIGN,
+    FIXTURE_ID_BASE, GROUPS, R32_TEMPLATE, KO_TEMPLATE,
+    TEAM_NAMES, TEAM_INDEX, third_assignment,
 )
 
 # 18 de julio de 2026, 12:00 m. hora Colombia (UTC-5)
@@ -36,8 +41,23 @@ PREDICTION_DEADLINE = datetime(2026, 7, 18, 17, 0, tzinfo=dt_tz.utc)
 MODIFICATION_DEADLINE = datetime(2026, 7, 8, 17, 0, tzinfo=dt_tz.utc)
 
 TBD_API_ID = 9049
-MATCHES_PER_GROUP = 6
 WC_LIGA_API_ID = 9001
+WC_LIGA_ID_CACHE_KEY = "wc_liga_id"
+ACTUAL_CACHE_PREFIX = "wc_actual:"
+RANKING_CACHE_PREFIX = "wc_ranking:"
+PREDICTIONS_VERSION = "wc_predicciones"  # se incrementa al guardar una prediccion
+PROFILES_VERSION = "wc_perfiles"  # nombre o foto de un Usuario (signals.py)
+PROJECTIONS_CACHE_KEY = "wc_projections"  # ver worldcup_simulation
+SCORE_BATCH = 500
+SCORE_FIELDS = [
+    "score_total", "score_groups", "score_thirds", "score_knockout",
+    "exact_positions", "champion_pick", "champion_correct",
+    "scored_version", "scored_updated_at",
+]
+
+# Ultimo actual_results expandido en este proceso: {"entry": ((liga, version), dict)}
+# (de solo lectura para los llamadores)
+_actual_local = {}
 
 # Orden inicial que ve el usuario (ranking FIFA). Nombres tal como en BD.
 INITIAL_ORDER = {
@@ -65,6 +85,11 @@ PTS_TO_SF = 5        # gana su cuarto de final
 PTS_TO_FINAL = 7     # gana su semifinal
 PTS_CHAMPION = 10    # gana la final
 
+PESOS = worldcup_bitset.Pesos(
+    PTS_GROUP_EXACT, PTS_GROUP_QUALIFY, PTS_THIRD,
+    PTS_TO_R16, PTS_TO_QF, PTS_TO_SF, PTS_TO_FINAL, PTS_CHAMPION,
+)
+
 R32_NOS = sorted(R32_TEMPLATE.keys())                      # 73-88
 R16_NOS = list(range(89, 97))
 QF_NOS = list(range(97, 101))
@@ -111,8 +136,7 @@ def resolve_prediction(group_order, thirds, ko_winners, trust_picks=None):
                 if g in GROUPS and isinstance(o, list) and len(o) == 4}
     third_map = {}
     if thirds and len(thirds) == 8:
-        combo = "".join(sorted(thirds))
-        third_map = THIRD_ASSIGN.get(combo, {})
+        third_map = third_assignment(thirds)
 
     def slot_team(slot):
         if slot.startswith("3-"):
@@ -168,21 +192,127 @@ def _wc_liga():
     return ApiLiga.objects.filter(api_id=WC_LIGA_API_ID).first()
 
 
+def _wc_liga_id():
+    liga_id = cache.get(WC_LIGA_ID_CACHE_KEY)
+    if liga_id is None:
+        liga = _wc_liga()
+        if liga is None:
+            return None
+        liga_id = liga.id_liga
+        cache.set(WC_LIGA_ID_CACHE_KEY, liga_id, 60 * 60 * 24)
+    return liga_id
+
+
+def _compactar_actual(out):
+    """
+    Forma compacta de actual_results para la cache: nombres internados a int
+    (TEAM_INDEX; los nombres desconocidos se agregan al final) y rondas como
+    frozensets de int.
+    """
+    extras = []
+    extra_index = {}
+
+    def idx(name):
+        if name is None:
+            return None
+        i = TEAM_INDEX.get(name)
+        if i is None:
+            i = extra_index.get(name)
+            if i is None:
+                i = len(TEAM_NAMES) + len(extras)
+                extras.append(name)
+                extra_index[name] = i
+        return i
+
+    cuerpo = (
+        {g: tuple(idx(n) for n in order) for g, order in out["group_pos"].items()},
+        frozenset(out["thirds"]) if out["thirds"] is not None else None,
+        tuple(frozenset(idx(n) for n in out[k]) for k in ("r16", "qf", "sf", "final")),
+        idx(out["champion"]),
+        {idx(n): (info["id_equipo"], info["logo"]) for n, info in out["team_info"].items()},
+        {no: (idx(m["home"]), idx(m["away"]), m["finished"], idx(m["winner"]))
+         for no, m in out["ko_matches"].items()},
+    )
+    # `extras` se llena mientras se internan los nombres de `cuerpo`
+    return (tuple(extras),) + cuerpo
+
+
+def _expandir_actual(compacto):
+    extras, group_pos, thirds, rondas, champion, team_info, ko_matches = compacto
+    names = TEAM_NAMES + extras
+
+    def name(i):
+        return names[i] if i is not None else None
+
+    r16, qf, sf, final = ({names[i] for i in ronda} for ronda in rondas)
+    return {
+        "group_pos": {g: [name(i) for i in order] for g, order in group_pos.items()},
+        "thirds": set(thirds) if thirds is not None else None,
+        "r16": r16, "qf": qf, "sf": sf, "final": final,
+        "champion": name(champion),
+        "team_info": {names[i]: {"id_equipo": id_equipo, "logo": logo}
+                      for i, (id_equipo, logo) in team_info.items()},
+        "ko_matches": {no: {"home": name(h), "away": name(a),
+                            "finished": finished, "winner": name(w)}
+                       for no, (h, a, finished, w) in ko_matches.items()},
+    }
+
+
 def actual_results():
-    """Calcula resultados reales del torneo para el scoring."""
-    liga = _wc_liga()
+    """
+    Resultados reales del torneo para el scoring. Se cachean (en forma
+    compacta) por version de datos de la liga del Mundial: solo se recalculan
+    cuando cambia un ApiPartido del Mundial.
+    """
+    return _actual_with_version()[1]
+
+
+def _actual_with_version():
+    """(version de datos del Mundial, actual_results) consistentes entre si"""
+    liga_id = _wc_liga_id()
+    if liga_id is None:
+        return 0, _calcular_actual(None)
+
+    version = response_cache.version(liga_id)
+    local = _actual_local.get("entry")
+    if local is not None and local[0] == (liga_id, version):
+        return version, local[1]
+
+    key = f"{ACTUAL_CACHE_PREFIX}{liga_id}:{version}"
+    compacto = cache.get(key)
+    if compacto is None:
+        compacto = _compactar_actual(_calcular_actual(liga_id))
+        cache.set(key, compacto, response_cache.RESPONSE_TTL)
+    out = _expandir_actual(compacto)
+    _actual_local["entry"] = ((liga_id, version), out)
+    return version, out
+
+
+def _calcular_actual(liga_id):
+    """Calcula resultados reales del torneo desde la BD."""
     out = {"group_pos": {}, "thirds": None, "r16": set(), "qf": set(),
            "sf": set(), "final": set(), "champion": None, "team_info": {},
            "ko_matches": {}}
-    if liga is None:
+    if liga_id is None:
         return out
 
+    # Solo eliminatorias: las posiciones de grupo salen del motor incremental
     partidos = list(
-        ApiPartido.objects.filter(id_liga=liga)
+        ApiPartido.objects.filter(id_liga_id=liga_id)
+        .exclude(ronda__startswith="Group")
         .select_related("equipo_local", "equipo_visitante")
         .order_by("api_fixture_id")
     )
-
+    estado = worldcup_standings.estado_liga(liga_id)
+    tablas = estado.tablas()
+
+    for rows in tablas.values():
+        for r in rows:
+            team = r["team"]
+            if team and team["nombre"] not in out["team_info"]:
+                out["team_info"][team["nombre"]] = {
+                    "id_equipo": team["id_equipo"], "logo": team["logo"],
+                }
     for p in partidos:
         for eq in (p.equipo_local, p.equipo_visitante):
             if eq.api_id != TBD_API_ID and eq.nombre not in out["team_info"]:
@@ -190,44 +320,14 @@ def actual_results():
                     "id_equipo": eq.id_equipo, "logo": eq.logo_url,
                 }
 
-    tables = {g: {} for g in GROUPS}
-    finished = {g: 0 for g in GROUPS}
-    for p in partidos:
-        ronda = p.ronda or ""
-        if not ronda.startswith("Group"):
-            continue
-        letter = ronda[6:7]
-        if letter not in tables:
-            continue
-        for eq in (p.equipo_local, p.equipo_visitante):
-            tables[letter].setdefault(eq.nombre, {
-                "name": eq.nombre, "pts": 0, "dif": 0, "gf": 0})
-        if p.estado != PartidoStatus.FINALIZADO or p.goles_local is None:
-            continue
-        finished[letter] += 1
-        h = tables[letter][p.equipo_local.nombre]
-        a = tables[letter][p.equipo_visitante.nombre]
-        gl, gv = p.goles_local, p.goles_visitante
-        h["gf"] += gl; h["dif"] += gl - gv
-        a["gf"] += gv; a["dif"] += gv - gl
-        if gl > gv:
-            h["pts"] += 3
-        elif gl < gv:
-            a["pts"] += 3
-        else:
-            h["pts"] += 1; a["pts"] += 1
-
-    sort_key = lambda r: (-r["pts"], -r["dif"], -r["gf"], r["name"])
-    third_rows = []
     for g in GROUPS:
-        rows = sorted(tables[g].values(), key=sort_key)
-        if finished[g] >= MATCHES_PER_GROUP and len(rows) == 4:
-            out["group_pos"][g] = [r["name"] for r in rows]
-            row3 = dict(rows[2]); row3["group"] = g
-            third_rows.append(row3)
+        rows = tablas[g]
+        if estado.completo(g) and len(rows) == 4:
+            out["group_pos"][g] = [r["team"]["nombre"] if r["team"] else None
+                                   for r in rows]
 
     if len(out["group_pos"]) == len(GROUPS):
-        third_rows.sort(key=sort_key)
+        third_rows = estado.terceros(tablas)
         out["thirds"] = {r["group"] for r in third_rows[:8]}
 
     by_no = {p.api_fixture_id - FIXTURE_ID_BASE: p for p in partidos
@@ -335,64 +435,41 @@ def viable_qf_teams(actual):
     return viable
 
 
-def score_prediction(pred, actual):
-    """Puntos de una prediccion contra los resultados reales."""
-    pts_groups = pts_thirds = pts_ko = 0
-    exact = 0
-
+def resolve_winners(pred):
+    """Ganadores validos {match_no(int): nombre} de la prediccion."""
     trust = MODIFY_MATCH_NOS if pred.completed else None
-    rounds, winners = resolve_prediction(
-        pred.group_order, pred.thirds, pred.ko_winners, trust_picks=trust)
+    return resolve_prediction(pred.group_order, pred.thirds, pred.ko_winners,
+                              trust_picks=trust)[1]
 
-    for g, actual_order in actual["group_pos"].items():
-        pred_order = (pred.group_order or {}).get(g)
-        if not (isinstance(pred_order, list) and len(pred_order) == 4):
-            continue
-        top2 = set(actual_order[:2])
-        for i in (0, 1):
-            if pred_order[i] == actual_order[i]:
-                pts_groups += PTS_GROUP_EXACT
-                exact += 1
-            elif pred_order[i] in top2:
-                pts_groups += PTS_GROUP_QUALIFY
-
-    if actual["thirds"] is not None:
-        pts_thirds = PTS_THIRD * len(set(pred.thirds or []) & actual["thirds"])
-
-    stages = [
-        (R32_NOS, actual["r16"], PTS_TO_R16),
-        (R16_NOS, actual["qf"], PTS_TO_QF),
-        (QF_NOS, actual["sf"], PTS_TO_SF),
-        (SF_NOS, actual["final"], PTS_TO_FINAL),
-    ]
-    for nos, advanced, pts in stages:
-        for no in nos:
-            w = winners.get(no)
-            if w and w in advanced:
-                pts_ko += pts
 
-    champ_pick = winners.get(FINAL_NO)
-    champion_correct = bool(
-        actual["champion"] and champ_pick == actual["champion"])
-    if champion_correct:
-        pts_ko += PTS_CHAMPION
+def refresh_resolved(pred):
+    """Persiste el bracket resuelto y marca el puntaje como pendiente.
+    Se llama en pre_save de WorldCupPrediction (signals.py)."""
+    pred.resolved_winners = {str(no): w for no, w in resolve_winners(pred).items()}
+    pred.scored_version = None
 
-    return {
-        "total": pts_groups + pts_thirds + pts_ko,
-        "groups": pts_groups,
-        "thirds": pts_thirds,
-        "knockout": pts_ko,
-        "exact_positions": exact,
-        "champion_pick": champ_pick,
-        "champion_correct": champion_correct,
-    }
+
+def stored_winners(pred):
+    """Bracket resuelto persistido (se resuelve al vuelo si aun no existe)."""
+    if pred.resolved_winners is None:
+        return resolve_winners(pred)
+    return {int(no): w for no, w in pred.resolved_winners.items()}
+
+
+def score_prediction(pred, actual, winners=None):
+    """Puntos de una prediccion contra los resultados reales.
+    `winners`: bracket ya resuelto (evita volver a resolverlo)."""
+    if winners is None:
+        winners = resolve_winners(pred)
+    bits = worldcup_bitset.encode_prediction(pred.group_order, pred.thirds, winners)
+    score = worldcup_bitset.score_bits(bits, worldcup_bitset.encode_actual(actual), PESOS)
+    score["champion_pick"] = winners.get(FINAL_NO)
+    return score
 
 
 def detailed_score(pred, actual):
     """Granular per-group / per-third / per-ko-match scoring for summary."""
-    trust = MODIFY_MATCH_NOS if pred.completed else None
-    _, winners = resolve_prediction(
-        pred.group_order, pred.thirds, pred.ko_winners, trust_picks=trust)
+    winners = stored_winners(pred)
 
     group_detail = {}
     pts_groups_total = 0
@@ -592,23 +669,109 @@ def _state_json(pred, team_info):
 
 
 def _team_info_map():
-    liga = _wc_liga()
-    info = {}
-    if liga is None:
-        return info
-    partidos = (ApiPartido.objects.filter(id_liga=liga)
-                .select_related("equipo_local", "equipo_visitante"))
-    for p in partidos:
-        for eq in (p.equipo_local, p.equipo_visitante):
-            if eq.api_id != TBD_API_ID and eq.nombre not in info:
-                info[eq.nombre] = {"logo": eq.logo_url}
-    return info
+    return {name: {"logo": info["logo"]}
+            for name, info in actual_results()["team_info"].items()}
+
+
+# -- Ranking materializado --
+# Cada prediccion guarda su bracket resuelto (al guardarse) y su puntaje con
+# la version de datos del Mundial con la que se calculo. El ranking solo
+# re-puntua las predicciones desactualizadas y la tabla ordenada se cachea
+# por (version del Mundial, version de las predicciones).
+
+def _rescore_stale(actual, version):
+    """Puntua solo predicciones con puntaje de otra version (o que cambiaron),
+    todas en una pasada vectorizada sobre su codificacion en bitsets."""
+    pendientes = list(WorldCupPrediction.objects
+                      .exclude(scored_version=version,
+                               scored_updated_at=F("updated_at")))
+    if not pendientes:
+        return
+
+    winners = [stored_winners(pred) for pred in pendientes]
+    campos = list(SCORE_FIELDS)
+    for pred, w in zip(pendientes, winners):
+        if pred.resolved_winners is None:  # Filas anteriores a la migracion 0015
+            pred.resolved_winners = {str(no): x for no, x in w.items()}
+            if "resolved_winners" not in campos:
+                campos.append("resolved_winners")
+    bits = [worldcup_bitset.encode_prediction(pred.group_order, pred.thirds, w)
+            for pred, w in zip(pendientes, winners)]
+    scores = worldcup_bitset.score_bulk(
+        bits, worldcup_bitset.encode_actual(actual), PESOS)
+
+    for i, pred in enumerate(pendientes):
+        pred.score_total = int(scores["total"][i])
+        pred.score_groups = int(scores["groups"][i])
+        pred.score_thirds = int(scores["thirds"][i])
+        pred.score_knockout = int(scores["knockout"][i])
+        pred.exact_positions = int(scores["exact_positions"][i])
+        pred.champion_pick = winners[i].get(FINAL_NO)
+        pred.champion_correct = bool(scores["champion_correct"][i])
+        pred.scored_version = version
+        pred.scored_updated_at = pred.updated_at
+    WorldCupPrediction.objects.bulk_update(pendientes, campos,
+                                           batch_size=SCORE_BATCH)
+
+
+def _ranking_table(actual, version):
+    """Filas del ranking ya ordenadas y con 'rank' (cacheadas)."""
+    versiones = response_cache.versiones([PREDICTIONS_VERSION, PROFILES_VERSION])
+    key = (f"{RANKING_CACHE_PREFIX}{version}:"
+           f"{versiones[PREDICTIONS_VERSION]}:{versiones[PROFILES_VERSION]}")
+    rows = cache.get(key)
+    if rows is not None:
+        return rows
+
+    _rescore_stale(actual, version)
+    preds = WorldCupPrediction.objects.select_related("usuario").only(
+        "group_order", "thirds", "resolved_winners", "ko_winners", "completed",
+        "completed_at", "score_total", "score_groups", "score_thirds",
+        "score_knockout", "exact_positions", "champion_pick",
+        "champion_correct", "usuario", "usuario__id_usuario",
+        "usuario__nombre_usuario", "usuario__foto_perfil",
+    )
+    rows = []
+    for pred in preds:
+        prog = _progress(pred.group_order or {}, pred.thirds or [],
+                         stored_winners(pred))
+        rows.append({
+            "id_usuario": pred.usuario.id_usuario,
+            "nombre_usuario": pred.usuario.nombre_usuario,
+            "foto_perfil": pred.usuario.foto_perfil,
+            "completed": prog["completed"],
+            "completed_at": (pred.completed_at.isoformat()
+                             if pred.completed_at else None),
+            "total": pred.score_total,
+            "groups": pred.score_groups,
+            "thirds": pred.score_thirds,
+            "knockout": pred.score_knockout,
+            "exact_positions": pred.exact_positions,
+            "champion_pick": pred.champion_pick,
+            "champion_correct": pred.champion_correct,
+        })
+
+    orden = worldcup_bitset.ranking_order(
+        [r["total"] for r in rows],
+        [r["champion_correct"] for r in rows],
+        [r["exact_positions"] for r in rows],
+        [r["completed_at"] for r in rows],
+        [r["nombre_usuario"] for r in rows],
+    ) if rows else []
+    rows = [rows[i] for i in orden]
+    for i, r in enumerate(rows):
+        r["rank"] = i + 1
+
+    cache.set(key, rows, response_cache.RESPONSE_TTL)
+    return rows
 
 
 # -- Endpoints --
 
 @api_view(["GET", "PUT"])
 @permission_classes([IsAuthenticated])
+@renderer_classes([ORJSONRenderer])
+@parser_classes([ORJSONParser])
 def game_state(request):
     usuario = _get_usuario(request)
     if usuario is None:
@@ -824,43 +987,30 @@ def game_state(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@renderer_classes([ORJSONRenderer])
 def game_ranking(request):
-    actual = actual_results()
-    preds = (WorldCupPrediction.objects
-             .select_related("usuario")
-             .all())
-
-    rows = []
-    for pred in preds:
-        trust = MODIFY_MATCH_NOS if pred.completed else None
-        prog = _progress(pred.group_order or {}, pred.thirds or [],
-                         resolve_prediction(pred.group_order, pred.thirds,
-                                            pred.ko_winners,
-                                            trust_picks=trust)[1])
-        score = score_prediction(pred, actual)
-        rows.append({
-            "id_usuario": pred.usuario.id_usuario,
-            "nombre_usuario": pred.usuario.nombre_usuario,
-            "foto_perfil": pred.usuario.foto_perfil,
-            "completed": prog["completed"],
-            "completed_at": (pred.completed_at.isoformat()
-                             if pred.completed_at else None),
-            **score,
-        })
-
-    far_future = "9999-12-31T00:00:00"
-    rows.sort(key=lambda r: (
-        -r["total"],
-        -int(r["champion_correct"]),
-        -r["exact_positions"],
-        r["completed_at"] or far_future,
-        r["nombre_usuario"].lower(),
-    ))
-    for i, r in enumerate(rows):
-        r["rank"] = i + 1
+    version, actual = _actual_with_version()
+    rows = _ranking_table(actual, version)
+
+    # Proyecciones Monte Carlo (tarea simulate_worldcup_projections)
+    proyecciones = cache.get(PROJECTIONS_CACHE_KEY)
+    projections_meta = None
+    if proyecciones:
+        por_usuario = proyecciones["by_user"]
+        rows = [dict(r, **por_usuario.get(r["id_usuario"],
+                                           {"p_first": None, "expected_score": None}))
+                for r in rows]
+        projections_meta = {
+            "n_sims": proyecciones["n_sims"],
+            "computed_at": proyecciones["computed_at"],
+            "stale": (proyecciones["version"] != version
+                      or proyecciones["predictions_version"]
+                      != response_cache.version(PREDICTIONS_VERSION)),
+        }
 
     return Response({
         "ranking": rows,
+        "projections": projections_meta,
         "tournament": {
             "groups_complete": len(actual["group_pos"]),
             "thirds_known": actual["thirds"] is not None,
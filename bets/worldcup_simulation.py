@@ -0,0 +1,298 @@
+"""
+Simulador Monte Carlo del resto del Mundial 2026 para el juego de
+predicciones: "¿que puede pasar todavia?".
+
+Parte del estado real (partidos de grupo ya jugados via worldcup_standings,
+cruces/ganadores de eliminatoria ya conocidos via actual_results) y sortea
+lo que falta muchas miles de veces:
+- Partidos de grupo pendientes: goles Poisson; la tasa de cada equipo
+  depende de su fuerza relativa (settings.WORLDCUP_TEAM_STRENGTH, por
+  nombre; 1.0 por defecto = todos iguales).
+- Posiciones: mismo criterio que el tablero (Pts, DIF, GF, nombre), los 8
+  mejores terceros y su asignacion FIFA (THIRD_ASSIGN).
+- Eliminatorias: gana el local con probabilidad fuerza_h / (fuerza_h + fuerza_a).
+
+Cada simulacion se codifica como en worldcup_bitset y todas las
+predicciones se puntuan contra todas las simulaciones con operaciones
+vectorizadas (bloques de simulaciones x predicciones). Resultado por
+usuario: probabilidad de terminar primero (con los desempates del ranking)
+y puntaje final esperado.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import WorldCupPrediction
+from . import worldcup_bitset, worldcup_standings
+from .worldcup_bracket import (
+    GROUP_LETTERS, GROUPS, KO_TEMPLATE, R32_TEMPLATE, TEAM_INDEX, TEAM_NAMES,
+    THIRD_SLOT_GROUPS, THIRD_SLOTS,
+)
+from .worldcup_game import (
+    FINAL_NO, PESOS, PREDICTIONS_VERSION, PROJECTIONS_CACHE_KEY,
+    _actual_with_version, _wc_liga_id, stored_winners,
+)
+from . import response_cache
+
+logger = logging.getLogger(__name__)
+
+N_TEAMS = len(TEAM_NAMES)          # equipo i pertenece al grupo i // 4
+BASE_GOALS = 1.35                  # goles esperados por equipo entre iguales
+CELLS_PER_CHUNK = 4_000_000        # simulaciones x predicciones por bloque
+
+# Partidos de eliminatoria en orden de juego (sin el de tercer puesto, que no puntua)
+KO_ORDER = sorted(R32_TEMPLATE) + sorted(n for n, (_h, _a, r) in KO_TEMPLATE.items()
+                                         if r != "Third Place")
+
+# Mascara de 12 bits de los grupos -> grupo asignado a cada slot de tercero
+_ASSIGN_TABLE = np.array([g if g is not None else (-1,) * len(THIRD_SLOTS)
+                          for g in THIRD_SLOT_GROUPS], dtype=np.int64)
+
+# Desempate por nombre (ascendente gana): dentro del grupo y entre terceros
+_GLOBAL_NAME_RANK = np.argsort(np.argsort(np.array(TEAM_NAMES)))
+_LOCAL_NAME_RANK = np.array([
+    sorted(GROUPS[g]).index(name) for g in GROUP_LETTERS for name in GROUPS[g]
+])
+
+
+def _strengths():
+    fuerza = getattr(settings, "WORLDCUP_TEAM_STRENGTH", None) or {}
+    s = np.ones(N_TEAMS)
+    for name, value in fuerza.items():
+        i = TEAM_INDEX.get(name)
+        if i is not None and value > 0:
+            s[i] = float(value)
+    return s
+
+
+def _group_fixtures(estado):
+    """(jugados [(h, a, gl, gv)], pendientes [(h, a)]) con indices de equipo"""
+    jugados, pendientes = [], []
+    for letra, tabla in estado.grupos.items():
+        nombres = {eq_id: (fila["team"] or {}).get("nombre") for eq_id, fila in tabla.filas.items()}
+        for local_id, visit_id, gl, gv in tabla.partidos.values():
+            h = TEAM_INDEX.get(nombres.get(local_id))
+            a = TEAM_INDEX.get(nombres.get(visit_id))
+            if h is None or a is None:
+                logger.warning(f"⚠️  Partido del grupo {letra} con equipo desconocido, se omite")
+                continue
+            if gl is None:
+                pendientes.append((h, a))
+            else:
+                jugados.append((h, a, gl, gv))
+    return jugados, pendientes
+
+
+def _known_ko(actual):
+    """Equipos ya definidos por partido {no: (h|None, a|None)} y ganadores conocidos {no: idx}"""
+    ko = actual["ko_matches"]
+    lados = {}
+    for no, m in ko.items():
+        lados[no] = (TEAM_INDEX.get(m["home"]), TEAM_INDEX.get(m["away"]))
+
+    ganadores = {}
+    for no, m in ko.items():
+        if m["winner"] in TEAM_INDEX:
+            ganadores[no] = TEAM_INDEX[m["winner"]]
+    # Empates definidos por penales: el ganador ya aparece en el partido siguiente
+    for no, (hs, as_, _r) in KO_TEMPLATE.items():
+        for lado, slot in enumerate((hs, as_)):
+            if slot.startswith("W"):
+                fuente = int(slot[1:])
+                equipo = lados.get(no, (None, None))[lado]
+                if fuente not in ganadores and equipo is not None:
+                    ganadores[fuente] = equipo
+    return lados, ganadores
+
+
+def _bit(idx):
+    return np.left_shift(np.uint64(1), idx.astype(np.uint64))
+
+
+def _simulate_chunk(n, rng, strength, base, pendientes, lados, ganadores):
+    """Simula `n` torneos. Devuelve arrays por simulacion en el formato Bits."""
+    pts = np.tile(base["pts"], (n, 1))
+    gf = np.tile(base["gf"], (n, 1))
+    gc = np.tile(base["gc"], (n, 1))
+
+    if pendientes:
+        H = np.array([h for h, _a in pendientes])
+        A = np.array([a for _h, a in pendientes])
+        ratio = np.sqrt(strength[H] / strength[A])
+        goles_h = rng.poisson(BASE_GOALS * ratio, size=(n, len(pendientes)))
+        goles_a = rng.poisson(BASE_GOALS / ratio, size=(n, len(pendientes)))
+        pts_h = np.where(goles_h > goles_a, 3, np.where(goles_h == goles_a, 1, 0))
+        pts_a = np.where(goles_a > goles_h, 3, np.where(goles_h == goles_a, 1, 0))
+        oh_h = np.eye(N_TEAMS, dtype=np.int64)[H]   # (partidos, equipos)
+        oh_a = np.eye(N_TEAMS, dtype=np.int64)[A]
+        pts += pts_h @ oh_h + pts_a @ oh_a
+        gf += goles_h @ oh_h + goles_a @ oh_a
+        gc += goles_a @ oh_h + goles_h @ oh_a
+
+    # Clave de orden: Pts, DIF, GF y luego nombre (cabe en int64)
+    clave = pts * 1_000_000 + (gf - gc + 500) * 1_000 + gf
+    clave_grupo = (clave * 64 + (63 - _LOCAL_NAME_RANK)).reshape(n, len(GROUP_LETTERS), 4)
+    orden = np.argsort(-clave_grupo, axis=2) + 4 * np.arange(len(GROUP_LETTERS))[None, :, None]
+    primeros, segundos, terceros = orden[:, :, 0], orden[:, :, 1], orden[:, :, 2]
+
+    filas = np.arange(n)[:, None]
+    clave_terceros = clave[filas, terceros] * 64 + (63 - _GLOBAL_NAME_RANK[terceros])
+    mejores = np.argsort(-clave_terceros, axis=1)[:, :8]
+    thirds_mask = np.bitwise_or.reduce(np.left_shift(1, mejores), axis=1)
+    asignacion = _ASSIGN_TABLE[thirds_mask]          # (n, slots de tercero) -> grupo
+
+    def equipo_slot(slot):
+        if slot.startswith("3-"):
+            grupo = asignacion[:, THIRD_SLOTS.index(slot)]
+            return terceros[np.arange(n), grupo]
+        if slot.startswith("W"):
+            return winners[int(slot[1:])]
+        pos, g = int(slot[0]), GROUP_LETTERS.index(slot[1])
+        return (primeros if pos == 1 else segundos)[:, g]
+
+    winners = {}
+    for no in KO_ORDER:
+        if no in ganadores:
+            winners[no] = np.full(n, ganadores[no])
+            continue
+        hs, as_ = R32_TEMPLATE[no] if no in R32_TEMPLATE else KO_TEMPLATE[no][:2]
+        conocido_h, conocido_a = lados.get(no, (None, None))
+        h = np.full(n, conocido_h) if conocido_h is not None else equipo_slot(hs)
+        a = np.full(n, conocido_a) if conocido_a is not None else equipo_slot(as_)
+        p_local = strength[h] / (strength[h] + strength[a])
+        winners[no] = np.where(rng.random(n) < p_local, h, a)
+
+    def stage_mask(nos):
+        m = np.zeros(n, dtype=np.uint64)
+        for no in nos:
+            m |= _bit(winners[no])
+        return m
+
+    return worldcup_bitset.Bits(
+        pos1=np.bitwise_or.reduce(_bit(primeros), axis=1),
+        pos2=np.bitwise_or.reduce(_bit(segundos), axis=1),
+        thirds=thirds_mask.astype(np.uint64),
+        r16=stage_mask(worldcup_bitset.R32_NOS),
+        qf=stage_mask(worldcup_bitset.R16_NOS),
+        sf=stage_mask(worldcup_bitset.QF_NOS),
+        final=stage_mask(worldcup_bitset.SF_NOS),
+        champion=winners[FINAL_NO].astype(np.int64),
+    )
+
+
+def _score_chunk(sims, preds, champions_p, pesos):
+    """Matriz (simulaciones x predicciones) de puntaje total, campeon y exactas"""
+    def bc(sim_col, pred_col):
+        return np.bitwise_count(sim_col[:, None] & pred_col[None, :]).astype(np.int64)
+
+    exact = bc(sims.pos1, preds[:, 0]) + bc(sims.pos2, preds[:, 1])
+    in_top2 = bc(sims.pos1 | sims.pos2, preds[:, 0] | preds[:, 1])
+    champion = (champions_p[None, :] >= 0) & (champions_p[None, :] == sims.champion[:, None])
+    total = (pesos.group_exact * exact + pesos.group_qualify * (in_top2 - exact)
+             + pesos.third * bc(sims.thirds, preds[:, 2])
+             + pesos.r16 * bc(sims.r16, preds[:, 3]) + pesos.qf * bc(sims.qf, preds[:, 4])
+             + pesos.sf * bc(sims.sf, preds[:, 5]) + pesos.final * bc(sims.final, preds[:, 6])
+             + pesos.champion * champion)
+    return total, champion, exact
+
+
+def _desempate(preds):
+    """Desempate estatico del ranking (quien completo primero, nombre); mayor = mejor"""
+    far_future = "9999-12-31T00:00:00"
+    orden_estatico = sorted(range(len(preds)), key=lambda i: (
+        preds[i].completed_at.isoformat() if preds[i].completed_at else far_future,
+        preds[i].usuario.nombre_usuario.lower()))
+    desempate = np.empty(len(preds), dtype=np.int64)
+    desempate[orden_estatico] = np.arange(len(preds))[::-1]
+    return desempate
+
+
+def _primeros(total, champion, exact, desempate):
+    """Indice de la prediccion que queda primera en cada simulacion"""
+    # Mismos desempates que el ranking, en una sola clave entera
+    clave = ((total * 2 + champion) * 64 + exact) * len(desempate) + desempate[None, :]
+    return np.argmax(clave, axis=1)
+
+
+def run_simulation(n_sims=None, seed=None):
+    """
+    Corre la simulacion completa y devuelve las proyecciones:
+    {version, predictions_version, n_sims, computed_at, elapsed_ms,
+     by_user: {id_usuario: {"p_first": float, "expected_score": float}}}
+    """
+    inicio = time.perf_counter()
+    n_sims = n_sims or getattr(settings, "WORLDCUP_SIMULATIONS", 10_000)
+    rng = np.random.default_rng(seed)
+
+    version, actual = _actual_with_version()
+    pred_version = response_cache.version(PREDICTIONS_VERSION)
+    liga_id = _wc_liga_id()
+
+    preds = list(WorldCupPrediction.objects.select_related("usuario"))
+    resultado = {
+        "version": version, "predictions_version": pred_version,
+        "n_sims": n_sims, "computed_at": timezone.now().isoformat(),
+        "by_user": {},
+    }
+    if not preds or liga_id is None:
+        resultado["elapsed_ms"] = round((time.perf_counter() - inicio) * 1000)
+        return resultado
+
+    # Predicciones codificadas + desempate estatico (quien completo primero, nombre)
+    bits = [worldcup_bitset.encode_prediction(p.group_order, p.thirds, stored_winners(p))
+            for p in preds]
+    masks = np.array([b[:7] for b in bits], dtype=np.uint64)
+    champions_p = np.array([b.champion for b in bits], dtype=np.int64)
+    desempate = _desempate(preds)
+
+    # Estado real: grupos y eliminatorias ya definidos
+    jugados, pendientes = _group_fixtures(worldcup_standings.estado_liga(liga_id))
+    base = {k: np.zeros(N_TEAMS, dtype=np.int64) for k in ("pts", "gf", "gc")}
+    for h, a, gl, gv in jugados:
+        base["gf"][h] += gl; base["gc"][h] += gv
+        base["gf"][a] += gv; base["gc"][a] += gl
+        base["pts"][h] += 3 if gl > gv else (1 if gl == gv else 0)
+        base["pts"][a] += 3 if gv > gl else (1 if gl == gv else 0)
+    lados, ganadores = _known_ko(actual)
+    strength = _strengths()
+
+    n_preds = len(preds)
+    chunk = max(1, min(n_sims, CELLS_PER_CHUNK // n_preds))
+    primeros = np.zeros(n_preds, dtype=np.int64)
+    suma = np.zeros(n_preds, dtype=np.int64)
+    hechas = 0
+    while hechas < n_sims:
+        n = min(chunk, n_sims - hechas)
+        sims = _simulate_chunk(n, rng, strength, base, pendientes, lados, ganadores)
+        total, champion, exact = _score_chunk(sims, masks, champions_p, PESOS)
+        suma += total.sum(axis=0)
+        primeros += np.bincount(_primeros(total, champion, exact, desempate),
+                                minlength=n_preds)
+        hechas += n
+
+    for i, pred in enumerate(preds):
+        resultado["by_user"][pred.usuario.id_usuario] = {
+            "p_first": round(float(primeros[i]) / n_sims, 4),
+            "expected_score": round(float(suma[i]) / n_sims, 2),
+        }
+    resultado["elapsed_ms"] = round((time.perf_counter() - inicio) * 1000)
+    return resultado
+
+
+def refresh_projections(n_sims=None, force=False):
+    """Corre la simulacion si cambiaron resultados o predicciones y la guarda en cache."""
+    previas = cache.get(PROJECTIONS_CACHE_KEY)
+    if previas and not force:
+        liga_id = _wc_liga_id()
+        version = response_cache.version(liga_id) if liga_id is not None else 0
+        if (previas["version"] == version
+                and previas["predictions_version"] == response_cache.version(PREDICTIONS_VERSION)):
+            return previas, False
+
+    proyecciones = run_simulation(n_sims)
+    cache.set(PROJECTIONS_CACHE_KEY, proyecciones, None)
+    return proyecciones, True
@@ -0,0 +1,239 @@
+"""
+Motor incremental de posiciones por grupo del Mundial 2026.
+
+Una sola implementacion para el tablero (worldcup_views), el scoring del
+juego (worldcup_game.actual_results) y el comando update_worldcup_bracket.
+
+El estado guarda, por grupo, la tabla de cada equipo y el resultado que se
+aplico de cada partido. Re-aplicar un partido (nuevo marcador, cambio de
+estado) revierte su aporte anterior y suma el nuevo: O(1), sin recorrer
+los demas partidos.
+
+El estado vive en la cache de Django junto a la version de datos de la liga
+(ver response_cache). Cuando signals.py guarda un ApiPartido, aplica el
+delta sobre el estado cacheado y lo re-etiqueta con la version nueva; si
+otro proceso cambio la liga en paralelo, la siguiente lectura lo reconstruye
+desde la BD con una sola query.
+
+Criterio de desempate (FIFA simplificado): Pts, diferencia de gol, goles a
+favor, nombre. FIFA tambien usa head-to-head, fair play y ranking; se omiten.
+"""
+from django.core.cache import cache
+
+from .models import ApiPartido, PartidoStatus
+from . import response_cache
+from .worldcup_bracket import GROUPS, THIRD_ASSIGN_BY_MASK, groups_mask
+
+TBD_API_ID = 9049
+MATCHES_PER_GROUP = 6
+CACHE_PREFIX = 'wc_standings:'
+CACHE_TTL = 60 * 60 * 24
+
+
+def _letra_grupo(partido):
+    """'Group A - Matchday 1' -> 'A'; None si no es partido de grupo"""
+    ronda = partido.ronda or ''
+    if not ronda.startswith('Group'):
+        return None
+    letra = ronda[6:7]
+    return letra if letra in GROUPS else None
+
+
+def _team_json(equipo):
+    if equipo is None or equipo.api_id == TBD_API_ID:
+        return None
+    return {
+        'id_equipo': equipo.id_equipo,
+        'nombre': equipo.nombre,
+        'logo': equipo.logo_url,
+    }
+
+
+def sort_key(fila):
+    team = fila['team']
+    return (-fila['pts'], -fila['dif'], -fila['gf'], team['nombre'] if team else '')
+
+
+class TablaGrupo:
+    """Tabla de un grupo con el aporte de cada partido aplicado"""
+
+    def __init__(self):
+        self.filas = {}      # id_equipo -> fila (formato del tablero, sin 'pos')
+        self.partidos = {}   # id_partido -> (id_local, id_visitante, gl | None, gv | None)
+        self.jugados = 0
+
+    @property
+    def completo(self):
+        return self.jugados >= MATCHES_PER_GROUP
+
+    def aplicar(self, partido):
+        previo = self.partidos.get(partido.id_partido)
+        if previo is not None:
+            self._sumar(previo, -1)
+
+        terminado = (partido.estado == PartidoStatus.FINALIZADO
+                     and partido.goles_local is not None
+                     and partido.goles_visitante is not None)
+        registro = (
+            partido.equipo_local_id, partido.equipo_visitante_id,
+            partido.goles_local if terminado else None,
+            partido.goles_visitante if terminado else None,
+        )
+        self.partidos[partido.id_partido] = registro
+
+        for equipo_id, attr in ((registro[0], 'equipo_local'), (registro[1], 'equipo_visitante')):
+            if equipo_id not in self.filas:
+                self.filas[equipo_id] = {
+                    'team': _team_json(getattr(partido, attr)),
+                    'pj': 0, 'g': 0, 'e': 0, 'p': 0,
+                    'gf': 0, 'gc': 0, 'dif': 0, 'pts': 0,
+                }
+        if previo is not None and previo[:2] != registro[:2]:
+            self._podar()
+        self._sumar(registro, 1)
+
+    def quitar(self, id_partido):
+        previo = self.partidos.pop(id_partido, None)
+        if previo is not None:
+            self._sumar(previo, -1)
+            self._podar()
+
+    def _podar(self):
+        """Quita equipos que ya no aparecen en ningun partido del grupo"""
+        vigentes = {eq for reg in self.partidos.values() for eq in reg[:2]}
+        for equipo_id in list(self.filas):
+            if equipo_id not in vigentes:
+                del self.filas[equipo_id]
+
+    def _sumar(self, registro, signo):
+        local_id, visit_id, gl, gv = registro
+        if gl is None:
+            return
+        self.jugados += signo
+        h, a = self.filas[local_id], self.filas[visit_id]
+        h['pj'] += signo; a['pj'] += signo
+        h['gf'] += signo * gl; h['gc'] += signo * gv
+        a['gf'] += signo * gv; a['gc'] += signo * gl
+        h['dif'] = h['gf'] - h['gc']
+        a['dif'] = a['gf'] - a['gc']
+        if gl > gv:
+            h['g'] += signo; h['pts'] += 3 * signo; a['p'] += signo
+        elif gl < gv:
+            a['g'] += signo; a['pts'] += 3 * signo; h['p'] += signo
+        else:
+            h['e'] += signo; a['e'] += signo
+            h['pts'] += signo; a['pts'] += signo
+
+    def ordenada(self):
+        """Copias de las filas ordenadas, con 'pos' (1..n)"""
+        filas = sorted(self.filas.values(), key=sort_key)
+        return [dict(fila, pos=i + 1) for i, fila in enumerate(filas)]
+
+
+class EstadoGrupos:
+    """Posiciones de los 12 grupos"""
+
+    def __init__(self):
+        self.grupos = {letra: TablaGrupo() for letra in GROUPS}
+        self.partido_grupo = {}   # id_partido -> letra
+
+    def aplicar(self, partido):
+        letra = _letra_grupo(partido)
+        anterior = self.partido_grupo.get(partido.id_partido)
+        if anterior is not None and anterior != letra:
+            self.grupos[anterior].quitar(partido.id_partido)
+            del self.partido_grupo[partido.id_partido]
+        if letra is None:
+            return
+        self.partido_grupo[partido.id_partido] = letra
+        self.grupos[letra].aplicar(partido)
+
+    def quitar(self, id_partido):
+        letra = self.partido_grupo.pop(id_partido, None)
+        if letra is not None:
+            self.grupos[letra].quitar(id_partido)
+
+    # ── Lecturas ─────────────────────────────────────────────────────────
+
+    def tablas(self):
+        """{letra: [filas ordenadas]}"""
+        return {letra: tabla.ordenada() for letra, tabla in self.grupos.items()}
+
+    def completo(self, letra):
+        return self.grupos[letra].completo
+
+    @property
+    def todos_completos(self):
+        return all(tabla.completo for tabla in self.grupos.values())
+
+    @property
+    def hay_resultados(self):
+        return any(tabla.jugados > 0 for tabla in self.grupos.values())
+
+    def terceros(self, tablas=None):
+        """Terceros de cada grupo ordenados con el mismo criterio (con 'group')"""
+        tablas = tablas or self.tablas()
+        filas = [dict(filas[2], group=letra)
+                 for letra, filas in sorted(tablas.items()) if len(filas) >= 3]
+        filas.sort(key=sort_key)
+        return filas
+
+    def asignacion_terceros(self, terceros=None):
+        """
+        (mascara de grupos, {slot '3-ABCDF': grupo}) segun la tabla FIFA para
+        los 8 mejores terceros actuales. (0, {}) si aun no hay 8 terceros.
+        """
+        terceros = terceros if terceros is not None else self.terceros()
+        mejores = terceros[:8]
+        if len(mejores) < 8:
+            return 0, {}
+        mask = groups_mask(t['group'] for t in mejores)
+        return mask, THIRD_ASSIGN_BY_MASK[mask] or {}
+
+
+def _cache_key(liga_id):
+    return f'{CACHE_PREFIX}{liga_id}'
+
+
+def construir(liga_id):
+    """Estado completo desde la BD (1 query)"""
+    estado = EstadoGrupos()
+    partidos = (
+        ApiPartido.objects.filter(id_liga_id=liga_id, ronda__startswith='Group')
+        .select_related('equipo_local', 'equipo_visitante')
+    )
+    for partido in partidos:
+        estado.aplicar(partido)
+    return estado
+
+
+def estado_liga(liga_id):
+    """Estado de posiciones vigente para la version actual de datos de la liga"""
+    version = response_cache.version(liga_id)
+    entrada = cache.get(_cache_key(liga_id))
+    if entrada is not None and entrada[0] == version:
+        return entrada[1]
+    estado = construir(liga_id)
+    cache.set(_cache_key(liga_id), (version, estado), CACHE_TTL)
+    return estado
+
+
+def aplicar_cambio(partido, version_nueva, borrado=False):
+    """
+    Aplica el cambio de un partido al estado cacheado (si existe) y lo deja
+    etiquetado con `version_nueva`. Solo se aplica si el estado corresponde
+    exactamente a la version anterior; si no, se deja que la proxima lectura
+    lo reconstruya.
+    """
+    if version_nueva is None:
+        return
+    clave = _cache_key(partido.id_liga_id)
+    entrada = cache.get(clave)
+    if entrada is None or entrada[0] != version_nueva - 1:
+        return
+    estado = entrada[1]
+    if borrado:
+        estado.quitar(partido.id_partido)
+    else:
+        estado.aplicar(partido)
+    cache.set(clave, (version_nueva, estado), CACHE_TTL)
@@ -5,7 +5,9 @@ de eliminatorias con resolucion automatica de cruces.
 GET /api/worldcup/board?liga=<id_liga>
 
 Los resultados se cargan a la BD con scripts manuales; este endpoint solo
-LEE ApiPartido y calcula todo al vuelo (no escribe nada).
+LEE ApiPartido (no escribe nada). Las posiciones de grupo salen del motor
+incremental de worldcup_standings y la respuesta se cachea por version de
+datos de la liga.
 
 Resolucion de slots del bracket:
 - Si el partido eliminatorio ya tiene equipos reales en la BD (no TBD),
@@ -16,18 +18,19 @@ Resolucion de slots del bracket:
 - 'W73' -> ganador del partido 73 (si esta finalizado en BD), 'RU101' ->
   perdedor del partido 101.
 """
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 
 from .models import ApiPartido, ApiLiga, PartidoStatus
+from .renderers import ORJSONRenderer
+from . import response_cache, worldcup_standings
 from .worldcup_bracket import (
-    FIXTURE_ID_BASE, GROUPS, R32_TEMPLATE, KO_TEMPLATE, THIRD_ASSIGN,
+    FIXTURE_ID_BASE, GROUPS, R32_TEMPLATE, KO_TEMPLATE,
 )
 
 TBD_API_ID = 9049
-MATCHES_PER_GROUP = 6
 
 
 def _team_json(equipo):
@@ -40,22 +43,9 @@ def _team_json(equipo):
     }
 
 
-def _blank_row(equipo):
-    return {
-        "team": _team_json(equipo),
-        "pj": 0, "g": 0, "e": 0, "p": 0,
-        "gf": 0, "gc": 0, "dif": 0, "pts": 0,
-    }
-
-
-def _standings_sort_key(row):
-    # Criterio FIFA simplificado: Pts, diferencia de gol, goles a favor.
-    # (FIFA tambien usa head-to-head, fair play y ranking; se omiten.)
-    return (-row["pts"], -row["dif"], -row["gf"], row["team"]["nombre"])
-
-
 @api_view(["GET"])
 @permission_classes([AllowAny])
+@renderer_classes([ORJSONRenderer])
 def worldcup_board(request):
     liga_id = request.query_params.get("liga")
     liga = None
@@ -67,81 +57,40 @@ def worldcup_board(request):
         return Response({"error": "Liga del Mundial no encontrada"},
                         status=status.HTTP_404_NOT_FOUND)
 
+    # Cache versionada: se reconstruye solo cuando cambia un partido de la liga
+    clave = response_cache.response_key(
+        "worldcup_board", liga.id_liga, response_cache.version(liga.id_liga))
+    return Response(response_cache.cached(clave, lambda: _board_payload(liga)))
+
+
+def _board_payload(liga):
+    # Solo eliminatorias: las posiciones de grupo salen del motor incremental
     partidos = list(
         ApiPartido.objects.filter(id_liga=liga)
+        .exclude(ronda__startswith="Group")
         .select_related("equipo_local", "equipo_visitante", "id_venue")
         .order_by("api_fixture_id")
     )
+    estado = worldcup_standings.estado_liga(liga.id_liga)
 
     # ── 1. Posiciones por grupo ──────────────────────────────────────────
-    # Grupo de cada equipo segun el fixture oficial (por nombre en BD)
-    team_group = {}
-    for letter, names in GROUPS.items():
-        for n in names:
-            team_group[n] = letter
-
-    tables = {letter: {} for letter in GROUPS}   # letter -> {id_equipo: row}
-    finished_count = {letter: 0 for letter in GROUPS}
-
-    group_matches = [p for p in partidos if (p.ronda or "").startswith("Group")]
-    for p in group_matches:
-        letter = (p.ronda or "")[6:7]  # "Group A - Matchday 1" -> "A"
-        if letter not in tables:
-            continue
-        for eq in (p.equipo_local, p.equipo_visitante):
-            if eq.id_equipo not in tables[letter]:
-                tables[letter][eq.id_equipo] = _blank_row(eq)
-        if p.estado != PartidoStatus.FINALIZADO or p.goles_local is None:
-            continue
-        finished_count[letter] += 1
-        home = tables[letter][p.equipo_local.id_equipo]
-        away = tables[letter][p.equipo_visitante.id_equipo]
-        gl, gv = p.goles_local, p.goles_visitante
-        home["pj"] += 1; away["pj"] += 1
-        home["gf"] += gl; home["gc"] += gv
-        away["gf"] += gv; away["gc"] += gl
-        if gl > gv:
-            home["g"] += 1; home["pts"] += 3; away["p"] += 1
-        elif gl < gv:
-            away["g"] += 1; away["pts"] += 3; home["p"] += 1
-        else:
-            home["e"] += 1; away["e"] += 1
-            home["pts"] += 1; away["pts"] += 1
-
+    sorted_tables = estado.tablas()    # letter -> [rows ordenadas]
     groups_json = []
-    sorted_tables = {}    # letter -> [rows ordenadas]
     for letter in sorted(GROUPS.keys()):
-        rows = list(tables[letter].values())
-        for r in rows:
-            r["dif"] = r["gf"] - r["gc"]
-        rows.sort(key=_standings_sort_key)
-        for i, r in enumerate(rows):
-            r["pos"] = i + 1
-        sorted_tables[letter] = rows
+        tabla = estado.grupos[letter]
         groups_json.append({
             "group": letter,
-            "complete": finished_count[letter] >= MATCHES_PER_GROUP,
-            "played": finished_count[letter],
-            "standings": rows,
+            "complete": tabla.completo,
+            "played": tabla.jugados,
+            "standings": sorted_tables[letter],
         })
 
     all_groups_complete = all(g["complete"] for g in groups_json)
-    any_results = any(finished_count[l] > 0 for l in GROUPS)
+    any_results = estado.hay_resultados
 
     # ── 2. Ranking de terceros y asignacion FIFA ─────────────────────────
-    thirds = []
-    for letter, rows in sorted_tables.items():
-        if len(rows) >= 3:
-            t = dict(rows[2])
-            t["group"] = letter
-            thirds.append(t)
-    thirds.sort(key=lambda r: (-r["pts"], -r["dif"], -r["gf"],
-                               r["team"]["nombre"] if r["team"] else ""))
-    best_thirds = thirds[:8]
-    third_slot_map = {}   # '3-ABCDF' -> grupo del tercero asignado
-    if len(best_thirds) == 8:
-        combo = "".join(sorted(t["group"] for t in best_thirds))
-        third_slot_map = THIRD_ASSIGN.get(combo, {})
+    thirds = estado.terceros(sorted_tables)
+    _mask, third_slot_map = estado.asignacion_terceros(thirds)   # '3-ABCDF' -> grupo
 
     def resolve_group_slot(slot):
         """'1A' / '2B' / '3-ABCDF' -> (team_json | None)"""
@@ -220,7 +169,7 @@ def worldcup_board(request):
               for n, (h, a, r) in sorted(KO_TEMPLATE.items()) if r == ronda]
         knockout.append({"ronda": ronda, "matches": ms})
 
-    return Response({
+    return {
         "liga": {"id_liga": liga.id_liga, "nombre": liga.nombre,
                  "logo_url": liga.logo_url},
         "all_groups_complete": all_groups_complete,
@@ -231,4 +180,4 @@ def worldcup_board(request):
         "nota": ("Posiciones: Pts, DIF, GF (criterio FIFA simplificado). "
                  "Cruces marcados como proyeccion hasta que la BD tenga "
                  "los equipos reales."),
-    })
+    }
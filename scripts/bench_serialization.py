@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Benchmark de serializacion para el endpoint de proximos partidos.
+
+Compara el camino anterior (ApiPartidoSerializer + JSONRenderer de DRF)
+contra el camino rapido (partido_dict + ORJSONRenderer) usando instancias
+en memoria, sin tocar la base de datos.
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+
+import django
+
+# Setup Django
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bet_project.settings')
+django.setup()
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from bets.models import ApiEquipo, ApiLiga, ApiPartido, ApiVenue, PartidoStatus
+from bets.renderers import ORJSONRenderer, orjson
+from bets.serializers import ApiPartidoSerializer, partido_dict
+
+FILAS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+REPETICIONES = 5
+
+
+def construir_partidos(n):
+    """Partidos sin guardar con sus relaciones ya resueltas (como select_related)"""
+    liga = ApiLiga(id_liga=1, nombre='LaLiga', logo_url='https://img.example/laliga.png')
+    venue = ApiVenue(id_venue=1, nombre='Estadio', ciudad='Madrid')
+    ahora = timezone.now()
+    partidos = []
+    for i in range(n):
+        local = ApiEquipo(
+            id_equipo=2 * i + 1, nombre=f'Local {i}',
+            logo_url=f'https://api.sofascore.app/api/v1/team/{2 * i + 1}/image',
+        )
+        visitante = ApiEquipo(
+            id_equipo=2 * i + 2, nombre=f'Visitante {i}',
+            logo_url='https://media.api-sports.io/football/teams/1.png',
+        )
+        partidos.append(ApiPartido(
+            id_partido=i + 1, api_fixture_id=100000 + i, temporada='2025',
+            fecha=ahora + timedelta(hours=i), ronda='Round 1',
+            estado=PartidoStatus.PROGRAMADO, id_liga=liga, id_venue=venue,
+            equipo_local=local, equipo_visitante=visitante,
+            ultima_actualizacion=ahora,
+        ))
+    return partidos
+
+
+def medir(fn):
+    """Mejor tiempo de REPETICIONES corridas, en milisegundos"""
+    mejor = None
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        fn()
+        transcurrido = (time.perf_counter() - inicio) * 1000
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor
+
+
+partidos = construir_partidos(FILAS)
+
+antes = medir(lambda: JSONRenderer().render(ApiPartidoSerializer(partidos, many=True).data))
+despues = medir(lambda: ORJSONRenderer().render([partido_dict(p) for p in partidos]))
+
+print("\n" + "="*80)
+print(f"📊 SERIALIZACION DE {FILAS} PARTIDOS (mejor de {REPETICIONES})")
+print("="*80 + "\n")
+print(f"   orjson disponible: {'sí' if orjson is not None else 'no (usa fallback de DRF)'}")
+print(f"   Antes  (DRF serializer + JSONRenderer): {antes:8.2f} ms  ({antes * 1000 / FILAS:.2f} ms/1k filas)")
+print(f"   Despues (partido_dict + ORJSONRenderer): {despues:8.2f} ms  ({despues * 1000 / FILAS:.2f} ms/1k filas)")
+print(f"   Mejora: {antes / despues:.1f}x")
+print("\n" + "="*80 + "\n")